@@ -0,0 +1,116 @@
+"""Benchmark of the index page parsing, full BeautifulSoup tree against the streaming
+span.ticker extractor, reporting the parse time and the peak memory of each one
+
+Usage:
+    python -m benchmarks.bench_index_parser [-n ITERATIONS] [-s TICKERS] [PAGE ...]
+
+Without pages the saved tests/example_brx100.txt is used, -s adds a synthetic page
+with the layout of the status invest index pages and the number of tickers informed.
+"""
+from __future__ import absolute_import
+
+import argparse
+import os
+import sys
+import timeit
+import tracemalloc
+from typing import Callable, List
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from magic_formula.status_invest import STREAM_CHUNK_SIZE
+from magic_formula.status_invest import extract_tickers
+
+
+SAVED_PAGE = os.path.join(os.path.dirname(__file__), '../tests/example_brx100.txt')
+ROW_TEMPLATE = '''<div role="row" class="item  d-flex justify-between align-items-center ">
+<div role="cell" title="N&#xBA; de refer&#xEA;ncia" class="position"><span>{position}</span></div>
+<a role="cell" title="Nome da empresa" class="company w-40 pl-1  pb-1 pt-1 waves-effect waves-on-white-bg" href="/acoes/{ticker_lower}">
+<div class="d-flex justify-between align-items-center"><div class="">
+<div class="avatar" style="background-image:url(https://cdn-statusinvest.azureedge.net/img/company/avatar/{position}.jpg)"></div>
+</div>
+<span class="ticker">{ticker}</span>
+<div class="w-100">COMPANY {position} S.A.</div>
+</div>
+</a>
+<a role="cell" title="Setor da empresa" class="d-block w-30 pb-1 pt-1 text-main waves-effect waves-on-white-bg  pl-1" href="/acoes/setor/4/financeiro/28/servicos">
+Servi&#xE7;os Financeiros Diversos
+</a>
+<div role="cell" title="Quantidade te&#xF3;rica do ativo dentro do &#xED;ndice" class="quantity w-15 text-right pr-2">6.119.434.194 </div>
+<div role="cell" title="Participa&#xE7;&#xE3;o em porcentagem do ativo dentro do &#xED;ndice" class="percentual w-15 text-right "><strong class="fw-700">1,000%</strong></div>
+</div>
+'''
+
+
+def build_synthetic_page(number_of_tickers: int) -> bytes:
+    """Returns an index page with the layout of status invest and the number of tickers"""
+    return build_index_page([f'TK{position:04d}3' for position in range(number_of_tickers)])
+
+
+def build_index_page(tickers: List[str]) -> bytes:
+    """Returns an index page with the layout of status invest listing the tickers"""
+    rows = ''.join(ROW_TEMPLATE.format(position=position, ticker=ticker,
+                                       ticker_lower=ticker.lower())
+                   for position, ticker in enumerate(tickers))
+    return (f'<!DOCTYPE html><html lang="pt-br"><head><title>Index</title></head>'
+            f'<body>{rows}</body></html>').encode()
+
+
+def parse_beautiful_soup(content: bytes) -> set:
+    """Parses the page building the whole tree, as get_ibrx_info used to do"""
+    import bs4  # pylint: disable=import-outside-toplevel
+    beatiful_soup = bs4.BeautifulSoup(content, "html.parser")
+    return set([x.text for x in list(beatiful_soup.find_all("span", {"class": "ticker"}))])
+
+
+def parse_streaming(content: bytes) -> set:
+    """Parses the page in chunks with the streaming extractor"""
+    return set(extract_tickers(content[position:position + STREAM_CHUNK_SIZE]
+                               for position in range(0, len(content), STREAM_CHUNK_SIZE)))
+
+
+def measure_peak_memory(function: Callable, content: bytes) -> int:
+    """Returns the peak of memory allocated by one call of the function"""
+    tracemalloc.start()
+    try:
+        function(content)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main(args: list = sys.argv[1:]) -> None:
+    """Prints the parse time and the peak memory of each parser on each page"""
+    parser = argparse.ArgumentParser(description='Index page parsing benchmark.')
+    parser.add_argument('pages', nargs='*', help='Saved index pages')
+    parser.add_argument('-n', '--iterations', type=int, default=20)
+    parser.add_argument('-s', '--synthetic', type=int, default=0,
+                        help='Number of tickers of a synthetic page')
+    options = parser.parse_args(args)
+
+    pages = {}
+    for page in options.pages or [SAVED_PAGE]:
+        with open(page, 'rb') as file:
+            pages[os.path.basename(page)] = file.read()
+    if options.synthetic:
+        pages[f'synthetic {options.synthetic} tickers'] = build_synthetic_page(options.synthetic)
+
+    parsers = (('BeautifulSoup', parse_beautiful_soup), ('streaming', parse_streaming))
+    for name, content in pages.items():
+        print(f'{name} ({len(content) / 1024:.1f} KiB)')
+        expected = None
+        for parser_name, function in parsers:
+            tickers = function(content)
+            if expected is not None and tickers != expected:
+                raise AssertionError(f'{parser_name} returned different tickers')
+            expected = tickers
+
+            best = min(timeit.repeat(lambda: function(content),
+                                     number=options.iterations, repeat=5))
+            peak = measure_peak_memory(function, content)
+            print(f'  {parser_name}: {best / options.iterations * 1e3:.2f} ms, '
+                  f'peak {peak / 1024:.1f} KiB, {len(tickers)} tickers')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+"""Offline benchmark suite of the magic formula pipeline over synthetic universes, it
+covers TickerInfoBuilder.build, process_tickers, sort_dataframe,
+export_dataframe_formating and export_file, reporting the throughput, the latency
+percentiles and the peak memory of each stage. Nothing is fetched, process_tickers
+reads every ticker from a sqlite cache filled with the universe
+
+Usage:
+    python -m benchmarks.bench_suite [-s SIZES ...] [-r REPEAT] [-x EXECUTOR]
+                                     [--save-baseline] [--compare] [-b FILE]
+
+--save-baseline stores the results on the baseline file and --compare prints the
+change of each result against it, exiting with 1 when a p50 latency grows more than
+--threshold times. The baseline.json kept on the repository has the results of the
+pipeline before the optimizations, measured by this suite over the same universes.
+"""
+from __future__ import absolute_import
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict
+from dataclasses import dataclass
+from typing import Callable, Dict, List
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from benchmarks.universe import Universe
+from benchmarks.universe import build_universe
+from magic_formula import main as green
+from magic_formula.cache import SQLiteCacheBackend
+from magic_formula.core import TickerInfoBuilder
+
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+DEFAULT_SIZES = [100, 1000, 10000]
+DEFAULT_REPEAT = 5
+REGRESSION_THRESHOLD = 1.25
+EXPORT_FORMATS = ('JSON', 'EXCEL')
+
+
+@dataclass
+class BenchmarkResult:
+    """Result of one stage over one universe, latencies in seconds and memory in bytes"""
+    name: str
+    size: int
+    items: int
+    throughput: float
+    p50: float
+    p95: float
+    p99: float
+    peak_memory: int
+
+    @property
+    def key(self) -> str:
+        """Key of the result on the baseline file"""
+        return f'{self.name}[{self.size}]'
+
+
+def get_logger() -> logging.Logger:
+    """Returns a logger that discards the pipeline messages"""
+    logger = logging.getLogger('benchmarks')
+    logger.setLevel(logging.ERROR)
+    logger.propagate = False
+    if not logger.handlers:
+        logger.addHandler(logging.NullHandler())
+
+    return logger
+
+
+def measure(name: str, size: int, items: int, function: Callable, repeat: int,
+            setup: Callable = tuple) -> BenchmarkResult:
+    """Measures the function repeat times, the arguments returned by setup are prepared
+    outside of the timing, and once more under tracemalloc for the peak memory
+
+    :param name: Name of the stage
+    :type name: str
+    :param size: Number of tickers of the universe
+    :type size: int
+    :param items: Number of items handled by each call, used on the throughput
+    :type items: int
+    :param function: Function measured
+    :type function: Callable
+    :param repeat: Number of timed calls
+    :type repeat: int
+    :param setup: Function that returns the arguments of each call, defaults to tuple
+    :type setup: Callable, optional
+    :return: Result of the stage
+    :rtype: BenchmarkResult
+    """
+    latencies = []
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        function(*args)
+        latencies.append(time.perf_counter() - start)
+
+    return build_result(name, size, items, latencies, float(np.median(latencies)),
+                        measure_peak_memory(function, setup()))
+
+
+def measure_per_item(name: str, size: int, calls: List[Callable],
+                     repeat: int) -> BenchmarkResult:
+    """Measures each call individually, the percentiles are of the latency by item and
+    the throughput of the median pass over all the calls
+
+    :param name: Name of the stage
+    :type name: str
+    :param size: Number of tickers of the universe
+    :type size: int
+    :param calls: One call by item
+    :type calls: List[Callable]
+    :param repeat: Number of passes over the calls
+    :type repeat: int
+    :return: Result of the stage
+    :rtype: BenchmarkResult
+    """
+    latencies = []
+    passes = []
+    for _ in range(repeat):
+        pass_start = time.perf_counter()
+        for call in calls:
+            start = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - start)
+        passes.append(time.perf_counter() - pass_start)
+
+    peak_memory = measure_peak_memory(lambda: [call() for call in calls], ())
+    return build_result(name, size, len(calls), latencies, float(np.median(passes)),
+                        peak_memory)
+
+
+def measure_peak_memory(function: Callable, args: tuple) -> int:
+    """Returns the peak of memory allocated by one call of the function"""
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def build_result(name: str, size: int, items: int, latencies: List[float],
+                 duration: float, peak_memory: int) -> BenchmarkResult:
+    """Builds the result from the latencies observed"""
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return BenchmarkResult(name=name, size=size, items=items,
+                           throughput=items / duration if duration else float('inf'),
+                           p50=float(p50), p95=float(p95), p99=float(p99),
+                           peak_memory=peak_memory)
+
+
+def run_universe(universe: Universe, repeat: int, executor: str,
+                 folder: str) -> List[BenchmarkResult]:
+    """Runs every stage over one universe, the cache and the exported files are
+    written on folder
+
+    :param universe: Synthetic universe
+    :type universe: Universe
+    :param repeat: Number of timed calls of each stage
+    :type repeat: int
+    :param executor: Executor of process_tickers [THREAD, PROCESS]
+    :type executor: str
+    :param folder: Working folder of the run
+    :type folder: str
+    :return: List with the result of each stage
+    :rtype: List[BenchmarkResult]
+    """
+    logger = get_logger()
+    size = len(universe.tickers)
+    results = [measure_per_item(
+        'TickerInfoBuilder.build', size,
+        [TickerInfoBuilder(ticker, symbol, logger).build
+         for symbol, ticker in universe.tickers.items()], repeat)]
+
+    cache = SQLiteCacheBackend(os.path.join(folder, 'cache', 'fundamentals.db'))
+    cache.set_many(universe.tickers)
+    cache.close()
+
+    options = green.get_arguments(['-x', executor, '-cb', 'SQLITE'])
+    results.append(measure(
+        f'process_tickers[{executor}]', size, size,
+        lambda: green.process_tickers(universe.stock_tickers, universe.screener,
+                                      logger, options), repeat))
+
+    tickers_df = green.process_tickers(universe.stock_tickers, universe.screener,
+                                       logger, options)
+    results.append(measure(
+        'sort_dataframe', size, len(tickers_df),
+        lambda data_frame: green.sort_dataframe(data_frame, logger, False), repeat,
+        setup=lambda: (tickers_df.copy(),)))
+
+    sorted_df = green.sort_dataframe(tickers_df.copy(), logger, False)
+    results.append(measure(
+        'export_dataframe_formating', size, len(sorted_df),
+        lambda: green.export_dataframe_formating(sorted_df, logger, 0, ['BENCH']), repeat))
+
+    export_df = green.export_dataframe_formating(sorted_df, logger, 0, ['BENCH'])
+    for export_format in EXPORT_FORMATS:
+        results.append(measure(
+            f'export_file[{export_format}]', size, len(export_df),
+            lambda export_format=export_format: green.export_file(
+                export_format, export_df, ['BENCH'], logger, 0), repeat))
+
+    return results
+
+
+def run(sizes: List[int], repeat: int, executor: str = 'THREAD',
+        seed: int = 42) -> List[BenchmarkResult]:
+    """Runs the suite over a universe of each size, inside a temporary working folder
+    so the cache and the output folder of the user are not touched
+
+    :param sizes: Number of tickers of each universe
+    :type sizes: List[int]
+    :param repeat: Number of timed calls of each stage
+    :type repeat: int
+    :param executor: Executor of process_tickers [THREAD, PROCESS], defaults to THREAD
+    :type executor: str, optional
+    :param seed: Seed of the universes, defaults to 42
+    :type seed: int, optional
+    :return: List with the results
+    :rtype: List[BenchmarkResult]
+    """
+    current_folder = os.getcwd()
+    output_path = green.OUTPUT_PATH
+    results = []
+    try:
+        for size in sizes:
+            with tempfile.TemporaryDirectory() as folder:
+                os.chdir(folder)
+                green.OUTPUT_PATH = folder
+                results.extend(run_universe(build_universe(size, seed), repeat,
+                                            executor, folder))
+                os.chdir(current_folder)
+    finally:
+        os.chdir(current_folder)
+        green.OUTPUT_PATH = output_path
+
+    return results
+
+
+def load_baseline(file_name: str) -> Dict[str, dict]:
+    """Loads the results of the baseline file by key, empty when there is no file"""
+    if not os.path.exists(file_name):
+        return {}
+
+    with open(file_name, 'r') as file:
+        return json.load(file)['results']
+
+
+def save_baseline(results: List[BenchmarkResult], file_name: str) -> None:
+    """Stores the results on the baseline file with the environment of the run"""
+    baseline = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'results': {result.key: asdict(result) for result in results},
+    }
+    with open(file_name, 'w') as file:
+        json.dump(baseline, file, indent=2)
+
+
+def compare(results: List[BenchmarkResult], baseline: Dict[str, dict],
+            threshold: float = REGRESSION_THRESHOLD) -> List[str]:
+    """Returns the keys of the results whose p50 latency grew more than threshold times
+    the baseline one
+
+    :param results: Results of the run
+    :type results: List[BenchmarkResult]
+    :param baseline: Results of the baseline by key
+    :type baseline: Dict[str, dict]
+    :param threshold: Maximum ratio against the baseline, defaults to 1.25
+    :type threshold: float, optional
+    :return: List with the regressions
+    :rtype: List[str]
+    """
+    return [result.key for result in results
+            if result.key in baseline and baseline[result.key]['p50'] > 0
+            and result.p50 / baseline[result.key]['p50'] > threshold]
+
+
+def print_results(results: List[BenchmarkResult], baseline: Dict[str, dict] = None) -> None:
+    """Prints the results table, with the p50 change against the baseline when informed"""
+    print(f'{"stage":<34}{"size":>7}{"items/s":>13}{"p50 ms":>11}{"p95 ms":>11}'
+          f'{"p99 ms":>11}{"peak MiB":>10}{"vs base":>9}')
+    for result in results:
+        change = ''
+        if baseline and result.key in baseline and baseline[result.key]['p50'] > 0:
+            change = f'{result.p50 / baseline[result.key]["p50"] - 1:+.0%}'
+
+        print(f'{result.name:<34}{result.size:>7}{result.throughput:>13,.0f}'
+              f'{result.p50 * 1e3:>11.3f}{result.p95 * 1e3:>11.3f}{result.p99 * 1e3:>11.3f}'
+              f'{result.peak_memory / 2 ** 20:>10.1f}{change:>9}')
+
+
+def main(args: list = sys.argv[1:]) -> None:
+    """Runs the suite and prints, stores or compares the results"""
+    parser = argparse.ArgumentParser(description='Offline benchmark suite.')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Number of tickers of each synthetic universe')
+    parser.add_argument('-r', '--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('-x', '--executor', type=str.upper, default='THREAD',
+                        help='Executor of process_tickers [THREAD, PROCESS]')
+    parser.add_argument('-b', '--baseline', default=BASELINE_FILE, help='Baseline file')
+    parser.add_argument('--save-baseline', action='store_true', default=False)
+    parser.add_argument('--compare', action='store_true', default=False)
+    parser.add_argument('-t', '--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='Maximum p50 ratio against the baseline on --compare')
+    options = parser.parse_args(args)
+
+    results = run(options.sizes, options.repeat, options.executor)
+    baseline = load_baseline(options.baseline)
+    print_results(results, baseline)
+
+    if options.save_baseline:
+        save_baseline(results, options.baseline)
+        print(f'Baseline stored on {options.baseline}')
+
+    if options.compare:
+        regressions = compare(results, baseline, options.threshold)
+        if regressions:
+            print(f'Regressions above {options.threshold}x: {", ".join(regressions)}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Micro-benchmark of TickerInfoBuilder.build over the recorded WEGE3.SA fixtures, against
+the previous build that resolved the yahoo modules again on every getter
+
+Usage:
+    python -m benchmarks.bench_ticker_info_builder [-n ITERATIONS]
+"""
+from __future__ import absolute_import
+
+import argparse
+import logging
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from magic_formula.core import RecomenationTrend
+from magic_formula.core import TickerInfo
+from magic_formula.core import TickerInfoBuilder
+from tests.ticker_fixtures import FIXTURE_SYMBOL
+from tests.ticker_fixtures import load_fixture_ticker
+
+
+class ExtractionOnlyBuilder(TickerInfoBuilder):
+    """Builder without the recommendation trend sum, to measure only the dict extraction"""
+    def get_recomendation_trend(self) -> RecomenationTrend:
+        return RecomenationTrend(0, 0)
+
+
+class PerGetterBuilder(TickerInfoBuilder):
+    """Builder that fills each field through its own getter, resolving the yahoo modules
+    again on every call, as TickerInfoBuilder.build used to do"""
+    def build(self) -> TickerInfo:
+        # the modules were kept on the TickerInfo by the previous build
+        for getter in (self.get_asset_profile, self.get_financial_data,
+                       self.get_ticker_price, self.get_summary_detail,
+                       self.get_balance_sheet, self.get_key_statistics):
+            getter()
+
+        return TickerInfo(
+            all_modules_found=self.valid_all_modules(),
+            industry=self.get_industry(),
+            ebit=self.get_ebit(),
+            recommendation_trend=self.get_recomendation_trend(),
+            market_cap=self.get_market_cap(),
+            total_cash=self.get_total_cash(),
+            dividend_yield=self.get_dividend_yield(),
+            current_price=self.get_current_price(),
+            long_name=self.get_long_name(),
+            short_name=self.get_short_name(),
+            regular_market_time=self.get_regular_market_time(),
+            shares_outstanding=self.get_shares_outstanding(),
+            total_stockholder_equity=self.get_total_stockholder_equity(),
+            total_debt=self.get_total_debt(),
+            raw_modules=None
+        )
+
+
+def main(args: list = sys.argv[1:]) -> None:
+    """Prints the cost per ticker of TickerInfoBuilder.build, of the previous per-getter
+    build, of the dict extraction alone and of the recommendation trend sum"""
+    parser = argparse.ArgumentParser(description='TickerInfoBuilder micro-benchmark.')
+    parser.add_argument('-n', '--iterations', type=int, default=2000)
+    options = parser.parse_args(args)
+
+    ticker = load_fixture_ticker()
+    logger = logging.getLogger(__name__)
+    builder = TickerInfoBuilder(ticker, FIXTURE_SYMBOL, logger)
+    per_getter_builder = PerGetterBuilder(ticker, FIXTURE_SYMBOL, logger)
+    extraction_builder = ExtractionOnlyBuilder(ticker, FIXTURE_SYMBOL, logger)
+
+    for name, function in (('TickerInfoBuilder.build', builder.build),
+                           ('per-getter build', per_getter_builder.build),
+                           ('extraction only', extraction_builder.build),
+                           ('get_recomendation_trend', builder.get_recomendation_trend)):
+        timings = timeit.repeat(function, number=options.iterations, repeat=5)
+        best = min(timings) / options.iterations
+        print(f'{name}: {best * 1e6:.1f} us per ticker (best of 5 x {options.iterations})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+"""Local replay server standing in for status invest and yahoo, it serves the index
+pages, the screener pages and the quoteSummary responses of a synthetic universe built
+from the recorded WEGE3.SA modules, with configurable latency, jitter, error rate and
+throttling, so the whole pipeline can be load tested without reaching the real sites
+
+Usage:
+    python -m benchmarks.replay_server [-n TICKERS] [-is INDEX_SIZE] [-p PORT]
+                                       [-l LATENCY] [-j JITTER] [-e ERROR_RATE]
+                                       [-r RATE_LIMIT] [-w CONFIG_FILE]
+
+The config file written by -w redirects every url of config.CONFIG and the yahoo api to
+the server, run the pipeline with it from another working folder, so the cache of the
+real data is not used:
+    python -m magic_formula.main -c CONFIG_FILE -i ALL
+"""
+from __future__ import absolute_import
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Dict, List, Union
+from urllib.parse import parse_qsl, unquote, urlsplit, urlunsplit
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from benchmarks.bench_index_parser import build_index_page
+from benchmarks.universe import Universe
+from benchmarks.universe import build_universe
+from magic_formula.config import CONFIG
+
+
+CRUMB_PATH = '/v1/test/getcrumb'
+QUOTE_SUMMARY_PATH = '/v10/finance/quoteSummary/'
+SCREENER_PATH = urlsplit(CONFIG['STATUS_INVEST_URL']).path
+NOT_INDEX_KEYS = ('STATUS_INVEST_URL', 'YAHOO_URL', 'POSTGRESQL_STRING')
+DEFAULT_INDEX_SIZE = 100
+
+
+@dataclass
+class ReplayOptions:
+    """Behaviour of the server, latencies in seconds and rate limit in requests by
+    second, zero disables the rate limit"""
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    rate_limit: float = 0.0
+    seed: int = 42
+
+
+class ReplayData:
+    """Responses served by the replay server, built from a synthetic universe
+
+    :param universe: Synthetic universe
+    :type universe: Universe
+    :param index_size: Number of members of each index page, defaults to 100
+    :type index_size: int, optional
+    :param seed: Seed of the members drawn for each index, defaults to 42
+    :type seed: int, optional
+    """
+    def __init__(self, universe: Universe, index_size: int = DEFAULT_INDEX_SIZE,
+                 seed: int = 42) -> None:
+        screener = universe.screener.drop(columns='roic_index').reset_index()
+        self.screener_records = [
+            {key: None if value != value else value for key, value in record.items()}
+            for record in screener.to_dict('records')]
+        self.modules: Dict[str, Union[dict, str]] = {
+            symbol: ticker.all_modules[symbol] for symbol, ticker in universe.tickers.items()}
+
+        rng = random.Random(seed)
+        tickers = sorted(universe.stock_tickers)
+        self.index_members: Dict[str, List[str]] = {}
+        for key in get_index_keys():
+            members = rng.sample(tickers, min(index_size, len(tickers)))
+            self.index_members[urlsplit(CONFIG[key]).path] = sorted(members)
+        self.index_pages = {path: build_index_page(members)
+                            for path, members in self.index_members.items()}
+
+    def get_screener_page(self, page: int, take: int) -> dict:
+        """Returns one page of the screener with the layout of status invest"""
+        return {'totalResults': len(self.screener_records),
+                'list': self.screener_records[page * take:(page + 1) * take]}
+
+    def get_quote_summary(self, symbol: str, modules: List[str]) -> tuple:
+        """Returns the status and the quoteSummary response of the symbol"""
+        symbol_modules = self.modules.get(symbol,
+                                          f'Quote not found for ticker symbol: {symbol}')
+        if isinstance(symbol_modules, str):
+            return 404, build_quote_summary_error('Not Found', symbol_modules)
+
+        return 200, {'quoteSummary': {
+            'result': [{module: symbol_modules[module] for module in modules
+                        if module in symbol_modules}],
+            'error': None}}
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """Threaded http server that replays the data, the requests above the rate limit
+    receive 429 and a fraction of error_rate of the remaining ones receive 500
+
+    :param data: Responses served
+    :type data: ReplayData
+    :param options: Latency, jitter, error rate and rate limit, defaults to ReplayOptions()
+    :type options: ReplayOptions, optional
+    :param host: Host of the server, defaults to 127.0.0.1
+    :type host: str, optional
+    :param port: Port of the server, zero uses a free one, defaults to 0
+    :type port: int, optional
+    """
+    daemon_threads = True
+
+    def __init__(self, data: ReplayData, options: ReplayOptions = None,
+                 host: str = '127.0.0.1', port: int = 0) -> None:
+        super().__init__((host, port), ReplayHandler)
+        self.data = data
+        self.options = options or ReplayOptions()
+        self.rng = random.Random(self.options.seed)
+        self.lock = threading.Lock()
+        self.tokens = self.options.rate_limit
+        self.refilled_at = time.monotonic()
+        self.counters = {'requests': 0, 'throttled': 0, 'errors': 0}
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        """Base url of the server"""
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'ReplayServer':
+        """Serves the requests on a daemon thread"""
+        self.thread = threading.Thread(target=self.serve_forever, name='ReplayServer',
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops serving and closes the socket"""
+        self.shutdown()
+        self.server_close()
+
+    def get_config(self) -> dict:
+        """Returns the configuration that sends every url of CONFIG to the server"""
+        config = {'YAHOO_URL': self.url}
+        base_url = urlsplit(self.url)
+        for key in (*get_index_keys(), 'STATUS_INVEST_URL'):
+            config[key] = urlunsplit(urlsplit(CONFIG[key])._replace(
+                scheme=base_url.scheme, netloc=base_url.netloc))
+
+        return config
+
+    def write_config(self, file_name: str) -> dict:
+        """Writes the configuration of get_config on a json file for get_config"""
+        config = self.get_config()
+        with open(file_name, 'w', encoding='UTF-8') as file:
+            json.dump(config, file, indent=2)
+
+        return config
+
+    def admit(self) -> str:
+        """Counts the request and returns how it is answered [ok, throttled, error]"""
+        with self.lock:
+            self.counters['requests'] += 1
+            if self.options.rate_limit:
+                now = time.monotonic()
+                self.tokens = min(self.options.rate_limit, self.tokens + (
+                    now - self.refilled_at) * self.options.rate_limit)
+                self.refilled_at = now
+                if self.tokens < 1:
+                    self.counters['throttled'] += 1
+                    return 'throttled'
+                self.tokens -= 1
+
+            if self.rng.random() < self.options.error_rate:
+                self.counters['errors'] += 1
+                return 'error'
+
+            return 'ok'
+
+    def get_delay(self) -> float:
+        """Returns the latency of one response"""
+        with self.lock:
+            jitter = self.rng.uniform(-self.options.jitter, self.options.jitter)
+
+        return max(self.options.latency + jitter, 0.0)
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """Routes the requests to the index pages, the screener and the yahoo api"""
+    protocol_version = 'HTTP/1.1'
+    server: ReplayServer
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        parts = urlsplit(self.path)
+        path = unquote(parts.path)
+        query = dict(parse_qsl(parts.query))
+        is_yahoo = path.startswith(QUOTE_SUMMARY_PATH)
+
+        time.sleep(self.server.get_delay())
+        outcome = self.server.admit()
+        if outcome == 'throttled':
+            self.send_error_response(429, 'Too Many Requests', is_yahoo)
+        elif outcome == 'error':
+            self.send_error_response(500, 'Internal Server Error', is_yahoo)
+        elif is_yahoo:
+            modules = [module for module in query.get('modules', '').split(',') if module]
+            self.send_json(*self.server.data.get_quote_summary(
+                path[len(QUOTE_SUMMARY_PATH):], modules))
+        elif path == CRUMB_PATH:
+            self.send_body(200, b'replay-crumb', 'text/plain')
+        elif path == SCREENER_PATH:
+            self.send_json(200, self.server.data.get_screener_page(
+                int(query.get('page', 0)), int(query.get('take', 20))))
+        elif path in self.server.data.index_pages:
+            self.send_body(200, self.server.data.index_pages[path], 'text/html; charset=utf-8')
+        else:
+            self.send_body(404, b'Not Found', 'text/plain')
+
+    def send_error_response(self, status: int, message: str, is_yahoo: bool) -> None:
+        """Sends the error as yahoo does for the api and as plain text otherwise"""
+        headers = {'Retry-After': '1'} if status == 429 else {}
+        if is_yahoo:
+            self.send_json(status, build_quote_summary_error(message, message), headers)
+        else:
+            self.send_body(status, message.encode(), 'text/plain', headers)
+
+    def send_json(self, status: int, content: dict, headers: dict = None) -> None:
+        self.send_body(status, json.dumps(content).encode(), 'application/json', headers)
+
+    def send_body(self, status: int, body: bytes, content_type: str,
+                  headers: dict = None) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:  # pylint: disable=redefined-builtin
+        """Keeps the requests out of stderr"""
+
+
+def get_index_keys() -> List[str]:
+    """Returns the keys of CONFIG with the url of an index page"""
+    return [key for key in CONFIG if key.endswith('_URL') and key not in NOT_INDEX_KEYS]
+
+
+def build_quote_summary_error(code: str, description: str) -> dict:
+    """Returns a quoteSummary error response"""
+    return {'quoteSummary': {'result': None,
+                             'error': {'code': code, 'description': description}}}
+
+
+def main(args: list = sys.argv[1:]) -> None:
+    """Serves a synthetic universe until interrupted, writing the config file that
+    redirects the pipeline to it"""
+    parser = argparse.ArgumentParser(description='Status invest and yahoo replay server.')
+    parser.add_argument('-n', '--tickers', type=int, default=1000,
+                        help='Number of tickers of the synthetic universe')
+    parser.add_argument('-is', '--index-size', type=int, default=DEFAULT_INDEX_SIZE,
+                        help='Number of members of each index page')
+    parser.add_argument('-p', '--port', type=int, default=8765)
+    parser.add_argument('-l', '--latency', type=float, default=0.0,
+                        help='Latency of each response in seconds')
+    parser.add_argument('-j', '--jitter', type=float, default=0.0,
+                        help='Maximum variation of the latency in seconds')
+    parser.add_argument('-e', '--error-rate', type=float, default=0.0,
+                        help='Fraction of the requests answered with 500')
+    parser.add_argument('-r', '--rate-limit', type=float, default=0.0,
+                        help='Requests by second above which 429 is answered, 0 disables')
+    parser.add_argument('-w', '--write-config', default='replay_config.json',
+                        help='Config file written for the -c option of the pipeline')
+    options = parser.parse_args(args)
+
+    data = ReplayData(build_universe(options.tickers), options.index_size)
+    server = ReplayServer(data, ReplayOptions(options.latency, options.jitter,
+                                              options.error_rate, options.rate_limit),
+                          port=options.port)
+    server.write_config(options.write_config)
+    print(f'Serving {options.tickers} tickers on {server.url}, '
+          f'config written on {options.write_config}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f'Requests served: {server.counters}')
+
+
+if __name__ == '__main__':
+    main()
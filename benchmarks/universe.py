@@ -0,0 +1,174 @@
+"""Generator of synthetic universes of tickers for the offline benchmarks, every ticker
+receives the recorded WEGE3.SA modules with its own fundamentals drawn from a seeded
+random generator, and the universe also has the status invest screener of the tickers
+
+Usage:
+    from benchmarks.universe import build_universe
+    universe = build_universe(1000)
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+from dataclasses import dataclass
+from typing import Dict
+
+import numpy as np
+import pandas
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from magic_formula.core import TickerMock
+from magic_formula.core import build_modules_batch
+from magic_formula.core import get_required_modules
+from magic_formula.core import split_ticker_batch
+from magic_formula.status_invest import build_screener_frame
+from tests.ticker_fixtures import FIXTURE_SYMBOL
+from tests.ticker_fixtures import load_fixture_module
+
+
+INDUSTRIES = (
+    'Specialty Industrial Machinery', 'Utilities—Regulated Electric', 'Oil & Gas Integrated',
+    'Steel', 'Packaged Foods', 'Real Estate—Development', 'Telecom Services',
+    'Banks—Regional', 'Insurance—Diversified',
+)
+ERROR_RATE = 0.02
+NEGATIVE_EBIT_RATE = 0.1
+
+
+@dataclass
+class Universe:
+    """Synthetic universe, the tickers are indexed by the yahoo symbol and the screener
+    by the status invest ticker"""
+    tickers: Dict[str, TickerMock]
+    screener: pandas.DataFrame
+
+    @property
+    def stock_tickers(self) -> set:
+        """Status invest tickers of the universe, as returned by get_tickers_list"""
+        return set(self.screener.index)
+
+
+def load_template() -> dict:
+    """Loads the recorded modules of WEGE3.SA used by the builder"""
+    all_modules = load_fixture_module('all_modules')[FIXTURE_SYMBOL]
+
+    return {module: all_modules[module] for module in get_required_modules()
+            if module in all_modules}
+
+
+def build_universe(number_of_tickers: int, seed: int = 42) -> Universe:
+    """Builds a universe with the number of tickers informed, the same seed always
+    returns the same universe
+
+    :param number_of_tickers: Number of tickers of the universe
+    :type number_of_tickers: int
+    :param seed: Seed of the random generator, defaults to 42
+    :type seed: int, optional
+    :return: Universe with the TickerMock and the screener row of each ticker
+    :rtype: Universe
+    """
+    rng = np.random.default_rng(seed)
+    template = load_template()
+
+    modules = {}
+    records = []
+    for position in range(number_of_tickers):
+        ticker = f'SY{position:05d}3'
+        symbol = f'{ticker}.SA'
+        fundamentals = draw_fundamentals(rng)
+        records.append(build_screener_record(ticker, fundamentals, rng))
+        if rng.random() < ERROR_RATE:
+            modules[symbol] = f'Quote not found for ticker symbol: {symbol}'
+            continue
+
+        modules[symbol] = build_symbol_modules(template, ticker, fundamentals, rng)
+
+    tickers = split_ticker_batch(build_modules_batch(modules), list(modules))
+    return Universe(tickers=tickers, screener=build_screener_frame(records))
+
+
+def draw_fundamentals(rng: np.random.Generator) -> dict:
+    """Draws the fundamentals of one company, market caps are log-normal around
+    R$ 3.6 bi and a fraction of the companies has a negative ebit"""
+    market_cap = float(np.exp(rng.normal(22, 1.5)))
+    ebit_margin = abs(rng.normal(0.1, 0.06))
+    if rng.random() < NEGATIVE_EBIT_RATE:
+        ebit_margin = -ebit_margin
+
+    current_price = round(float(np.exp(rng.normal(3, 0.8))), 2)
+    return {
+        'market_cap': market_cap,
+        'ebit': market_cap * ebit_margin,
+        'total_cash': market_cap * rng.uniform(0, 0.4),
+        'total_debt': market_cap * rng.uniform(0, 0.8),
+        'current_price': current_price,
+        'shares_outstanding': market_cap / current_price,
+        'equity': market_cap * rng.uniform(0.2, 1.5),
+        'industry': INDUSTRIES[int(rng.integers(len(INDUSTRIES)))],
+    }
+
+
+def build_symbol_modules(template: dict, ticker: str, fundamentals: dict,
+                         rng: np.random.Generator) -> dict:
+    """Returns the modules of one symbol, only the dicts read by the builder are copied,
+    the remaining ones are shared with the template"""
+    modules = dict(template)
+    modules['price'] = {**template['price'], 'marketCap': fundamentals['market_cap'],
+                        'longName': f'COMPANY {ticker} S.A.', 'shortName': ticker}
+    modules['assetProfile'] = {**template['assetProfile'],
+                               'industry': fundamentals['industry']}
+    modules['financialData'] = {**template['financialData'],
+                                'totalCash': fundamentals['total_cash'],
+                                'totalDebt': fundamentals['total_debt'],
+                                'currentPrice': fundamentals['current_price']}
+    modules['defaultKeyStatistics'] = {**template['defaultKeyStatistics'],
+                                       'sharesOutstanding': fundamentals['shares_outstanding']}
+
+    statements = template['incomeStatementHistory']['incomeStatementHistory']
+    modules['incomeStatementHistory'] = {
+        **template['incomeStatementHistory'],
+        'incomeStatementHistory': [{**statements[0], 'ebit': fundamentals['ebit']},
+                                   *statements[1:]]}
+
+    balance_sheets = template['balanceSheetHistory']['balanceSheetStatements']
+    modules['balanceSheetHistory'] = {
+        **template['balanceSheetHistory'],
+        'balanceSheetStatements': [{**balance_sheets[0],
+                                    'totalStockholderEquity': fundamentals['equity']},
+                                   *balance_sheets[1:]]}
+
+    modules['recommendationTrend'] = {
+        'trend': [{'period': f'-{month}m',
+                   **dict(zip(('strongBuy', 'buy', 'hold', 'sell', 'strongSell'),
+                              rng.integers(0, 6, size=5).tolist()))}
+                  for month in range(4)],
+        'maxAge': 86400}
+
+    return modules
+
+
+def build_screener_record(ticker: str, fundamentals: dict, rng: np.random.Generator) -> dict:
+    """Returns the status invest screener record of one company, consistent with the
+    fundamentals drawn for yahoo"""
+    market_cap = fundamentals['market_cap']
+    ebit = fundamentals['ebit']
+    price = fundamentals['current_price']
+    enterprise_value = market_cap + fundamentals['total_debt'] - fundamentals['total_cash']
+    lpa = ebit * 0.6 / fundamentals['shares_outstanding']
+    vpa = fundamentals['equity'] / fundamentals['shares_outstanding']
+
+    return {
+        'ticker': ticker,
+        'companyname': f'COMPANY {ticker} S.A.',
+        'price': price,
+        'roic': round(float(rng.normal(12, 10)), 2),
+        'vpa': vpa,
+        'lpa': lpa,
+        'p_l': price / lpa,
+        'p_vp': price / vpa,
+        'dy': round(float(rng.uniform(0, 12)), 2),
+        'p_ebit': market_cap / ebit,
+        'ev_ebit': enterprise_value / ebit,
+        'valormercado': market_cap,
+    }
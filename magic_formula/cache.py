@@ -0,0 +1,335 @@
+"""Module to handle the cache of the yahoo fundamentals"""
+from __future__ import absolute_import
+
+import datetime
+import os
+import pickle
+import sqlite3
+import threading
+from abc import ABC
+from abc import abstractmethod
+from typing import Dict, Iterable, List, Tuple, Union
+
+from magic_formula.core import TickerMock
+
+
+CACHE_FOLDER = 'cache'
+CACHE_DATABASE = os.path.join(CACHE_FOLDER, 'fundamentals.db')
+CACHE_BACKENDS = ('SQLITE', 'PICKLE')
+TICKER_MODULES = (
+    'all_modules',
+    'asset_profile',
+    'financial_data',
+    'summary_detail',
+    'recommendation_trend',
+)
+TICKER_PAYLOAD = 'ticker'
+REQUESTED_MODULES = 'requested_modules'
+SQLITE_MAX_VARIABLES = 500
+
+
+class CacheBackend(ABC):
+    """Base class of the fundamentals cache backends
+
+    :param ttl: Time that an entry is considered fresh, defaults to 1 day
+    :type ttl: datetime.timedelta, optional
+    """
+    def __init__(self, ttl: datetime.timedelta = datetime.timedelta(days=1)) -> None:
+        self.ttl = ttl
+
+    def get(self, symbol: str, modules: List[str] = None) -> Union[TickerMock, None]:
+        """Returns the fresh cached ticker of the symbol
+
+        :param symbol: Ticker symbol
+        :type symbol: str
+        :param modules: Yahoo modules the ticker must have been fetched with, None
+            requires all_modules, defaults to None
+        :type modules: List[str], optional
+        :return: Cached ticker or None when not found, expired or fetched with fewer modules
+        :rtype: Union[TickerMock, None]
+        """
+        return self.get_many([symbol], modules).get(symbol)
+
+    def set(self, symbol: str, ticker: TickerMock, modules: List[str] = None) -> None:
+        """Saves the ticker of the symbol on the cache
+
+        :param symbol: Ticker symbol
+        :type symbol: str
+        :param ticker: Ticker to be saved
+        :type ticker: TickerMock
+        :param modules: Yahoo modules the ticker was fetched with, None for all_modules,
+            defaults to None
+        :type modules: List[str], optional
+        """
+        self.set_many({symbol: ticker}, modules)
+
+    @abstractmethod
+    def get_many(self, symbols: Iterable[str],
+                 modules: List[str] = None) -> Dict[str, TickerMock]:
+        """Returns the fresh cached tickers of the symbols
+
+        :param symbols: Ticker symbols
+        :type symbols: Iterable[str]
+        :param modules: Yahoo modules the tickers must have been fetched with, None
+            requires all_modules, defaults to None
+        :type modules: List[str], optional
+        :return: Dictionary with the cached tickers found
+        :rtype: Dict[str, TickerMock]
+        """
+
+    @abstractmethod
+    def get_many_payloads(self, symbols: Iterable[str],
+                          modules: List[str] = None) -> Dict[str, Dict[str, bytes]]:
+        """Returns the fresh cached tickers of the symbols still serialized, to be decoded
+        by decode_ticker_payload on another process
+
+        :param symbols: Ticker symbols
+        :type symbols: Iterable[str]
+        :param modules: Yahoo modules the tickers must have been fetched with, None
+            requires all_modules, defaults to None
+        :type modules: List[str], optional
+        :return: Dictionary with the pickled payload of each symbol found, by module or
+            the whole ticker on TICKER_PAYLOAD
+        :rtype: Dict[str, Dict[str, bytes]]
+        """
+
+    @abstractmethod
+    def set_many(self, tickers: Dict[str, TickerMock], modules: List[str] = None) -> None:
+        """Saves several tickers on the cache with the yahoo modules they were fetched with
+
+        :param tickers: Dictionary with the tickers by symbol
+        :type tickers: Dict[str, TickerMock]
+        :param modules: Yahoo modules the tickers were fetched with, None for all_modules,
+            defaults to None
+        :type modules: List[str], optional
+        """
+
+    def close(self) -> None:
+        """Releases the resources held by the backend"""
+
+
+class PickleCacheBackend(CacheBackend):
+    """Legacy backend that keeps one pickle file per symbol, the file starts with the
+    modules the ticker was fetched with, files without them were written by the versions
+    that always fetched all_modules
+
+    :param folder: Folder of the pickle files, defaults to 'cache'
+    :type folder: str, optional
+    :param ttl: Time that an entry is considered fresh, defaults to 1 day
+    :type ttl: datetime.timedelta, optional
+    """
+    def __init__(self, folder: str = CACHE_FOLDER,
+                 ttl: datetime.timedelta = datetime.timedelta(days=1)) -> None:
+        super().__init__(ttl)
+        self.folder = folder
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+
+    def get_file_name(self, symbol: str) -> str:
+        """Returns the pickle file name of the symbol"""
+        return os.path.join(self.folder, f'{symbol}.cache')
+
+    def valid_file(self, symbol: str) -> bool:
+        """Validates if the pickle file of the symbol exists and is still fresh"""
+        file_name = self.get_file_name(symbol)
+        if not os.path.exists(file_name):
+            return False
+
+        file_age = datetime.datetime.now() - \
+            datetime.datetime.fromtimestamp(os.path.getctime(file_name))
+        return file_age.days <= self.ttl.days
+
+    def read_file(self, symbol: str) -> Tuple[Union[List[str], None], bytes]:
+        """Returns the modules the ticker was fetched with and the pickled ticker"""
+        with open(self.get_file_name(symbol), 'rb') as file:
+            header = pickle.load(file)
+            if isinstance(header, TickerMock):
+                file.seek(0)
+                return None, file.read()
+
+            return header[REQUESTED_MODULES], file.read()
+
+    def get_many(self, symbols: Iterable[str],
+                 modules: List[str] = None) -> Dict[str, TickerMock]:
+        return {symbol: decode_ticker_payload(payload)
+                for symbol, payload in self.get_many_payloads(symbols, modules).items()}
+
+    def get_many_payloads(self, symbols: Iterable[str],
+                          modules: List[str] = None) -> Dict[str, Dict[str, bytes]]:
+        payloads = {}
+        for symbol in symbols:
+            if not self.valid_file(symbol):
+                continue
+
+            requested_modules, payload = self.read_file(symbol)
+            if covers_modules(requested_modules, modules):
+                payloads[symbol] = {TICKER_PAYLOAD: payload}
+
+        return payloads
+
+    def set_many(self, tickers: Dict[str, TickerMock], modules: List[str] = None) -> None:
+        for symbol, ticker in tickers.items():
+            with open(self.get_file_name(symbol), 'wb') as file:
+                pickle.dump({REQUESTED_MODULES: modules}, file)
+                pickle.dump(ticker, file)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """Backend that keeps every symbol and module on a single indexed sqlite file, the
+    yahoo modules each symbol was fetched with are kept on the module REQUESTED_MODULES
+
+    :param database: Path of the sqlite file, defaults to 'cache/fundamentals.db'
+    :type database: str, optional
+    :param ttl: Time that an entry is considered fresh, defaults to 1 day
+    :type ttl: datetime.timedelta, optional
+    """
+    def __init__(self, database: str = CACHE_DATABASE,
+                 ttl: datetime.timedelta = datetime.timedelta(days=1)) -> None:
+        super().__init__(ttl)
+        self.database = database
+        folder = os.path.dirname(database)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(database, check_same_thread=False)
+        self.create_tables()
+
+    def create_tables(self) -> None:
+        """Creates the fundamentals table and its index"""
+        with self.lock, self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS fundamentals ('
+                'symbol TEXT NOT NULL, '
+                'module TEXT NOT NULL, '
+                'fetched_at REAL NOT NULL, '
+                'payload BLOB NOT NULL, '
+                'PRIMARY KEY (symbol, module))'
+            )
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS fundamentals_symbol_module_fetched_at '
+                'ON fundamentals (symbol, module, fetched_at)'
+            )
+
+    def close(self) -> None:
+        """Closes the sqlite connection"""
+        with self.lock:
+            self.connection.close()
+
+    def get_min_fetched_at(self) -> float:
+        """Returns the oldest timestamp still considered fresh"""
+        return (datetime.datetime.now() - self.ttl).timestamp()
+
+    def get_many(self, symbols: Iterable[str],
+                 modules: List[str] = None) -> Dict[str, TickerMock]:
+        return {symbol: decode_ticker_payload(payload)
+                for symbol, payload in self.get_many_payloads(symbols, modules).items()}
+
+    def get_many_payloads(self, symbols: Iterable[str],
+                          modules: List[str] = None) -> Dict[str, Dict[str, bytes]]:
+        modules_by_symbol: Dict[str, dict] = {}
+        for chunk in _get_chunks(symbols):
+            rows = self.execute(
+                'SELECT symbol, module, payload FROM fundamentals '
+                f'WHERE fetched_at >= ? AND symbol IN ({", ".join("?" * len(chunk))})',
+                [self.get_min_fetched_at(), *chunk]
+            )
+            for symbol, module, payload in rows:
+                modules_by_symbol.setdefault(symbol, {})[module] = payload
+
+        payloads = {}
+        for symbol, payload in modules_by_symbol.items():
+            requested_modules = payload.pop(REQUESTED_MODULES, None)
+            # the rows written before the modules were recorded are not trusted
+            if requested_modules is None or \
+                    not all(module in payload for module in TICKER_MODULES):
+                continue
+
+            if covers_modules(pickle.loads(requested_modules), modules):
+                payloads[symbol] = payload
+
+        return payloads
+
+    def set_many(self, tickers: Dict[str, TickerMock], modules: List[str] = None) -> None:
+        fetched_at = datetime.datetime.now().timestamp()
+        requested_modules = pickle.dumps(modules, pickle.HIGHEST_PROTOCOL)
+        rows = []
+        for symbol, ticker in tickers.items():
+            rows += [(symbol, module, fetched_at,
+                      pickle.dumps(getattr(ticker, module), pickle.HIGHEST_PROTOCOL))
+                     for module in TICKER_MODULES]
+            rows.append((symbol, REQUESTED_MODULES, fetched_at, requested_modules))
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO fundamentals (symbol, module, fetched_at, payload) '
+                'VALUES (?, ?, ?, ?)',
+                rows
+            )
+
+    def execute(self, query: str, parameters: list) -> list:
+        """Executes a query and returns all the rows"""
+        with self.lock:
+            return self.connection.execute(query, parameters).fetchall()
+
+
+def decode_ticker_payload(payload: Dict[str, bytes]) -> TickerMock:
+    """Builds the ticker from the pickled payload of get_many_payloads
+
+    :param payload: Dictionary with the pickled payload by module or the whole ticker
+    :type payload: Dict[str, bytes]
+    :return: Ticker with the modules decoded
+    :rtype: TickerMock
+    """
+    if TICKER_PAYLOAD in payload:
+        return pickle.loads(payload[TICKER_PAYLOAD])
+
+    ticker = TickerMock()
+    for module in TICKER_MODULES:
+        setattr(ticker, module, pickle.loads(payload[module]))
+
+    return ticker
+
+
+def covers_modules(cached_modules: Union[List[str], None],
+                   modules: Union[List[str], None]) -> bool:
+    """Validates if a ticker fetched with cached_modules has every module requested
+
+    :param cached_modules: Yahoo modules the ticker was fetched with, None for all_modules
+    :type cached_modules: Union[List[str], None]
+    :param modules: Yahoo modules requested, None for all_modules
+    :type modules: Union[List[str], None]
+    :return: Returns True if the cached modules include the requested ones
+    :rtype: bool
+    """
+    if cached_modules is None:
+        return True
+
+    return modules is not None and set(modules) <= set(cached_modules)
+
+
+def _get_chunks(symbols: Iterable[str]) -> List[List[str]]:
+    """Splits the symbols respecting the sqlite limit of variables"""
+    symbols = list(symbols)
+    return [symbols[position:position + SQLITE_MAX_VARIABLES]
+            for position in range(0, len(symbols), SQLITE_MAX_VARIABLES)]
+
+
+def get_cache_backend(backend: str = 'SQLITE',
+                      ttl: datetime.timedelta = datetime.timedelta(days=1)) -> CacheBackend:
+    """Returns the cache backend by name
+
+    :param backend: Name of the backend [SQLITE, PICKLE], defaults to 'SQLITE'
+    :type backend: str, optional
+    :param ttl: Time that an entry is considered fresh, defaults to 1 day
+    :type ttl: datetime.timedelta, optional
+    :return: Cache backend
+    :rtype: CacheBackend
+    """
+    if backend == 'SQLITE':
+        return SQLiteCacheBackend(ttl=ttl)
+
+    if backend == 'PICKLE':
+        return PickleCacheBackend(ttl=ttl)
+
+    raise ValueError(f'Cache backend {backend} not supported, supported backends: '
+                     f'{CACHE_BACKENDS}')
@@ -0,0 +1,164 @@
+"""Module with the adaptive concurrency controller of the yahoo requests"""
+from __future__ import absolute_import
+
+import logging
+import threading
+from typing import Dict, List, Tuple, Union
+
+
+SUCCESS = 'success'
+ERROR = 'error'
+THROTTLED = 'throttled'
+OUTCOMES = (SUCCESS, ERROR, THROTTLED)
+THROTTLE_MARKERS = ('429', 'too many requests', 'rate limit')
+
+
+class AdaptiveConcurrencyController:
+    """Additive increase, multiplicative decrease (AIMD) controller of the number of
+    requests in flight. The requests of one round are recorded with record and adjust
+    closes the round: the limit grows by increase when the round had no throttling, no
+    errors above error_threshold and a latency inside latency_tolerance times the best
+    latency observed, otherwise it is multiplied by decrease_factor
+
+    :param logger: Logger object
+    :type logger: logging.Logger
+    :param initial_limit: Limit of the first round, defaults to 4
+    :type initial_limit: int, optional
+    :param min_limit: Minimum limit, defaults to 1
+    :type min_limit: int, optional
+    :param max_limit: Maximum limit, defaults to 15
+    :type max_limit: int, optional
+    :param increase: Additive increase by round, defaults to 1
+    :type increase: int, optional
+    :param decrease_factor: Multiplicative decrease on congestion, defaults to 0.5
+    :type decrease_factor: float, optional
+    :param error_threshold: Fraction of errors of a round considered congestion,
+        defaults to 0.1
+    :type error_threshold: float, optional
+    :param latency_tolerance: Latency, relative to the best observed, considered
+        congestion, defaults to 2.0
+    :type latency_tolerance: float, optional
+    """
+    def __init__(self, logger: logging.Logger, initial_limit: int = 4, min_limit: int = 1,
+                 max_limit: int = 15, increase: int = 1, decrease_factor: float = 0.5,
+                 error_threshold: float = 0.1, latency_tolerance: float = 2.0) -> None:
+        self.logger = logger
+        self.min_limit = max(min_limit, 1)
+        self.max_limit = max(max_limit, self.min_limit)
+        self.limit = min(max(initial_limit, self.min_limit), self.max_limit)
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.error_threshold = error_threshold
+        self.latency_tolerance = latency_tolerance
+
+        self.lock = threading.Lock()
+        self.round_outcomes = dict.fromkeys(OUTCOMES, 0)
+        self.round_latencies: List[float] = []
+        self.best_latency: Union[float, None] = None
+        self.totals = dict.fromkeys(OUTCOMES, 0)
+        self.rounds = 0
+        self.increases = 0
+        self.decreases = 0
+        self.history: List[Tuple[int, int, str]] = []
+
+    def record(self, outcome: str, latency: float) -> None:
+        """Records one request of the current round
+
+        :param outcome: Outcome of the request [success, error, throttled]
+        :type outcome: str
+        :param latency: Latency of the request in seconds
+        :type latency: float
+        """
+        if outcome not in OUTCOMES:
+            raise ValueError(f'Outcome {outcome} not supported, supported outcomes: {OUTCOMES}')
+
+        with self.lock:
+            self.round_outcomes[outcome] += 1
+            self.totals[outcome] += 1
+            self.round_latencies.append(latency)
+
+    def adjust(self) -> int:
+        """Closes the current round and decides the limit of the next one
+
+        :return: New limit
+        :rtype: int
+        """
+        with self.lock:
+            requests = sum(self.round_outcomes.values())
+            if not requests:
+                return self.limit
+
+            latencies = sorted(self.round_latencies)
+            latency = latencies[len(latencies) // 2]
+            reason = self.get_congestion_reason(requests, latency)
+
+            old_limit = self.limit
+            if reason:
+                self.limit = max(self.min_limit, int(self.limit * self.decrease_factor))
+                if self.limit != old_limit:
+                    self.decreases += 1
+            else:
+                if self.best_latency is None or latency < self.best_latency:
+                    self.best_latency = latency
+                self.limit = min(self.max_limit, self.limit + self.increase)
+                if self.limit != old_limit:
+                    self.increases += 1
+                reason = 'no congestion'
+
+            self.rounds += 1
+            self.history.append((self.rounds, self.limit, reason))
+            self.round_outcomes = dict.fromkeys(OUTCOMES, 0)
+            self.round_latencies = []
+
+        if old_limit != self.limit:
+            self.logger.info(f'Concurrency limit {old_limit} -> {self.limit}: {reason} '
+                             f'({requests} requests, median latency {latency:.3f}s)')
+        return self.limit
+
+    def get_congestion_reason(self, requests: int, latency: float) -> str:
+        """Returns the reason of the congestion of the round, empty when there is none"""
+        if self.round_outcomes[THROTTLED]:
+            return f'{self.round_outcomes[THROTTLED]} throttled'
+
+        if self.round_outcomes[ERROR] / requests > self.error_threshold:
+            return f'{self.round_outcomes[ERROR]} errors'
+
+        if self.best_latency is not None and \
+                latency > self.best_latency * self.latency_tolerance:
+            return f'latency {latency:.3f}s above {self.best_latency:.3f}s'
+
+        return ''
+
+    def metrics(self) -> Dict[str, Union[int, float, None]]:
+        """Returns the counters of the controller
+
+        :return: Dictionary with the current limit, the totals by outcome, the number of
+            rounds, increases and decreases and the best latency
+        :rtype: Dict[str, Union[int, float, None]]
+        """
+        with self.lock:
+            return {
+                'limit': self.limit,
+                'min_limit': self.min_limit,
+                'max_limit': self.max_limit,
+                'rounds': self.rounds,
+                'increases': self.increases,
+                'decreases': self.decreases,
+                'best_latency': self.best_latency,
+                **{f'requests_{outcome}': count for outcome, count in self.totals.items()},
+            }
+
+
+def classify_error(error: Union[BaseException, str]) -> str:
+    """Classifies an error of a request as throttled or error
+
+    :param error: Exception raised or error message returned
+    :type error: Union[BaseException, str]
+    :return: Outcome [error, throttled]
+    :rtype: str
+    """
+    message = str(error).lower()
+    if any(marker in message for marker in THROTTLE_MARKERS):
+        return THROTTLED
+
+    return ERROR
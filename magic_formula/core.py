@@ -2,45 +2,104 @@
 from __future__ import absolute_import
 
 import logging
+import math
+import numbers
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-import datetime
-from typing import Union
+from enum import Enum
+from typing import Dict, Iterable, List, Tuple, Union
 import yahooquery
-import pickle
-import os
+from requests_futures.sessions import FuturesSession
 import pandas
 
+from magic_formula import valuation
+from magic_formula.concurrency import AdaptiveConcurrencyController
+from magic_formula.concurrency import ERROR
+from magic_formula.concurrency import SUCCESS
+from magic_formula.concurrency import classify_error
+from magic_formula.http_client import RedirectSession
+from magic_formula.http_client import count_session_bytes
+from magic_formula.metrics import observe_latency
+
+
+YAHOO_URL = 'https://query2.finance.yahoo.com'
+YAHOO_FIELD_MODULES: Dict[str, Tuple[str, ...]] = {
+    'industry': ('assetProfile',),
+    'ebit': ('incomeStatementHistory',),
+    'market_cap': ('price',),
+    'total_cash': ('financialData',),
+    'total_debt': ('financialData',),
+    'current_price': ('financialData',),
+    'dividend_yield': ('summaryDetail',),
+    'long_name': ('price',),
+    'short_name': ('price',),
+    'regular_market_time': ('price',),
+    'shares_outstanding': ('defaultKeyStatistics',),
+    'total_stockholder_equity': ('balanceSheetHistory',),
+    'recommendation_trend': ('recommendationTrend',),
+}
+SCREENING_FIELDS = ('industry', 'ebit', 'market_cap')
+
+class RejectionReason(Enum):
+    """Reasons for a ticker to be dropped from the magic formula"""
+    INVALID_INFORMATION = 'invalid information'
+    INVALID_MODULES = 'invalid modules'
+    INVALID_INDUSTRY = 'invalid industry'
+    INVALID_EBIT = 'invalid ebit'
+    INVALID_MARKET_CAP = 'invalid market cap'
+    INVALID_TICKER_INFO = 'invalid ticker info'
+    SCREENER_EBIT = 'invalid ebit on screener'
+    SCREENER_MARKET_CAP = 'invalid market cap on screener'
+    NEGATIVE_EARNING_YIELD = 'negative earning yield'
+    PROCESSING_ERROR = 'processing error'
+
 
 @dataclass
 class RecomenationTrend:
     """Recommendation trend variables"""
+    __slots__ = ('buy_counter', 'sell_counter')
     buy_counter: int
     sell_counter: int
 
 
 @dataclass
-class TickerInfo:
-    """Ticker info variables"""
+class TickerModules:
+    """Yahoo modules of one symbol, resolved once by the TickerInfoBuilder"""
+    all_modules: dict
+    asset_profile: Union[dict, str]
     financial_data: dict
-    ticker_price: dict
+    summary_detail: dict
+    price: dict
     key_statistics: dict
     balance_sheet: dict
+
+
+@dataclass
+class TickerInfo:
+    """Ticker info variables, only the scalars used by the magic formula are kept,
+    the yahoo modules are kept on raw_modules only when requested to the builder"""
+    __slots__ = (
+        'all_modules_found', 'industry', 'ebit', 'market_cap', 'total_cash', 'total_debt',
+        'current_price', 'dividend_yield', 'long_name', 'short_name', 'regular_market_time',
+        'shares_outstanding', 'total_stockholder_equity', 'recommendation_trend',
+        'raw_modules',
+    )
+    all_modules_found: bool
+    industry: str
     ebit: float
-    recommendation_trend: RecomenationTrend
-    asset_profile: Union[dict, str]
-    industry: list
-    summary_detail: dict
     market_cap: float
     total_cash: float
-    dividend_yield: float
+    total_debt: float
     current_price: float
+    dividend_yield: float
     long_name: str
     short_name: str
     regular_market_time: str
     shares_outstanding: float
     total_stockholder_equity: float
-    total_debt: float
-    all_modules_found: bool = False
+    recommendation_trend: RecomenationTrend
+    raw_modules: Union[TickerModules, None]
 
 class TickerMock:
     def __init__(self) -> None:
@@ -51,42 +110,567 @@ class TickerMock:
         self.recommendation_trend = pandas.DataFrame()
 
 
+class TickerBatchFetcher:
+    """Fetches the yahoo information of several symbols through one multi-symbol
+    yahooquery.Ticker per chunk and splits it into one TickerMock per symbol
+
+    :param logger: Logger object
+    :type logger: logging.Logger
+    :param chunk_size: Number of symbols requested by each yahooquery.Ticker, defaults to 50
+    :type chunk_size: int, optional
+    :param max_workers: Number of workers used by yahooquery on each chunk, defaults to 8
+    :type max_workers: int, optional
+    :param controller: Controller that adapts the workers of each chunk to the latency
+        and throttling observed on the previous ones, defaults to None
+    :type controller: AdaptiveConcurrencyController, optional
+    :param modules: QuoteSummary modules requested at once for each symbol, None
+        requests all_modules and the separate modules, defaults to None
+    :type modules: List[str], optional
+    :param base_url: Base url of the yahoo api, another url sends the requests to a
+        stand-in server, defaults to YAHOO_URL
+    :type base_url: str, optional
+    """
+    def __init__(self, logger: logging.Logger, chunk_size: int = 50,
+                 max_workers: int = 8,
+                 controller: AdaptiveConcurrencyController = None,
+                 modules: List[str] = None, base_url: str = YAHOO_URL) -> None:
+        self.logger = logger
+        self.chunk_size = max(chunk_size, 1)
+        self.max_workers = max(max_workers, 1)
+        self.controller = controller
+        self.modules = modules
+        self.base_url = base_url or YAHOO_URL
+
+    def fetch(self, symbols: Iterable[str]) -> Dict[str, TickerMock]:
+        """Fetches all the symbols in chunks, the symbols of the chunks that fail are
+        fetched one by one by fetch_symbols
+
+        :param symbols: Symbols to be fetched
+        :type symbols: Iterable[str]
+        :return: Dictionary with the TickerMock of each symbol
+        :rtype: Dict[str, TickerMock]
+        """
+        symbols = sorted(set(symbols))
+        tickers = {}
+        failed_symbols = []
+        for chunk in self.get_chunks(symbols):
+            max_workers = self.controller.limit if self.controller else self.max_workers
+            self.logger.info(f'Fetching chunk with {len(chunk)} tickers '
+                             f'and {max_workers} workers')
+            start = time.perf_counter()
+            try:
+                chunk_tickers = self.fetch_chunk(chunk, max_workers)
+                outcomes = [get_ticker_outcome(ticker, symbol)
+                            for symbol, ticker in chunk_tickers.items()]
+                tickers.update(chunk_tickers)
+            except Exception as error:  # pylint: disable=broad-except
+                self.logger.error(f'Error fetching chunk {chunk[0]}..{chunk[-1]}: {error}')
+                outcomes = [classify_error(error)] * len(chunk)
+                failed_symbols.extend(chunk)
+
+            latency = (time.perf_counter() - start) / math.ceil(len(chunk) / max_workers)
+            observe_latency('fetch', chunk, latency)
+            if self.controller:
+                for outcome in outcomes:
+                    self.controller.record(outcome, latency)
+                self.controller.adjust()
+
+        if failed_symbols:
+            tickers.update(self.fetch_symbols(failed_symbols))
+
+        return tickers
+
+    def fetch_symbols(self, symbols: List[str]) -> Dict[str, TickerMock]:
+        """Fetches the symbols one by one, in rounds of as many concurrent requests as the
+        limit of the controller, so a throttled api receives fewer requests. The symbols
+        that still fail receive a TickerMock with the error message on every module
+
+        :param symbols: Symbols to be fetched
+        :type symbols: List[str]
+        :return: Dictionary with the TickerMock of each symbol
+        :rtype: Dict[str, TickerMock]
+        """
+        tickers = {}
+        position = 0
+        while position < len(symbols):
+            max_workers = self.controller.limit if self.controller else self.max_workers
+            round_symbols = symbols[position:position + max_workers]
+            position += len(round_symbols)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=len(round_symbols)) as executor:
+                results = list(executor.map(self.fetch_symbol, round_symbols))
+            latency = time.perf_counter() - start
+
+            observe_latency('fetch', round_symbols, latency)
+            for symbol, (ticker, outcome) in zip(round_symbols, results):
+                tickers[symbol] = ticker
+                if self.controller:
+                    self.controller.record(outcome, latency)
+            if self.controller:
+                self.controller.adjust()
+
+        return tickers
+
+    def fetch_symbol(self, symbol: str) -> Tuple[TickerMock, str]:
+        """Fetches one symbol and returns its TickerMock with the outcome of the request"""
+        try:
+            ticker = self.fetch_chunk([symbol], 1)[symbol]
+            return ticker, get_ticker_outcome(ticker, symbol)
+        except Exception as error:  # pylint: disable=broad-except
+            self.logger.error(f'Error fetching ticker {symbol}: {error}')
+            return build_error_ticker(str(error)), classify_error(error)
+
+    def get_chunks(self, symbols: List[str]) -> List[List[str]]:
+        """Splits the symbols in chunks of chunk_size
+
+        :param symbols: Symbols to be split
+        :type symbols: List[str]
+        :return: List of chunks
+        :rtype: List[List[str]]
+        """
+        return [symbols[position:position + self.chunk_size]
+                for position in range(0, len(symbols), self.chunk_size)]
+
+    def fetch_chunk(self, symbols: List[str], max_workers: int = None) -> Dict[str, TickerMock]:
+        """Fetches one chunk of symbols through a single multi-symbol Ticker
+
+        :param symbols: Symbols of the chunk
+        :type symbols: List[str]
+        :param max_workers: Number of workers of the chunk, defaults to max_workers
+        :type max_workers: int, optional
+        :return: Dictionary with the TickerMock of each symbol
+        :rtype: Dict[str, TickerMock]
+        """
+        ticker_base = get_yahoo_ticker(symbols, self.base_url,
+                                       max_workers or self.max_workers)
+        if self.modules is not None:
+            return split_ticker_batch(
+                build_modules_batch(ticker_base.get_modules(self.modules)), symbols)
+
+        batch = TickerMock()
+        batch.all_modules = ticker_base.all_modules
+        batch.asset_profile = ticker_base.asset_profile
+        batch.financial_data = ticker_base.financial_data
+        batch.summary_detail = ticker_base.summary_detail
+        batch.recommendation_trend = ticker_base.recommendation_trend
+
+        tickers = split_ticker_batch(batch, symbols)
+        self.fill_missing_recommendation_trends(tickers, max_workers)
+        return tickers
+
+    def fill_missing_recommendation_trends(self, tickers: Dict[str, TickerMock],
+                                           max_workers: int = None) -> None:
+        """Fills the recommendation trend of the symbols fetched that came without it,
+        the multi-symbol recommendation_trend may fail while all_modules does not. The
+        trend is built from all_modules and, when it is not there, fetched again
+
+        :param tickers: Dictionary with the TickerMock of each symbol
+        :type tickers: Dict[str, TickerMock]
+        :param max_workers: Number of workers of the request, defaults to max_workers
+        :type max_workers: int, optional
+        """
+        missing_symbols = []
+        for symbol, ticker in tickers.items():
+            if get_ticker_outcome(ticker, symbol) != SUCCESS or \
+                    valid_recommendation_trend(ticker, symbol):
+                continue
+
+            ticker.recommendation_trend = _slice_recommendation_trend(
+                _build_recommendation_trend(_slice_module(ticker.all_modules, symbol)), symbol)
+            if not valid_recommendation_trend(ticker, symbol):
+                missing_symbols.append(symbol)
+
+        if not missing_symbols:
+            return
+
+        self.logger.info(f'Fetching the recommendation trend of {len(missing_symbols)} tickers')
+        try:
+            recommendation_trend = get_yahoo_ticker(
+                missing_symbols if len(missing_symbols) > 1 else missing_symbols[0],
+                self.base_url, max_workers or self.max_workers).recommendation_trend
+        except Exception as error:  # pylint: disable=broad-except
+            self.logger.error(f'Error fetching the recommendation trend: {error}')
+            return
+
+        for symbol in missing_symbols:
+            tickers[symbol].recommendation_trend = _slice_recommendation_trend(
+                recommendation_trend, symbol)
+
+
+def get_yahoo_ticker(symbols: Union[str, List[str]], base_url: str = YAHOO_URL,
+                     max_workers: int = 8) -> yahooquery.Ticker:
+    """Returns the yahooquery.Ticker of the symbols, the requests of several symbols are
+    made concurrently and a base url other than YAHOO_URL receives all of them. The
+    responses are added to bytes_fetched of the run report on both urls
+
+    :param symbols: Symbol or list of symbols
+    :type symbols: Union[str, List[str]]
+    :param base_url: Base url of the yahoo api, defaults to YAHOO_URL
+    :type base_url: str, optional
+    :param max_workers: Number of concurrent requests, defaults to 8
+    :type max_workers: int, optional
+    :return: Ticker of the symbols
+    :rtype: yahooquery.Ticker
+    """
+    asynchronous = not isinstance(symbols, str) and len(symbols) > 1
+    if not base_url or base_url.rstrip('/') == YAHOO_URL:
+        if not asynchronous:
+            ticker = yahooquery.Ticker(symbols)
+        else:
+            ticker = yahooquery.Ticker(symbols, asynchronous=True, max_workers=max_workers)
+        count_session_bytes(getattr(ticker, 'session', None))
+        return ticker
+
+    session = RedirectSession(base_url)
+    if asynchronous:
+        session = FuturesSession(max_workers=max_workers, session=session)
+
+    return yahooquery.Ticker(symbols, session=session)
+
+
+def get_required_modules(fields: Iterable[str] = None) -> List[str]:
+    """Returns the quoteSummary modules needed to extract the fields of the TickerInfo,
+    the fields of the screening are always included
+
+    :param fields: Fields of the TickerInfo used by the output, defaults to all of them
+    :type fields: Iterable[str], optional
+    :raises ValueError: When a field is not extracted from the yahoo modules
+    :return: List with the modules, in the order of the fields
+    :rtype: List[str]
+    """
+    fields = YAHOO_FIELD_MODULES.keys() if fields is None else fields
+    modules = []
+    for field in (*SCREENING_FIELDS, *fields):
+        if field not in YAHOO_FIELD_MODULES:
+            raise ValueError(f'Field {field} not supported, supported fields: '
+                             f'{list(YAHOO_FIELD_MODULES)}')
+
+        for module in YAHOO_FIELD_MODULES[field]:
+            if module not in modules:
+                modules.append(module)
+
+    return modules
+
+
+def build_modules_batch(modules: Union[dict, str]) -> TickerMock:
+    """Builds a TickerMock with the layout of the yahooquery properties from the
+    result of Ticker.get_modules, the error message of a symbol is kept on every
+    module of it, as yahooquery does
+
+    :param modules: Dictionary with the modules of each symbol returned by get_modules
+    :type modules: Union[dict, str]
+    :return: TickerMock with the information of all the symbols
+    :rtype: TickerMock
+    """
+    batch = TickerMock()
+    if not isinstance(modules, dict):
+        batch.all_modules = batch.asset_profile = modules
+        batch.financial_data = batch.summary_detail = modules
+        return batch
+
+    batch.all_modules = modules
+    batch.asset_profile = _extract_module(modules, 'assetProfile')
+    batch.financial_data = _extract_module(modules, 'financialData')
+    batch.summary_detail = _extract_module(modules, 'summaryDetail')
+    batch.recommendation_trend = _build_recommendation_trend(modules)
+
+    return batch
+
+
+def build_error_ticker(message: str) -> TickerMock:
+    """Builds a TickerMock with the error message on every module, as yahooquery returns
+    a request that failed"""
+    ticker = TickerMock()
+    ticker.all_modules = ticker.asset_profile = message
+    ticker.financial_data = ticker.summary_detail = message
+    return ticker
+
+
+def split_ticker_batch(batch: TickerMock, symbols: Iterable[str]) -> Dict[str, TickerMock]:
+    """Splits a TickerMock filled by a multi-symbol Ticker into one TickerMock per symbol
+
+    :param batch: TickerMock with the information of several symbols
+    :type batch: TickerMock
+    :param symbols: Symbols to be extracted
+    :type symbols: Iterable[str]
+    :return: Dictionary with the TickerMock of each symbol
+    :rtype: Dict[str, TickerMock]
+    """
+    tickers = {}
+    for symbol in symbols:
+        ticker = TickerMock()
+        ticker.all_modules = _slice_module(batch.all_modules, symbol)
+        ticker.asset_profile = _slice_module(batch.asset_profile, symbol)
+        ticker.financial_data = _slice_module(batch.financial_data, symbol)
+        ticker.summary_detail = _slice_module(batch.summary_detail, symbol)
+        ticker.recommendation_trend = _slice_recommendation_trend(
+            batch.recommendation_trend, symbol)
+        tickers[symbol] = ticker
+
+    return tickers
+
+
+def get_ticker_outcome(ticker: TickerMock, symbol: str) -> str:
+    """Returns the outcome of the request of one symbol, yahooquery returns the error
+    message in place of the module when a request fails and nothing for the symbols of
+    a request that could not be read
+
+    :param ticker: Ticker of the symbol
+    :type ticker: TickerMock
+    :param symbol: Ticker symbol
+    :type symbol: str
+    :return: Outcome [success, error, throttled]
+    :rtype: str
+    """
+    for module in (ticker.all_modules, ticker.asset_profile, ticker.financial_data,
+                   ticker.summary_detail):
+        value = module.get(symbol) if isinstance(module, dict) else module
+        if isinstance(value, str):
+            return classify_error(value)
+
+    if isinstance(ticker.all_modules, dict) and not ticker.all_modules.get(symbol):
+        return ERROR
+
+    return SUCCESS
+
+
+def valid_recommendation_trend(ticker: TickerMock, symbol: str) -> bool:
+    """Validates if the recommendation trend of the symbol was received, it is empty only
+    when yahoo answers the recommendationTrend module without any trend
+
+    :param ticker: Ticker of the symbol
+    :type ticker: TickerMock
+    :param symbol: Ticker symbol
+    :type symbol: str
+    :return: Boolean with the result of the validation
+    :rtype: bool
+    """
+    if not isinstance(ticker.recommendation_trend, pandas.DataFrame):
+        return False
+
+    if not ticker.recommendation_trend.empty:
+        return True
+
+    symbol_modules = ticker.all_modules.get(symbol) \
+        if isinstance(ticker.all_modules, dict) else None
+    recommendation_trend = symbol_modules.get('recommendationTrend') \
+        if isinstance(symbol_modules, dict) else None
+    return isinstance(recommendation_trend, dict) and not recommendation_trend.get('trend')
+
+
+def valid_ticker_modules(ticker: TickerMock, symbol: str) -> bool:
+    """Validates if the modules of the symbol were received as dictionaries, yahooquery
+    returns the error message in place of a module when the request of the batch fails
+    and in place of the modules of all_modules that could not be read, only the modules
+    of the TickerInfo fields are checked on all_modules
+
+    :param ticker: Ticker of the symbol
+    :type ticker: TickerMock
+    :param symbol: Ticker symbol
+    :type symbol: str
+    :return: Boolean with the result of the validation
+    :rtype: bool
+    """
+    for module in (ticker.all_modules, ticker.asset_profile, ticker.financial_data,
+                   ticker.summary_detail):
+        if not isinstance(module, dict):
+            return False
+
+    symbol_modules = ticker.all_modules.get(symbol)
+    return not isinstance(symbol_modules, dict) or \
+        all(isinstance(symbol_modules.get(module, {}), dict)
+            for module in get_required_modules())
+
+
+def is_cacheable_ticker(ticker: TickerMock, symbol: str) -> bool:
+    """Validates if the ticker fetched can be kept on the cache, the errors and the
+    throttling of yahoo are not kept so the ticker is fetched again on the next run
+
+    :param ticker: Ticker of the symbol
+    :type ticker: TickerMock
+    :param symbol: Ticker symbol
+    :type symbol: str
+    :return: Boolean with the result of the validation
+    :rtype: bool
+    """
+    return get_ticker_outcome(ticker, symbol) == SUCCESS and \
+        valid_recommendation_trend(ticker, symbol)
+
+
+def _slice_module(module: Union[dict, str], symbol: str) -> Union[dict, str]:
+    """Keeps only the entry of the symbol on a module returned by yahooquery, the error
+    of a request that could not be read is kept as the error of the symbol"""
+    if not isinstance(module, dict):
+        return module
+
+    if symbol not in module:
+        return {symbol: module['error']} if isinstance(module.get('error'), str) else {}
+
+    return {symbol: module[symbol]}
+
+
+def _extract_module(modules: dict, module: str) -> dict:
+    """Returns one module of every symbol from the result of Ticker.get_modules"""
+    return {symbol: symbol_modules if isinstance(symbol_modules, str)
+            else symbol_modules.get(module, {})
+            for symbol, symbol_modules in modules.items()}
+
+
+def _build_recommendation_trend(modules: dict) -> pandas.DataFrame:
+    """Builds the recommendation trend dataframe, indexed by symbol and row as the
+    yahooquery property, from the result of Ticker.get_modules"""
+    trends = {}
+    for symbol, symbol_modules in modules.items():
+        if not isinstance(symbol_modules, dict):
+            continue
+
+        recommendation_trend = symbol_modules.get('recommendationTrend')
+        if isinstance(recommendation_trend, dict) and recommendation_trend.get('trend'):
+            trends[symbol] = pandas.DataFrame(recommendation_trend['trend'])
+
+    if not trends:
+        return pandas.DataFrame()
+
+    return pandas.concat(trends, names=['symbol', 'row'])
+
+
+def _slice_recommendation_trend(recommendation_trend: pandas.DataFrame,
+                                symbol: str) -> pandas.DataFrame:
+    """Keeps only the rows of the symbol on the recommendation trend dataframe"""
+    if not isinstance(recommendation_trend, pandas.DataFrame):
+        return recommendation_trend
+
+    index = recommendation_trend.index
+    if not isinstance(index, pandas.MultiIndex):
+        return recommendation_trend
+
+    if symbol not in index.get_level_values(0):
+        return pandas.DataFrame()
+
+    return recommendation_trend.loc[[symbol]]
+
+
+def _as_module(module) -> dict:
+    """Returns the module or an empty one when yahoo answered an error message"""
+    return module if isinstance(module, dict) else {}
+
+
+def _as_number(value) -> float:
+    """Scalar counterpart of valuation._as_float for the per-ticker checks, missing or
+    non numeric values are considered as zero"""
+    if isinstance(value, numbers.Real) and not math.isnan(value):
+        return float(value)
+
+    return 0.0
+
+
 class TickerInfoBuilder:
-    """Class to build the TickerInfo object"""
-    def __init__(self, ticker: TickerMock, symbol: str, logger: logging.Logger) -> None:
+    """Class to build the TickerInfo object
+
+    :param ticker: Ticker object
+    :type ticker: TickerMock
+    :param symbol: Ticker symbol
+    :type symbol: str
+    :param logger: Logger object
+    :type logger: logging.Logger
+    :param keep_raw_modules: Keeps the yahoo modules on TickerInfo.raw_modules for
+        debugging, defaults to False
+    :type keep_raw_modules: bool, optional
+    """
+    def __init__(self, ticker: TickerMock, symbol: str, logger: logging.Logger,
+                 keep_raw_modules: bool = False) -> None:
         self.ticker = ticker
         self.symbol = symbol
         self.logger = logger
+        self.keep_raw_modules = keep_raw_modules
+        self.modules: Union[TickerModules, None] = None
 
     def build(self) -> TickerInfo:
-        """Builds the TickerInfo object
+        """Builds the TickerInfo object, each yahoo module is resolved only once and
+        all the fields are extracted from the resolved modules
 
         :return: Returns the TickerInfo object
         :rtype: TickerInfo
         """
+        return self.complete(self.build_screening())
+
+    def build_screening(self) -> TickerInfo:
+        """Builds a TickerInfo with only the fields used by the cheap rejection criteria
+        (modules found, industry, ebit and market cap), the remaining fields stay None
+        until the TickerInfo is completed. The yahoo modules are resolved here and kept for
+        complete
+
+        :return: Returns the partial TickerInfo object
+        :rtype: TickerInfo
+        """
+        self.modules = self.resolve_modules()
+        asset_profile = self.modules.asset_profile
+
         ticker_info = TickerInfo(
-            all_modules_found=self.valid_all_modules(),
+            all_modules_found=self.modules.all_modules != {} and
+            not isinstance(asset_profile, str),
+            industry=self.extract_industry(asset_profile),
+            ebit=self.extract_ebit(self.modules.all_modules),
+            market_cap=self.modules.price.get('marketCap', 0),
+            total_cash=None,
+            total_debt=None,
+            current_price=None,
+            dividend_yield=None,
+            long_name=None,
+            short_name=None,
+            regular_market_time=None,
+            shares_outstanding=None,
+            total_stockholder_equity=None,
+            recommendation_trend=None,
+            raw_modules=None
+        )
+        return ticker_info
+
+    def complete(self, ticker_info: TickerInfo) -> TickerInfo:
+        """Fills the fields left by build_screening from the modules it resolved,
+        including the recommendation trend sum
+
+        :param ticker_info: TickerInfo returned by build_screening
+        :type ticker_info: TickerInfo
+        :return: Returns the same TickerInfo object completed
+        :rtype: TickerInfo
+        """
+        modules = self.modules or self.resolve_modules()
+        price = modules.price
+        financial_data = modules.financial_data
+
+        ticker_info.total_cash = financial_data.get('totalCash', 0)
+        ticker_info.total_debt = financial_data.get('totalDebt', 0)
+        ticker_info.current_price = financial_data.get('currentPrice', 0)
+        ticker_info.dividend_yield = self.extract_dividend_yield(modules.summary_detail)
+        ticker_info.long_name = price.get('longName', '')
+        ticker_info.short_name = price.get('shortName', '')
+        ticker_info.regular_market_time = price.get('regularMarketTime', 0)
+        ticker_info.shares_outstanding = self.extract_shares_outstanding(modules.key_statistics)
+        ticker_info.total_stockholder_equity = self.extract_total_stockholder_equity(
+            modules.balance_sheet)
+        ticker_info.recommendation_trend = self.get_recomendation_trend()
+        ticker_info.raw_modules = modules if self.keep_raw_modules else None
+
+        return ticker_info
+
+    def resolve_modules(self) -> TickerModules:
+        """Resolves once each yahoo module of the symbol
+
+        :return: Returns the resolved modules
+        :rtype: TickerModules
+        """
+        all_modules = self.get_all_modules()
+        return TickerModules(
+            all_modules=all_modules,
             asset_profile=self.get_asset_profile(),
             financial_data=self.get_financial_data(),
-            ticker_price=self.get_ticker_price(),
-            industry=self.get_industry(),
             summary_detail=self.get_summary_detail(),
-            balance_sheet=self.get_balance_sheet(),
-            ebit=self.get_ebit(),
-            key_statistics=self.get_key_statistics(),
-            recommendation_trend=self.get_recomendation_trend(),
-            market_cap=self.get_market_cap(),
-            total_cash=self.get_total_cash(),
-            dividend_yield=self.get_dividend_yield(),
-            current_price=self.get_current_price(),
-            long_name=self.get_long_name(),
-            short_name=self.get_short_name(),
-            regular_market_time=self.get_regular_market_time(),
-            shares_outstanding=self.get_shares_outstanding(),
-            total_stockholder_equity=self.get_total_stockholder_equity(),
-            total_debt=self.get_total_debt()
+            price=_as_module(all_modules.get('price')),
+            key_statistics=_as_module(all_modules.get('defaultKeyStatistics')),
+            balance_sheet=_as_module(all_modules.get('balanceSheetHistory'))
         )
-        return ticker_info
 
     def set_ticker(self, ticker: yahooquery.Ticker):
         """Set Builder ticker
@@ -122,11 +706,7 @@ class TickerInfoBuilder:
         :return: Returns the all modules
         :rtype: dict
         """
-        all_modules = self.ticker.all_modules.get(self.symbol, {})
-        if isinstance(all_modules, str):
-            return {}
-
-        return all_modules
+        return _as_module(_as_module(self.ticker.all_modules).get(self.symbol))
 
     def get_industry(self) -> list:
         """Fill the variable industry with information from the dict all_modules
@@ -136,7 +716,11 @@ class TickerInfoBuilder:
         :return: Returns the industry
         :rtype: list
         """
-        asset_profile = self.get_asset_profile()
+        return self.extract_industry(self.get_asset_profile())
+
+    @staticmethod
+    def extract_industry(asset_profile: Union[dict, str]) -> list:
+        """Returns the industry from the asset profile module"""
         if isinstance(asset_profile, str):
             return []
 
@@ -150,6 +734,9 @@ class TickerInfoBuilder:
         :return: Returns the asset profile
         :rtype: dict
         """
+        if not isinstance(self.ticker.asset_profile, dict):
+            return self.ticker.asset_profile
+
         return self.ticker.asset_profile.get(self.symbol, {})
 
     def get_ticker_price(self) -> dict:
@@ -170,11 +757,7 @@ class TickerInfoBuilder:
         :return: Returns the financial data
         :rtype: dict
         """
-        financial_data = self.ticker.financial_data.get(self.symbol, {})
-        if isinstance(financial_data, str):
-            return {}
-
-        return financial_data
+        return _as_module(_as_module(self.ticker.financial_data).get(self.symbol))
 
     def get_dividend_yield(self) -> float:
         """Fill dividend yield information
@@ -184,7 +767,11 @@ class TickerInfoBuilder:
         :return: Returns the dividend yield
         :rtype: float
         """
-        summary_detail = self.get_summary_detail()
+        return self.extract_dividend_yield(self.get_summary_detail())
+
+    @staticmethod
+    def extract_dividend_yield(summary_detail: dict) -> float:
+        """Returns the dividend yield in percentage from the summary detail module"""
         dividend_yield = summary_detail.get('dividendYield')
         if not isinstance(dividend_yield, float):
             dividend_yield = 0.0
@@ -223,10 +810,11 @@ class TickerInfoBuilder:
         if isinstance(self.ticker.summary_detail, str):
             return {}
 
-        if isinstance(self.ticker.summary_detail.get(self.symbol, {}), str):
+        summary_detail = self.ticker.summary_detail.get(self.symbol, {})
+        if isinstance(summary_detail, str):
             return {}
 
-        return self.ticker.summary_detail.get(self.symbol, {})
+        return summary_detail
 
     def get_recomendation_trend(self) -> RecomenationTrend:
         """Returns a RecomenationTrend with the information of the number of
@@ -245,7 +833,8 @@ class TickerInfoBuilder:
 
             return RecomenationTrend((strong_buy + buy), (sell + strong_sell))
         except (TypeError, KeyError):
-            self.logger.warning(f'Error on {self.symbol} on get_recomendation_trend')
+            self.logger.warning('Error on %s on get_recomendation_trend', self.symbol,
+                                extra={'ticker': self.symbol})
             return RecomenationTrend(0, 0)
 
     def get_ebit(self) -> float:
@@ -256,8 +845,12 @@ class TickerInfoBuilder:
         :return: Returns the ebit
         :rtype: float
         """
-        income_statement_history = self.get_all_modules().\
-            get('incomeStatementHistory', {})
+        return self.extract_ebit(self.get_all_modules())
+
+    @staticmethod
+    def extract_ebit(all_modules: dict) -> float:
+        """Returns the ebit of the last income statement from the all modules dict"""
+        income_statement_history = _as_module(all_modules.get('incomeStatementHistory'))
         income_statement_history_quarterly = income_statement_history.get(
             'incomeStatementHistoryQuarterly', {})
 
@@ -283,8 +876,7 @@ class TickerInfoBuilder:
         :return: Returns the market cap
         :rtype: float
         """
-        market_cap = self.get_all_modules().get('price', {}).get('marketCap', 0)
-        return market_cap
+        return self.get_ticker_price().get('marketCap', 0)
 
     def get_total_cash(self) -> float:
         """Fills variable total_cash
@@ -294,11 +886,7 @@ class TickerInfoBuilder:
         :return: Returns the total cash
         :rtype: float
         """
-        financial_data = self.get_financial_data()
-        if isinstance(financial_data, str):
-            return 0
-
-        return financial_data.get('totalCash', 0)
+        return self.get_financial_data().get('totalCash', 0)
 
     def get_current_price(self) -> float:
         """Fills variable current_price
@@ -308,11 +896,7 @@ class TickerInfoBuilder:
         :return: Returns the current price
         :rtype: float
         """
-        financial_data = self.get_financial_data()
-        if isinstance(financial_data, str):
-            return 0
-
-        return financial_data.get('currentPrice', 0)
+        return self.get_financial_data().get('currentPrice', 0)
 
     def get_total_debt(self) -> float:
         """Fills variable total_debt
@@ -361,11 +945,15 @@ class TickerInfoBuilder:
         :return: Returns the shares outstanding
         :rtype: str
         """
-        return \
-            self.get_key_statistics().get(
-                'sharesOutstanding',
-                self.get_key_statistics().get('impliedSharesOutstanding', 0)
-            )
+        return self.extract_shares_outstanding(self.get_key_statistics())
+
+    @staticmethod
+    def extract_shares_outstanding(key_statistics: dict) -> float:
+        """Returns the shares outstanding from the key statistics module"""
+        if 'sharesOutstanding' in key_statistics:
+            return key_statistics['sharesOutstanding']
+
+        return key_statistics.get('impliedSharesOutstanding', 0)
 
     def get_total_stockholder_equity(self) -> int:
         """Fills variable total_stockholder_equity
@@ -375,7 +963,12 @@ class TickerInfoBuilder:
         :return: Returns the total stockholder equity
         :rtype: int
         """
-        balance_sheet_statements = self.get_balance_sheet().get('balanceSheetStatements', [])
+        return self.extract_total_stockholder_equity(self.get_balance_sheet())
+
+    @staticmethod
+    def extract_total_stockholder_equity(balance_sheet: dict) -> int:
+        """Returns the total stockholder equity of the last balance sheet statement"""
+        balance_sheet_statements = balance_sheet.get('balanceSheetStatements', [])
         if not balance_sheet_statements:
             return 0
 
@@ -393,69 +986,92 @@ class MagicFormula():
     :type ebit_min: int, optional
     :param market_cap_min: Minimun market cap for the company, defaults to 0
     :type market_cap_min: int, optional
+    :param cache: Cache backend, defaults to a PickleCacheBackend on cache/ created on
+        the first use
+    :type cache: magic_formula.cache.CacheBackend, optional
+    :param keep_raw_modules: Keeps the yahoo modules on ticker_info.raw_modules for
+        debugging, defaults to False
+    :type keep_raw_modules: bool, optional
+    :param modules: QuoteSummary modules requested when the ticker is not on the cache,
+        None requests all_modules and the separate modules, defaults to None
+    :type modules: List[str], optional
+    :param base_url: Base url of the yahoo api, defaults to YAHOO_URL
+    :type base_url: str, optional
     """
     def __init__(self, symbol: str, logger: logging.Logger,
-                 ebit_min: int = 1, market_cap_min: int = 0) -> None:
+                 ebit_min: int = 1, market_cap_min: int = 0, cache=None,
+                 keep_raw_modules: bool = False, modules: List[str] = None,
+                 base_url: str = YAHOO_URL) -> None:
         self.symbol = symbol
         self.logger = logger
+        self._cache = cache
+        self.keep_raw_modules = keep_raw_modules
+        self.modules = modules
+        self.base_url = base_url
+        self.timings: Dict[str, float] = {}
         self.ticker_info: TickerInfo = None
+        self.rejection_reason: RejectionReason = None
         self.ebit_min = ebit_min
         self.market_cap_min = market_cap_min
         self.dividend_yield = 0
         self.tev = 0
-        self.file_ttl = datetime.timedelta(days=1)
-
-    def save_ticker_picle(self, ticker: TickerMock):
-        if not os.path.exists('cache'):
-            os.makedirs('cache')
-
-        with open(f"cache/{self.symbol}.cache", "bw") as file:
-            pickle.dump(ticker, file)
-
-    def get_ticker_file(self) -> Union[TickerMock, None]:
-        if not os.path.exists('cache'):
-            os.makedirs('cache')
-
-        file_name = f"cache/{self.symbol}.cache"
-        if not os.path.exists(file_name):
-            return None
-
-        if (datetime.datetime.now() - datetime.datetime.fromtimestamp(os.path.getctime(file_name))).days > self.file_ttl.days:
-            return None
-
-        with open(file_name, "rb") as file:
-            ticker_info = pickle.load(file)
-        return ticker_info
-
-    def get_ticker_info(self) -> Union[TickerMock, None]:
-        """Returns the ticker info
 
+    @property
+    def cache(self):
+        """Cache backend, the default PickleCacheBackend is only created when the ticker
+        is not informed to get_ticker_info, so its folder is not created by the workers
+        that build the tickers already fetched"""
+        if self._cache is None:
+            # cache imports TickerMock from this module
+            from magic_formula.cache import PickleCacheBackend  # pylint: disable=import-outside-toplevel
+            self._cache = PickleCacheBackend()
+
+        return self._cache
+
+    def get_ticker_info(self, ticker: TickerMock = None) -> Union[TickerMock, None]:
+        """Returns the ticker info, or None when the ticker does not pass on the
+        screening, in this case the reason is kept on rejection_reason and the expensive
+        fields are not extracted
+
+        :param ticker: Ticker already fetched by a TickerBatchFetcher, defaults to None
+        :type ticker: TickerMock, optional
         :return: Ticker info
         :rtype: yahooquery.Ticker
         """
-        # import ipdb; ipdb.set_trace()
-        ticker = self.get_ticker_file()
         if not ticker:
-            ticker_base = yahooquery.Ticker(self.symbol)
-            ticker = TickerMock()
-            ticker.all_modules = ticker_base.all_modules
-            ticker.asset_profile = ticker_base.asset_profile
-            ticker.financial_data = ticker_base.financial_data
-            ticker.summary_detail = ticker_base.summary_detail
-            ticker.recommendation_trend = ticker_base.recommendation_trend
-
-            self.save_ticker_picle(ticker)
+            start = time.perf_counter()
+            ticker = self.cache.get(self.symbol, self.modules)
+            if ticker:
+                self.timings['cache_read'] = time.perf_counter() - start
+        if not ticker:
+            start = time.perf_counter()
+            ticker_base = get_yahoo_ticker(self.symbol, self.base_url)
+            if self.modules is not None:
+                ticker = split_ticker_batch(build_modules_batch(
+                    ticker_base.get_modules(self.modules)), [self.symbol])[self.symbol]
+            else:
+                ticker = TickerMock()
+                ticker.all_modules = ticker_base.all_modules
+                ticker.asset_profile = ticker_base.asset_profile
+                ticker.financial_data = ticker_base.financial_data
+                ticker.summary_detail = ticker_base.summary_detail
+                ticker.recommendation_trend = ticker_base.recommendation_trend
+            self.timings['fetch'] = time.perf_counter() - start
+
+            if not is_cacheable_ticker(ticker, self.symbol):
+                self.logger.debug('%s: not cached, the fetch was not complete', self.symbol,
+                                  extra={'ticker': self.symbol})
+            else:
+                self.cache.set(self.symbol, ticker, self.modules)
 
         self.fill_ticker_info(ticker)
 
-        if isinstance(self.ticker_info.asset_profile, str):
-            return None
-
-        if not self.valid_information_dict():
-            self.logger.debug(f"{self.symbol}: information not valid")
+        if self.rejection_reason is not None:
+            self.logger.debug('%s: %s', self.symbol, self.rejection_reason.value,
+                              extra={'ticker': self.symbol})
             return None
 
-        self.logger.debug(self.symbol)
+        self.logger.debug(self.symbol, extra={'ticker': self.symbol})
 
         return ticker
 
@@ -465,32 +1081,43 @@ class MagicFormula():
         :return: Returns True if the ticker data is valid
         :rtype: bool
         """
-        if not self.valid_information_dict():
-            self.logger.debug(f"{self.symbol}: information not valid dictionary")
-            return False
-
-        if not self.valid_industry():
-            self.logger.debug(f"{self.symbol}: not a valid industry")
-            return False
-
-        if not self.valid_ebit():
-            self.logger.debug(f"{self.symbol}: invalid ebit")
+        if not self.valid_ticker_info():
+            self.logger.debug('%s: invalid ticker info', self.symbol, extra={'ticker': self.symbol})
+            self.rejection_reason = self.rejection_reason or RejectionReason.INVALID_TICKER_INFO
             return False
 
-        if not self.valid_ticker_info():
-            self.logger.debug(f"{self.symbol}: invalid ticker info")
+        self.rejection_reason = self.get_screening_rejection()
+        if self.rejection_reason is not None:
+            self.logger.debug('%s: %s', self.symbol, self.rejection_reason.value,
+                              extra={'ticker': self.symbol})
             return False
 
         return True
 
     def fill_ticker_info(self, ticker: TickerMock) -> None:
-        """Fills the variable ticker_info
+        """Fills the variable ticker_info, the cheap criteria are screened first with
+        scalar checks and the remaining fields are only extracted for the tickers that
+        pass on them. The tickers whose modules are yahoo error messages are rejected by
+        INVALID_MODULES without a ticker_info
 
         :param ticker: Ticker object
         :type ticker: yahooquery.Ticker
         """
-        builder = TickerInfoBuilder(symbol=self.symbol, ticker=ticker, logger=self.logger)
-        self.ticker_info: TickerInfo = builder.build()
+        if not valid_ticker_modules(ticker, self.symbol):
+            self.rejection_reason = RejectionReason.INVALID_MODULES
+            return
+
+        start = time.perf_counter()
+        builder = TickerInfoBuilder(symbol=self.symbol, ticker=ticker, logger=self.logger,
+                                    keep_raw_modules=self.keep_raw_modules)
+        self.ticker_info: TickerInfo = builder.build_screening()
+        validation_start = time.perf_counter()
+        self.rejection_reason = self.get_screening_rejection()
+        self.timings['validation'] = time.perf_counter() - validation_start
+        if self.rejection_reason is None:
+            builder.complete(self.ticker_info)
+
+        self.timings['build'] = time.perf_counter() - start - self.timings['validation']
 
     def valid_ticker_info(self) -> bool:
         """Validates if the variable ticker_info has informations
@@ -508,6 +1135,27 @@ class MagicFormula():
         """
         return self.ticker_info.all_modules_found
 
+    def get_screening_rejection(self) -> Union[RejectionReason, None]:
+        """Validates the fields of the screening, the modules found, the industry, the
+        ebit and the market cap
+
+        :return: Reason for the ticker to be dropped or None when it is valid
+        :rtype: Union[RejectionReason, None]
+        """
+        if not self.valid_information_dict():
+            return RejectionReason.INVALID_INFORMATION
+
+        if not self.valid_industry():
+            return RejectionReason.INVALID_INDUSTRY
+
+        if not self.valid_ebit():
+            return RejectionReason.INVALID_EBIT
+
+        if not self.valid_market_cap():
+            return RejectionReason.INVALID_MARKET_CAP
+
+        return None
+
     def valid_industry(self) -> bool:
         """Validates if the industry of the company is valid
         for this method of calculation
@@ -515,7 +1163,7 @@ class MagicFormula():
         :return: Boolean with the result of the validation
         :rtype: bool
         """
-        return self.ticker_info.industry not in ['Insurance—Diversified', 'Banks—Regional']
+        return self.ticker_info.industry not in valuation.INVALID_INDUSTRIES
 
     def valid_ebit(self) -> bool:
         """Validates if the variable ebit is valid
@@ -523,7 +1171,7 @@ class MagicFormula():
         :return: Boolean with the result of the validation
         :rtype: bool
         """
-        return self.ticker_info.ebit >= self.ebit_min
+        return _as_number(self.ticker_info.ebit) >= self.ebit_min
 
     def valid_market_cap(self) -> bool:
         """Validates if the variable market_cap is valid
@@ -531,7 +1179,7 @@ class MagicFormula():
         :return: Boolean with the result of the validation
         :rtype: bool
         """
-        return self.ticker_info.market_cap >= self.market_cap_min
+        return _as_number(self.ticker_info.market_cap) >= self.market_cap_min
 
     def calculate_tev(self) -> float:
         """Calcullates the current tev (total enterprise value) and returns it
@@ -539,7 +1187,7 @@ class MagicFormula():
         :return: Total enterpris value
         :rtype: float
         """
-        self.tev = self.ticker_info.market_cap + self.calculate_liquid_debt()
+        self.tev = _as_number(self.ticker_info.market_cap) + self.calculate_liquid_debt()
         return self.tev
 
     def calculate_liquid_debt(self) -> float:
@@ -548,7 +1196,8 @@ class MagicFormula():
         :return: Liquid debt
         :rtype: float
         """
-        return max(self.ticker_info.total_debt - self.ticker_info.total_cash, 0)
+        return max(_as_number(self.ticker_info.total_debt) -
+                   _as_number(self.ticker_info.total_cash), 0.0)
 
     def calculate_earning_yield(self) -> float:
         """Calculates the current earning yield of the company
@@ -556,4 +1205,7 @@ class MagicFormula():
         :return: Current earning yeld
         :rtype: float
         """
-        return round((self.ticker_info.ebit / self.tev), 2)
+        if not self.tev:
+            return math.nan
+
+        return round(_as_number(self.ticker_info.ebit) / self.tev, 2)
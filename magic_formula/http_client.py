@@ -0,0 +1,260 @@
+"""Module with the http client shared by the status invest fetchers"""
+from __future__ import absolute_import
+
+import logging
+import random
+import threading
+import time
+from typing import Iterable, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests_futures.sessions import FuturesSession
+
+from magic_formula.instrumentation import add_counters
+from magic_formula.instrumentation import get_run_report
+
+
+HEADERS = {
+    'authority': 'statusinvest.com.br',
+    'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9',
+    'accept-language': 'pt-BR,pt;q=0.9,en-US;q=0.8,en;q=0.7',
+    'cache-control': 'max-age=0',
+    'sec-ch-ua': '"Google Chrome";v="107", "Chromium";v="107", "Not=A?Brand";v="24"',
+    'sec-ch-ua-mobile': '?0',
+    'sec-ch-ua-platform': '"macOS"',
+    'sec-fetch-dest': 'document',
+    'sec-fetch-mode': 'navigate',
+    'sec-fetch-site': 'none',
+    'sec-fetch-user': '?1',
+    'upgrade-insecure-requests': '1',
+    'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/107.0.0.0 Safari/537.36'
+}
+DEFAULT_TIMEOUT = (5.0, 30.0)
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 30.0
+DEFAULT_MAX_CONNECTIONS = 8
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+YAHOO_HOSTS = ('finance.yahoo.com', 'query1.finance.yahoo.com', 'query2.finance.yahoo.com')
+
+_DEFAULT_CLIENT = None
+_DEFAULT_CLIENT_LOCK = threading.Lock()
+
+
+class HttpClient:
+    """Http client with a pooled keep-alive session, timeouts, retries with jittered
+    exponential backoff and a cap of concurrent requests
+
+    :param headers: Headers sent on every request, defaults to HEADERS
+    :type headers: dict, optional
+    :param timeout: Connect and read timeouts in seconds, defaults to (5, 30)
+    :type timeout: Union[float, Tuple[float, float]], optional
+    :param retries: Number of retries after the first attempt, defaults to 3
+    :type retries: int, optional
+    :param backoff: Base of the exponential backoff in seconds, defaults to 0.5
+    :type backoff: float, optional
+    :param max_backoff: Maximum wait between two attempts in seconds, defaults to 30
+    :type max_backoff: float, optional
+    :param max_connections: Maximum concurrent requests and size of the connection
+        pool, defaults to 8
+    :type max_connections: int, optional
+    :param logger: Logger object, defaults to the module logger
+    :type logger: logging.Logger, optional
+    """
+    def __init__(self, headers: dict = None,
+                 timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT,
+                 retries: int = DEFAULT_RETRIES, backoff: float = DEFAULT_BACKOFF,
+                 max_backoff: float = DEFAULT_MAX_BACKOFF,
+                 max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 logger: logging.Logger = None) -> None:
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_connections = max_connections
+        self.logger = logger or logging.getLogger(__name__)
+        self.semaphore = threading.BoundedSemaphore(max_connections)
+
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS if headers is None else headers)
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Makes a GET request retrying on connection errors, timeouts and on the
+        status of RETRY_STATUS, the responses discarded are closed so their connections
+        go back to the pool. A streamed response keeps its slot of the concurrency cap
+        until it is closed, so the caller must close it once the body is consumed
+
+        :param url: Url of the request
+        :type url: str
+        :raises requests.HTTPError: When the last attempt returns an error status
+        :raises requests.RequestException: When the last attempt fails to connect
+        :return: Response of the request
+        :rtype: requests.Response
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.retries + 1):
+            self.semaphore.acquire()
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                self.semaphore.release()
+                if attempt == self.retries:
+                    raise
+                self.logger.warning(f'Request to {url} failed: {error}, '
+                                    f'attempt {attempt + 1} of {self.retries + 1}')
+                self.wait(attempt)
+                continue
+            except BaseException:
+                self.semaphore.release()
+                raise
+
+            if kwargs.get('stream'):
+                self.release_on_close(response)
+            else:
+                self.semaphore.release()
+
+            if response.status_code in RETRY_STATUS and attempt < self.retries:
+                response.close()
+                self.logger.warning(f'Request to {url} returned {response.status_code}, '
+                                    f'attempt {attempt + 1} of {self.retries + 1}')
+                self.wait(attempt, response.headers.get('Retry-After'))
+                continue
+
+            try:
+                response.raise_for_status()
+            except requests.HTTPError:
+                response.close()
+                raise
+            if not kwargs.get('stream') and get_run_report() is not None:
+                add_counters(bytes_fetched=len(response.content))
+            return response
+
+        raise RuntimeError('unreachable')  # pragma: no cover
+
+    def release_on_close(self, response: requests.Response) -> None:
+        """Releases the slot of the concurrency cap of the streamed response on the first
+        close, which returns its connection to the pool"""
+        close = response.close
+        released = threading.Lock()
+
+        def close_and_release() -> None:
+            try:
+                close()
+            finally:
+                # only the first close gets the lock and releases the slot
+                if released.acquire(blocking=False):
+                    self.semaphore.release()
+
+        response.close = close_and_release
+
+    def wait(self, attempt: int, retry_after: str = None) -> None:
+        """Sleeps before the next attempt, respecting the Retry-After header when it
+        is informed in seconds, otherwise using a full jitter exponential backoff
+
+        :param attempt: Number of the failed attempt, starting at zero
+        :type attempt: int
+        :param retry_after: Value of the Retry-After header, defaults to None
+        :type retry_after: str, optional
+        """
+        time.sleep(self.get_backoff(attempt, retry_after))
+
+    def get_backoff(self, attempt: int, retry_after: str = None) -> float:
+        """Returns the seconds to wait before the next attempt"""
+        if retry_after is not None:
+            try:
+                return min(max(float(retry_after), 0), self.max_backoff)
+            except ValueError:
+                pass
+
+        return random.uniform(0, min(self.backoff * 2 ** attempt, self.max_backoff))
+
+    def close(self) -> None:
+        """Closes the pooled connections"""
+        self.session.close()
+
+
+class RedirectSession(requests.Session):
+    """Session that sends the requests of the hosts informed to another base url, keeping
+    the path and the query, used to point the yahooquery requests to a stand-in server
+
+    :param base_url: Scheme and host that receive the requests, e.g. http://127.0.0.1:8765
+    :type base_url: str
+    :param hosts: Hosts redirected, defaults to YAHOO_HOSTS
+    :type hosts: Iterable[str], optional
+    """
+    def __init__(self, base_url: str, hosts: Iterable[str] = YAHOO_HOSTS) -> None:
+        super().__init__()
+        self.base_url = urlsplit(base_url)
+        self.hosts = set(hosts)
+
+    def request(self, method: str, url: str, *args, **kwargs) -> requests.Response:
+        response = super().request(method, self.redirect(url), *args, **kwargs)
+        if get_run_report() is not None:
+            add_counters(bytes_fetched=len(response.content))
+        return response
+
+    def redirect(self, url: str) -> str:
+        """Returns the url with the scheme, host and path prefix of the base url when
+        its host is redirected"""
+        parts = urlsplit(url)
+        if parts.hostname not in self.hosts:
+            return url
+
+        return parts._replace(scheme=self.base_url.scheme, netloc=self.base_url.netloc,
+                              path=self.base_url.path.rstrip('/') + parts.path).geturl()
+
+
+def count_session_bytes(session) -> None:
+    """Makes the session add the size of each response to bytes_fetched, used on the
+    sessions built by yahooquery for the real yahoo url, which does not go through a
+    RedirectSession. The requests of a FuturesSession are counted on its inner session
+
+    :param session: Session of a yahooquery.Ticker, None is ignored
+    :type session: Union[requests.Session, FuturesSession, None]
+    """
+    if isinstance(session, FuturesSession) and session.session is not None:
+        session = session.session
+    if session is None:
+        return
+
+    request = session.request
+
+    def counted_request(*args, **kwargs):
+        response = request(*args, **kwargs)
+        if get_run_report() is not None:
+            add_counters(bytes_fetched=len(response.content))
+        return response
+
+    session.request = counted_request
+
+
+def get_http_client() -> HttpClient:
+    """Returns the http client shared by the fetchers, created on the first call
+
+    :return: Shared http client
+    :rtype: HttpClient
+    """
+    global _DEFAULT_CLIENT
+    with _DEFAULT_CLIENT_LOCK:
+        if _DEFAULT_CLIENT is None:
+            _DEFAULT_CLIENT = HttpClient()
+
+        return _DEFAULT_CLIENT
+
+
+def set_http_client(client: Union[HttpClient, None]) -> None:
+    """Replaces the shared http client, None makes the next call of get_http_client
+    create a new default one
+
+    :param client: Http client to be shared
+    :type client: Union[HttpClient, None]
+    """
+    global _DEFAULT_CLIENT
+    with _DEFAULT_CLIENT_LOCK:
+        _DEFAULT_CLIENT = client
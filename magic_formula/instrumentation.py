@@ -0,0 +1,178 @@
+"""Module with the instrumentation of the pipeline stages, it records the wall and cpu
+time, the items processed, the cache hits and misses and the bytes fetched of each stage
+and keeps them on a machine-readable run report"""
+from __future__ import absolute_import
+
+import datetime
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextlib import nullcontext
+from dataclasses import asdict
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Union
+
+
+STAGE_COUNTERS = ('items', 'cache_hits', 'cache_misses', 'bytes_fetched')
+
+_ACTIVE_REPORT = None
+
+
+@dataclass
+class StageMetrics:
+    """Metrics of one stage, times in seconds, parent is the stage that was running when
+    it started"""
+    name: str
+    parent: Union[str, None] = None
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+    items: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    bytes_fetched: int = 0
+
+
+class RunReport:
+    """Report of one run with the metrics of each stage in the order they started, the
+    counters informed by add_counters go to the innermost stage running at the moment,
+    whatever the thread that informs them
+
+    :param metadata: Information of the run kept on the report, defaults to None
+    :type metadata: dict, optional
+    :param profiler: Profiler of the stages, a magic_formula.profiling.StageProfiler,
+        defaults to None
+    :type profiler: StageProfiler, optional
+    """
+    def __init__(self, metadata: dict = None, profiler=None) -> None:
+        self.metadata = metadata or {}
+        self.profiler = profiler
+        self.started_at = datetime.datetime.now()
+        self.stages: List[StageMetrics] = []
+        self.active_stage: Union[StageMetrics, None] = None
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageMetrics]:
+        """Measures the block as a stage, the stage is kept on the report even when the
+        block raises. A stage started inside another one is kept as its child and its
+        time is not added again to the totals of the run
+
+        :param name: Name of the stage
+        :type name: str
+        :return: Metrics of the stage, the items can be set by the block
+        :rtype: Iterator[StageMetrics]
+        """
+        with self.lock:
+            previous_stage = self.active_stage
+            metrics = StageMetrics(name, previous_stage.name if previous_stage else None)
+            self.active_stage = metrics
+            self.stages.append(metrics)
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            with self.profiler.profile(name) if self.profiler else nullcontext():
+                yield metrics
+        finally:
+            metrics.wall_time = time.perf_counter() - wall_start
+            metrics.cpu_time = time.process_time() - cpu_start
+            with self.lock:
+                self.active_stage = previous_stage
+
+    def add_counters(self, **counters: int) -> None:
+        """Adds the counters of STAGE_COUNTERS to the stage running, ignored when no
+        stage is running"""
+        with self.lock:
+            if self.active_stage is None:
+                return
+
+            for counter, value in counters.items():
+                if counter not in STAGE_COUNTERS:
+                    raise ValueError(f'Counter {counter} not supported, '
+                                     f'supported counters: {STAGE_COUNTERS}')
+                setattr(self.active_stage, counter,
+                        getattr(self.active_stage, counter) + value)
+
+    def to_dict(self) -> dict:
+        """Returns the report as a dict serializable to json"""
+        top_stages = [stage for stage in self.stages if stage.parent is None]
+        return {
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'wall_time': sum(stage.wall_time for stage in top_stages),
+            'cpu_time': sum(stage.cpu_time for stage in top_stages),
+            'metadata': self.metadata,
+            'stages': [asdict(stage) for stage in self.stages],
+        }
+
+    def write(self, file_name: str) -> None:
+        """Writes the report on a json file
+
+        :param file_name: Name of the json file
+        :type file_name: str
+        """
+        with open(file_name, 'w', encoding='UTF-8') as file:
+            json.dump(self.to_dict(), file, indent=2, default=str)
+
+    def format_table(self) -> str:
+        """Returns the summary table of the stages"""
+        lines = [f'{"stage":<28}{"wall s":>9}{"cpu s":>9}{"items":>8}'
+                 f'{"hits":>7}{"misses":>8}{"KiB":>10}']
+        for stage in self.stages:
+            name = stage.name if stage.parent is None else f'  {stage.name}'
+            lines.append(f'{name:<28}{stage.wall_time:>9.3f}{stage.cpu_time:>9.3f}'
+                         f'{stage.items:>8}{stage.cache_hits:>7}{stage.cache_misses:>8}'
+                         f'{stage.bytes_fetched / 1024:>10.1f}')
+
+        report = self.to_dict()
+        lines.append(f'{"total":<28}{report["wall_time"]:>9.3f}{report["cpu_time"]:>9.3f}')
+        return '\n'.join(lines)
+
+
+def get_run_report() -> Union[RunReport, None]:
+    """Returns the report of the run, None when the run is not instrumented"""
+    return _ACTIVE_REPORT
+
+
+def set_run_report(report: Union[RunReport, None]) -> None:
+    """Replaces the report of the run, None stops the instrumentation
+
+    :param report: Report that receives the counters
+    :type report: Union[RunReport, None]
+    """
+    global _ACTIVE_REPORT
+    _ACTIVE_REPORT = report
+
+
+@contextmanager
+def run_stage(name: str) -> Iterator[StageMetrics]:
+    """Measures the block as a stage of the report of the run, the metrics are not kept
+    when the run is not instrumented
+
+    :param name: Name of the stage
+    :type name: str
+    :return: Metrics of the stage, the items can be set by the block
+    :rtype: Iterator[StageMetrics]
+    """
+    report = _ACTIVE_REPORT
+    if report is None:
+        yield StageMetrics(name)
+        return
+
+    with report.stage(name) as metrics:
+        yield metrics
+
+
+def add_counters(**counters: int) -> None:
+    """Adds the counters to the stage running on the report of the run, ignored when
+    the run is not instrumented"""
+    report = _ACTIVE_REPORT
+    if report is not None:
+        report.add_counters(**counters)
+
+
+def count_bytes(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Yields the chunks of a streamed response adding their size to bytes_fetched"""
+    for chunk in chunks:
+        add_counters(bytes_fetched=len(chunk))
+        yield chunk
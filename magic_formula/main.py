@@ -6,11 +6,14 @@ import logging
 import logging.handlers
 import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from concurrent.futures import ThreadPoolExecutor
 from concurrent.futures import as_completed
 from argparse import Namespace
+from dataclasses import dataclass
 from enum import Enum
-import math
+from typing import Dict, List, Union
 
 import numpy as np
 import pandas
@@ -19,11 +22,42 @@ from pandas import DataFrame
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
 
+from magic_formula.cache import CacheBackend
+from magic_formula.cache import decode_ticker_payload
+from magic_formula.cache import get_cache_backend
+from magic_formula.concurrency import AdaptiveConcurrencyController
+from magic_formula.concurrency import SUCCESS
 from magic_formula.config import get_config
 from magic_formula.config import get_arguments
+from magic_formula.config import TickerLogFilter
+from magic_formula.config import process_log_queue
 from magic_formula.config import set_logger
+from magic_formula.config import set_process_logger
+from magic_formula.config import stop_logger
 from magic_formula.core import MagicFormula
-from magic_formula.status_invest import get_ibrx_info
+from magic_formula.core import RejectionReason
+from magic_formula.core import TickerBatchFetcher
+from magic_formula.core import TickerMock
+from magic_formula.core import get_required_modules
+from magic_formula.core import get_ticker_outcome
+from magic_formula.core import is_cacheable_ticker
+from magic_formula.instrumentation import RunReport
+from magic_formula.instrumentation import add_counters
+from magic_formula.instrumentation import run_stage
+from magic_formula.instrumentation import set_run_report
+from magic_formula.metrics import TickerMetrics
+from magic_formula.metrics import count_outcome
+from magic_formula.metrics import get_ticker_metrics
+from magic_formula.metrics import observe_latency
+from magic_formula.metrics import record_concurrency
+from magic_formula.metrics import set_ticker_metrics
+from magic_formula.profiling import StageProfiler
+from magic_formula.ranking import calculate_magic_index
+from magic_formula.ranking import calculate_rank
+from magic_formula.ranking import select_top
+from magic_formula import valuation
+from magic_formula.valuation import evaluate_screener
+from magic_formula.status_invest import get_indexes_info
 from magic_formula.status_invest import get_ticker_roic_info
 
 
@@ -34,6 +68,25 @@ OUTPUT_PATH = os.path.join(os.getcwd(), 'output_files/')
 POSSIBLE_INDEXES = {'BRX100', 'IBOV', 'SMALL', 'IDIV',
                     'MLCX', 'IGCT', 'ITAG', 'IBRA', 'IGNM', 'IMAT', 'ALL'}
 FORMATS = {'EXCEL': 'xlsx', 'JSON': 'json'}
+PREFILTER_TOLERANCE = 0.2
+ADAPTIVE_INITIAL_LIMIT = 4
+FAILED_REASONS = (RejectionReason.INVALID_INFORMATION.value,
+                  RejectionReason.INVALID_MODULES.value,
+                  RejectionReason.PROCESSING_ERROR.value)
+YAHOO_ROW_FIELDS = (
+    'recommendation_trend', 'current_price', 'regular_market_time', 'market_cap',
+    'total_stockholder_equity', 'ebit', 'total_debt', 'total_cash', 'shares_outstanding',
+    'long_name', 'industry',
+)
+SCREENER_JOIN_COLUMNS = {
+    'roic_index': 'roic_index_number',
+    'roic': 'roic',
+    'vpa': 'vpa',
+    'lpa': 'lpa',
+    'p_l': 'p_l',
+    'p_vp': 'p_vp',
+    'dy': 'dividend_yield',
+}
 
 
 class DataframColums(Enum):
@@ -101,13 +154,52 @@ class DataframColums(Enum):
     ]
 
 
+@dataclass
+class TickerRow:
+    """Row of the process_tickers dataframe with the columns of PROCESS_TICKERS_COLUMNS,
+    the screener columns are filled by join_screener_info and earning_yield and
+    magic_index by the batch valuation"""
+    symbol: str
+    buy_recomendation: int
+    sell_recomendation: int
+    current_price: float
+    regular_market_time: str
+    market_cap: float
+    patrimonio_liquido: float
+    ebit: float
+    total_debt: float
+    total_cash: float
+    shares_outstanding: float
+    long_name: str
+    industry: str
+    roic_index_number: int = 0
+    roic: float = 0.0
+    dividend_yield: float = 0.0
+    vpa: float = 0.0
+    lpa: float = 0.0
+    p_l: float = 0.0
+    p_vp: float = 0.0
+    graham_vi: float = 0.0
+    graham_upside: float = 0.0
+    earning_yield: float = 0.0
+    magic_index: float = 0.0
+
+
+@dataclass
+class TickerResult:
+    """Result of the processing of one ticker, with the row or the reason it was dropped"""
+    symbol: str
+    row: Union[TickerRow, None] = None
+    rejection_reason: Union[RejectionReason, None] = None
+    timings: Union[Dict[str, float], None] = None
+
+
 def main() -> None:
     """Main method
 
     :return: None
     """
     # TODO: include the possibility of inform tickets and indexes on a file
-    global MAX_NUMBER_THREADS
     global OUTPUT_PATH
     options = get_arguments()
     if options.version:
@@ -128,32 +220,166 @@ def main() -> None:
         os.makedirs(OUTPUT_PATH)
 
     logger = logging.getLogger(__name__)
-    logger = set_logger(logger, log_level=options.log_level)
-    config = get_config()
+    ticker_filter = TickerLogFilter(options.log_sample, options.log_rate) \
+        if options.log_sample < 1 or options.log_rate else None
+    logger = set_logger(logger, log_level=options.log_level, queue_logging=options.log_queue,
+                        ticker_filter=ticker_filter)
+    try:
+        run_instrumented(options, logger)
+    finally:
+        stop_logger(logger)
 
-    roic_index_info = get_ticker_roic_info(
-        config['STATUS_INVEST_URL'].format('"')
-    )
 
-    stock_tickers, options.index = get_tickers_list(options, logger, config, roic_index_info)
+def run_instrumented(options: Namespace, logger: logging.Logger) -> None:
+    """Runs the pipeline with the run report and the ticker metrics, writing them at
+    the end
+
+    :param options: Arguments from command line
+    :type options: Namespace
+    :param logger: Logger object
+    :type logger: logging.Logger
+    """
+    config = get_config(options.config_file)
+    if options.yahoo_url is None:
+        options.yahoo_url = config['YAHOO_URL']
+
+    profiler = None
+    if options.profile or options.profile_tracemalloc:
+        profiler = StageProfiler(get_profile_folder(), cpu=options.profile,
+                                 memory=options.profile_tracemalloc)
+
+    report = RunReport({'version': __VERSION__, 'arguments': vars(options)}, profiler)
+    metrics = TickerMetrics()
+    set_run_report(report)
+    set_ticker_metrics(metrics)
+    try:
+        run_pipeline(options, logger, config, report)
+    finally:
+        set_run_report(None)
+        set_ticker_metrics(None)
+
+    report.metadata['ticker_metrics'] = metrics.summary()
+    log_ticker_metrics(metrics, logger)
+    if profiler:
+        report.metadata['profiles'] = profiler.summary()
+        log_profiles(profiler, logger)
+    if options.prometheus_file:
+        metrics.write_textfile(options.prometheus_file)
+        logger.info(f'Prometheus metrics written on {options.prometheus_file}')
+
+    report_file = get_report_file_name(options.index, options.format)
+    report.write(report_file)
+    logger.info(f'Run report written on {report_file}')
+    print(report.format_table())
+
+
+def get_profile_folder() -> str:
+    """Returns the folder of the profiling files of the run, inside the output folder"""
+    return os.path.join(OUTPUT_PATH,
+                        f'profile_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}')
+
+
+def log_profiles(profiler: StageProfiler, logger: logging.Logger) -> None:
+    """Logs the profiling files and the peak memory of the stages traced
+
+    :param profiler: Profiler of the stages
+    :type profiler: StageProfiler
+    :param logger: Logger object
+    :type logger: logging.Logger
+    """
+    logger.info(f'Profiling files written on {profiler.folder}')
+    for stage, result in profiler.summary().items():
+        if 'peak_memory' in result:
+            top_site = result['top_allocations'][0]['site'] if result['top_allocations'] \
+                else '-'
+            logger.info(f'Stage {stage} memory peak {result["peak_memory"] / 2 ** 20:.1f} MiB, '
+                        f'top allocation site {top_site}')
+
+
+def log_ticker_metrics(metrics: TickerMetrics, logger: logging.Logger) -> None:
+    """Logs the percentiles of each phase of the tickers, the slowest and the failed ones
+
+    :param metrics: Ticker metrics of the run
+    :type metrics: TickerMetrics
+    :param logger: Logger object
+    :type logger: logging.Logger
+    """
+    summary = metrics.summary()
+    for phase, latencies in summary['phases'].items():
+        if latencies['count']:
+            logger.info(f'Ticker {phase} latency of {latencies["count"]} tickers: '
+                        f'p50 {latencies["p50"]:.4f}s, p95 {latencies["p95"]:.4f}s, '
+                        f'p99 {latencies["p99"]:.4f}s')
+
+    slowest = ', '.join(f'{symbol} {seconds:.3f}s' for symbol, seconds in
+                        summary['slowest_tickers'][:5])
+    if slowest:
+        logger.info(f'Slowest tickers: {slowest}')
+    if summary['failed_tickers']:
+        logger.info(f'Failed tickers: {sorted(summary["failed_tickers"])}')
+
+
+def run_pipeline(options: Namespace, logger: logging.Logger, config: dict,
+                 report: RunReport) -> None:
+    """Runs the stages of the pipeline, each one measured on the report
+
+    :param options: Arguments from command line
+    :type options: Namespace
+    :param logger: Logger object
+    :type logger: logging.Logger
+    :param config: Config dict
+    :type config: dict
+    :param report: Report of the run
+    :type report: RunReport
+    """
+    global MAX_NUMBER_THREADS
+    with report.stage('get_ticker_roic_info') as stage:
+        roic_index_info = get_ticker_roic_info(
+            config['STATUS_INVEST_URL'].format('"'), page_size=options.screener_page_size
+        )
+        stage.items = len(roic_index_info)
+
+    with report.stage('get_tickers_list') as stage:
+        stock_tickers, options.index = get_tickers_list(options, logger, config,
+                                                        roic_index_info)
+        stage.items = len(stock_tickers)
 
     MAX_NUMBER_THREADS = options.threads
 
-    tickers_df = process_tickers(stock_tickers, roic_index_info, logger, options)
-    tickers_df = sort_dataframe(tickers_df, logger, options.roic_ignore)
+    with report.stage('process_tickers') as stage:
+        if options.source == 'STATUSINVEST':
+            tickers_df = process_screener_tickers(stock_tickers, roic_index_info, logger,
+                                                  options)
+            stage.items = len(stock_tickers)
+        else:
+            tickers_df = process_tickers(stock_tickers, roic_index_info, logger, options)
 
-    tickers_df = export_dataframe_formating(tickers_df, logger, options.qty, options.index)
-    export_file(options.format, tickers_df, options.index, logger, options.qty)
+    with report.stage('sort_dataframe') as stage:
+        tickers_df = sort_dataframe(tickers_df, logger, options.roic_ignore, options.qty,
+                                    options.rank_ties)
+        stage.items = len(tickers_df)
+
+    with report.stage('export_dataframe_formating') as stage:
+        tickers_df = export_dataframe_formating(tickers_df, logger, options.qty,
+                                                options.index)
+        stage.items = len(tickers_df)
+
+    with report.stage('export_file') as stage:
+        export_file(options.format, tickers_df, options.index, logger, options.qty)
+        stage.items = len(tickers_df)
 
     if options.database:
         if options.database not in ['POSTGRESQL']:
             logger.error(f'Option {options.database} invalid for database.')
             sys.exit(1)
-        export_dataframe_to_sql(tickers_df, logger, config["POSTGRESQL_STRING"], options.qty)
+        with report.stage('export_dataframe_to_sql') as stage:
+            export_dataframe_to_sql(tickers_df, logger, config["POSTGRESQL_STRING"],
+                                    options.qty)
+            stage.items = len(tickers_df)
 
 
 def get_tickers_list(options: Namespace, logger: logging.Logger,
-                     config: dict, roic_index_info: dict) -> tuple:
+                     config: dict, roic_index_info: DataFrame) -> tuple:
     """Get list of tickers and indexes
 
     :param options: Arguments from command line
@@ -180,11 +406,13 @@ def get_tickers_list(options: Namespace, logger: logging.Logger,
 
     stock_tickers = set()
     if indexes == ['ALL']:
-        stock_tickers.update(roic_index_info.keys())
+        stock_tickers.update(roic_index_info.index)
         return stock_tickers, indexes
 
-    for index in indexes:
-        stock_tickers.update(get_ibrx_info(config[f'{index}_URL'], logger))
+    indexes_info = get_indexes_info({index: config[f'{index}_URL'] for index in indexes},
+                                    logger, ttl_days=options.index_cache_days)
+    for tickers in indexes_info.values():
+        stock_tickers.update(tickers)
 
     return stock_tickers, indexes
 
@@ -230,6 +458,11 @@ def get_file_name(indexes, format):
     return file_path
 
 
+def get_report_file_name(indexes, format):
+    """Returns the name of the run report, next to the output file"""
+    return f'{os.path.splitext(get_file_name(indexes, format))[0]}.report.json'
+
+
 def export_file(format, tickers_df: pandas.DataFrame, indexes, logger, number_of_lines):
     file_name = get_file_name(indexes, format)
 
@@ -301,67 +534,83 @@ def export_dataframe_to_sql(tickers_df: pandas.DataFrame, logger: logging.Logger
 
 
 def sort_dataframe(tickers_df: pandas.DataFrame, logger: logging.Logger,
-                   roic_ignore: bool) -> pandas.DataFrame:
-    """Sorts the dataframe and fill the fields roic_index_number, earning_yield_field,
-    magic_index_field Those fields depends on the sorting to be generates
+                   roic_ignore: bool, top: int = 0,
+                   tie_method: str = 'first') -> pandas.DataFrame:
+    """Fills the fields roic_index_number, earning_yield_index and magic_index and
+    returns the stocks ordered by magic_index, the ties are ordered by
+    earning_yield_index. The ranks are computed without sorting the dataframe and only
+    the top stocks are sorted, the ranks are filled on a shallow copy so the dataframe
+    informed is not changed
 
     :param tickers_df: Dataframe with the stocks information
     :type tickers_df: pandas.DataFrame
     :param logger: Logger object
     :type logger: logging.Logger
-    :return: None
+    :param roic_ignore: Ranks only by the earning yield
+    :type roic_ignore: bool
+    :param top: Number of stocks returned, zero returns all of them, defaults to 0
+    :type top: int, optional
+    :param tie_method: How ties of roic and earning yield are ranked [first, min, dense],
+        defaults to first
+    :type tie_method: str, optional
+    :return: Dataframe with the top stocks
     :rtype: pandas.DataFrame
     """
     logger.info('Sorting dataframe')
-    tickers_df = tickers_df.sort_values('roic', ascending=False)
-
-    tickers_df = fill_roic_index_number_field(tickers_df, logger, roic_ignore)
-
-    tickers_df = tickers_df.sort_values('earning_yield', ascending=False)
-
-    tickers_df = fill_earning_yield_field(tickers_df, logger)
+    tickers_df = tickers_df.copy(deep=False)
+    tickers_df = fill_roic_index_number_field(tickers_df, logger, roic_ignore, tie_method)
+    tickers_df = fill_earning_yield_field(tickers_df, logger, tie_method)
     tickers_df = fill_magic_index_field(tickers_df, logger)
 
-    tickers_df = tickers_df.sort_values('magic_index', ascending=True)
-
-    return tickers_df
+    return tickers_df.iloc[select_top(tickers_df['magic_index'],
+                                      tickers_df['earning_yield_index'], top)]
 
 
 def fill_roic_index_number_field(tickers_df: pandas.DataFrame,
                                  logger: logging.Logger,
-                                 roic_ignore: bool) -> pandas.DataFrame:
-    """Fill the field roic_index_number based on roic field
+                                 roic_ignore: bool,
+                                 tie_method: str = 'first') -> pandas.DataFrame:
+    """Fill the field roic_index_number with the rank of the roic field, zero for all
+    the stocks when roic_ignore
 
     :param tickers_df: Dataframe with the stocks information
     :type tickers_df: pandas.DataFrame
     :param logger: Logger object
     :type logger: logging.Logger
+    :param tie_method: How ties are ranked, defaults to first
+    :type tie_method: str, optional
     :return: Dataframe with field roic_index_number filled
     :rtype: pandas.DataFrame
     """
     logger.debug('Filling field roic_index_number')
 
-    tickers_df['roic_index_number'] = np.arange(tickers_df['roic'].count())
     if roic_ignore:
-        tickers_df['roic_index_number'] = [0] * tickers_df['roic'].count()
+        tickers_df['roic_index_number'] = np.zeros(len(tickers_df), dtype=np.int64)
+    else:
+        tickers_df['roic_index_number'] = calculate_rank(tickers_df['roic'], tie_method)
 
     return tickers_df
 
 
 def fill_earning_yield_field(tickers_df: pandas.DataFrame,
-                             logger: logging.Logger) -> pandas.DataFrame:
-    """Fill the field earning_yield_index based on earning_yield field
+                             logger: logging.Logger,
+                             tie_method: str = 'first') -> pandas.DataFrame:
+    """Fill the field earning_yield_index with the rank of the earning_yield field, the
+    ties of the first method are ordered by the roic rank, even when the roic is ignored
 
     :param tickers_df: Dataframe with the stocks information
     :type tickers_df: pandas.DataFrame
     :param logger: Logger object
     :type logger: logging.Logger
+    :param tie_method: How ties are ranked, defaults to first
+    :type tie_method: str, optional
     :return: Dataframe with field earning_yield_index filled
     :rtype: pandas.DataFrame
     """
     logger.debug('Filling field earning_yield_index')
-    tickers_df['earning_yield_index'] = \
-        np.arange(tickers_df['earning_yield'].count())
+    tiebreak = calculate_rank(tickers_df['roic']) if tie_method == 'first' else None
+    tickers_df['earning_yield_index'] = calculate_rank(tickers_df['earning_yield'],
+                                                       tie_method, tiebreak)
 
     return tickers_df
 
@@ -378,89 +627,88 @@ def fill_magic_index_field(tickers_df: pandas.DataFrame,
     :rtype: pandas.DataFrame
     """
     logger.debug('Filling field magic_index')
-    tickers_df['magic_index'] = \
-        tickers_df['earning_yield_index'] + tickers_df['roic_index_number']
+    tickers_df['magic_index'] = calculate_magic_index(tickers_df['roic_index_number'],
+                                                      tickers_df['earning_yield_index'])
 
     return tickers_df
 
 
-def process_earning_yield_calculation(args) -> None:
-    """Returns stock earning yield.
+def process_earning_yield_calculation(args) -> TickerResult:
+    """Returns the stock information with its earning yield.
 
     :param symbol: Ticker symbol
     :type symbol: str
-    :param df: pandas data frame to be filled
-    :type df: DataFrame
-    :param index: df index
-    :type index: int
-    :param roic_index: dictionary with the roic information
-    :type roic_index: dict
     :param logger: Logger object
     :type logger: logging.Logger
-    :return: Earning yeld of the current stock
-    :rtype: float
+    :param options: Arguments from command line
+    :type options: Namespace
+    :param ticker: Ticker already fetched by the batch stage, defaults to None
+    :type ticker: TickerMock, optional
+    :param cache: Cache backend, defaults to None
+    :type cache: CacheBackend, optional
+    :return: Result with the row of the stock or the reason it was dropped
+    :rtype: TickerResult
     """
     symbol: str = args[0]
-    data_frame: DataFrame = args[1]
-    index: int = args[2]
-    roic_index: dict = args[3]
-    logger: logging.Logger = args[4]
-    options: Namespace = args[5]
+    logger: logging.Logger = args[1]
+    options: Namespace = args[2]
+    ticker: TickerMock = args[3] if len(args) > 3 else None
+    cache: CacheBackend = args[4] if len(args) > 4 else None
 
-    logger.info(f"Processing ticker - {symbol}")
-    stock: MagicFormula = MagicFormula(symbol, logger, ebit_min=options.ebit,
-                                       market_cap_min=options.market_cap)
-    if stock.get_ticker_info() is None:
-        return
+    # per-ticker records are formatted lazily and tagged for TickerLogFilter
+    logger.info('Processing ticker - %s', symbol, extra={'ticker': symbol})
+    try:
+        return calculate_ticker_row(symbol, logger, options, ticker, cache)
+    except Exception as error:  # pylint: disable=broad-except
+        logger.error('Error processing ticker %s: %s', symbol, error, extra={'ticker': symbol})
+        return TickerResult(symbol, rejection_reason=RejectionReason.PROCESSING_ERROR)
 
-    if not stock.valid_ticker_data():
-        return
 
-    stock.calculate_tev()
-    earning_yield = stock.calculate_earning_yield()
-
-    roic_index_number = roic_index.get(symbol[:-3], {}).get('roic_index', 0)
-    roic = roic_index.get(symbol[:-3], {}).get('roic', 0)
-    vpa = roic_index.get(symbol[:-3], {}).get('vpa', 0)
-    lpa = roic_index.get(symbol[:-3], {}).get('lpa', 0)
-    p_l = roic_index.get(symbol[:-3], {}).get('p_l', 0)
-    p_vp = roic_index.get(symbol[:-3], {}).get('p_vp', 0)
-    dividend_yield = roic_index.get(symbol[:-3], {}).get('dy', 0)
-    graham_vi = calculate_graham_vi(vpa, lpa, options.graham_max_pl, options.graham_max_pvp)
-    graham_upside = calculate_graham_upside(stock.ticker_info.current_price, graham_vi)
-    magic_index = earning_yield + roic_index_number
-
-    if earning_yield > 0:
-        logger.debug(f'Inserting ticker: {symbol} on dataframe')
-
-        data_frame.loc[str(index)] = [
-            symbol[:-3],
-            magic_index,
-            earning_yield,
-            roic_index_number,
-            roic,
-            stock.ticker_info.recommendation_trend.buy_counter,
-            stock.ticker_info.recommendation_trend.sell_counter,
-            stock.ticker_info.current_price,
-            stock.ticker_info.regular_market_time,
-            stock.ticker_info.market_cap,
-            stock.ticker_info.total_stockholder_equity,
-            stock.ticker_info.ebit,
-            stock.ticker_info.total_debt,
-            stock.ticker_info.total_cash,
-            stock.ticker_info.shares_outstanding,
-            stock.ticker_info.long_name,
-            stock.ticker_info.industry,
-            dividend_yield,
-            vpa,
-            lpa,
-            p_l,
-            p_vp,
-            graham_vi,
-            graham_upside
-        ]
-
-    # return earning_yield
+def calculate_ticker_row(symbol: str, logger: logging.Logger,
+                         options: Namespace, ticker: TickerMock = None,
+                         cache: CacheBackend = None) -> TickerResult:
+    """Extracts the yahoo fundamentals of the stock into its row, the tickers that do
+    not pass on the screening return their rejection reason instead. The screener columns
+    are joined for all the rows at once by join_screener_info and the earning yield is
+    calculated by evaluate_tickers_dataframe
+
+    :param symbol: Ticker symbol
+    :type symbol: str
+    :param logger: Logger object
+    :type logger: logging.Logger
+    :param options: Arguments from command line
+    :type options: Namespace
+    :param ticker: Ticker already fetched by the batch stage, defaults to None
+    :type ticker: TickerMock, optional
+    :param cache: Cache backend, defaults to None
+    :type cache: CacheBackend, optional
+    :return: Result with the row of the stock or the reason it was dropped
+    :rtype: TickerResult
+    """
+    stock: MagicFormula = MagicFormula(symbol, logger, ebit_min=options.ebit,
+                                       market_cap_min=options.market_cap, cache=cache,
+                                       modules=get_yahoo_modules(options),
+                                       base_url=options.yahoo_url)
+    if stock.get_ticker_info(ticker) is None:
+        return TickerResult(symbol, rejection_reason=stock.rejection_reason,
+                            timings=stock.timings)
+
+    row = TickerRow(
+        symbol=symbol[:-3],
+        buy_recomendation=stock.ticker_info.recommendation_trend.buy_counter,
+        sell_recomendation=stock.ticker_info.recommendation_trend.sell_counter,
+        current_price=stock.ticker_info.current_price,
+        regular_market_time=stock.ticker_info.regular_market_time,
+        market_cap=stock.ticker_info.market_cap,
+        patrimonio_liquido=stock.ticker_info.total_stockholder_equity,
+        ebit=stock.ticker_info.ebit,
+        total_debt=stock.ticker_info.total_debt,
+        total_cash=stock.ticker_info.total_cash,
+        shares_outstanding=stock.ticker_info.shares_outstanding,
+        long_name=stock.ticker_info.long_name,
+        industry=stock.ticker_info.industry
+    )
+    return TickerResult(symbol, row=row, timings=stock.timings)
 
 
 def calculate_graham_vi(
@@ -481,17 +729,7 @@ def calculate_graham_vi(
     :return: Graham VI
     :rtype: float
     """
-    if vpa <= 0 or lpa <= 0:
-        return 0
-
-    pre_vi = (max_p_l * max_p_vp) * vpa * lpa
-
-    try:
-        graham_vi = math.sqrt(pre_vi)
-    except ValueError:
-        graham_vi = 0
-
-    return round(graham_vi, 2)
+    return float(valuation.calculate_graham_vi(vpa, lpa, max_p_l, max_p_vp)[0])
 
 
 def calculate_graham_upside(
@@ -506,42 +744,552 @@ def calculate_graham_upside(
     :return: Graham upside
     :rtype: float
     """
-    if current_price <= 0 or graham_vi <= 0:
-        return 0
+    return float(valuation.calculate_graham_upside(current_price, graham_vi)[0])
+
+
+def get_yahoo_modules(options: Namespace) -> Union[List[str], None]:
+    """Returns the yahoo modules requested for each ticker, the MINIMAL profile has only
+    the modules of the fields of YAHOO_ROW_FIELDS and ALL keeps all_modules
+
+    :param options: Arguments from command line
+    :type options: Namespace
+    :return: List with the modules or None for all_modules
+    :rtype: Union[List[str], None]
+    """
+    if options.yahoo_modules == 'ALL':
+        return None
+
+    return get_required_modules(YAHOO_ROW_FIELDS)
+
+
+def fetch_tickers(symbols: list, logger: logging.Logger,
+                  options: Namespace, cache: CacheBackend) -> dict:
+    """Returns the yahoo information of the symbols, reading the fresh ones from the cache
+    in one lookup and fetching the remaining in batches
+
+    :param symbols: List of the yahoo symbols
+    :type symbols: list
+    :param logger: Logger object
+    :type logger: logging.Logger
+    :param options: Arguments from command line
+    :type options: Namespace
+    :param cache: Cache backend
+    :type cache: CacheBackend
+    :return: Dictionary with the TickerMock of each symbol
+    :rtype: dict
+    """
+    start = time.perf_counter()
+    tickers = cache.get_many(symbols, get_yahoo_modules(options))
+    # the lookup is spread over the hits, the misses are timed by the fetch
+    observe_latency('cache_read', list(tickers),
+                    (time.perf_counter() - start) / max(len(tickers), 1))
+    missing_symbols = [symbol for symbol in symbols if symbol not in tickers]
+    logger.info(f'Found {len(tickers)} tickers on cache, '
+                f'fetching {len(missing_symbols)} tickers')
+    add_counters(cache_hits=len(tickers), cache_misses=len(missing_symbols))
+    count_outcome('cached', len(tickers))
+    if missing_symbols:
+        tickers.update(fetch_missing_tickers(missing_symbols, logger, options, cache))
+
+    return tickers
+
+
+def fetch_missing_tickers(symbols: list, logger: logging.Logger,
+                          options: Namespace, cache: CacheBackend) -> dict:
+    """Fetches in batches the symbols not found on the cache and saves the complete ones
+
+    :param symbols: List of the yahoo symbols missing on the cache
+    :type symbols: list
+    :param logger: Logger object
+    :type logger: logging.Logger
+    :param options: Arguments from command line
+    :type options: Namespace
+    :param cache: Cache backend
+    :type cache: CacheBackend
+    :return: Dictionary with the TickerMock of each symbol fetched
+    :rtype: dict
+    """
+    controller = None
+    if options.adaptive_concurrency:
+        controller = AdaptiveConcurrencyController(
+            logger, initial_limit=min(ADAPTIVE_INITIAL_LIMIT, MAX_NUMBER_THREADS),
+            max_limit=MAX_NUMBER_THREADS)
+
+    modules = get_yahoo_modules(options)
+    fetcher = TickerBatchFetcher(logger, chunk_size=options.chunk_size,
+                                 max_workers=MAX_NUMBER_THREADS, controller=controller,
+                                 modules=modules, base_url=options.yahoo_url)
+    fetched_tickers = fetcher.fetch(symbols)
+    if controller:
+        logger.info(f'Adaptive concurrency metrics: {controller.metrics()}')
+        record_concurrency(controller.metrics(), controller.history)
+    fetched_symbols = [symbol for symbol, ticker in fetched_tickers.items()
+                       if get_ticker_outcome(ticker, symbol) == SUCCESS]
+    count_outcome('fetched', len(fetched_symbols))
+    count_outcome('fetch error', len(symbols) - len(fetched_symbols))
+    cache.set_many({symbol: ticker for symbol, ticker in fetched_tickers.items()
+                    if is_cacheable_ticker(ticker, symbol)}, modules)
+
+    return fetched_tickers
+
+
+def build_tickers_dataframe(results: List[TickerResult]) -> DataFrame:
+    """Builds the process_tickers dataframe at once from the rows of the results
+
+    :param results: Results of the processed tickers
+    :type results: List[TickerResult]
+    :return: Dataframe with the tickers and financial information
+    :rtype: pandas.DataFrame
+    """
+    rows = [result.row for result in results if result.row is not None]
+    columns = DataframColums.PROCESS_TICKERS_COLUMNS.value
+    data = {column: [getattr(row, column) for row in rows] for column in columns}
+
+    return pandas.DataFrame(data, columns=columns)
+
+
+def join_screener_info(tickers_df: DataFrame, roic_index: DataFrame,
+                       options: Namespace) -> DataFrame:
+    """Joins the status invest screener columns of all the tickers at once and calculates
+    the Graham VI and upside, tickers not found on the screener receive zero
+
+    :param tickers_df: Dataframe with the tickers fundamentals
+    :type tickers_df: DataFrame
+    :param roic_index: Status invest screener table indexed by ticker
+    :type roic_index: DataFrame
+    :param options: Arguments from command line
+    :type options: Namespace
+    :return: Dataframe with the screener columns filled
+    :rtype: DataFrame
+    """
+    screener = roic_index.reindex(index=tickers_df['symbol'].astype(str),
+                                  columns=list(SCREENER_JOIN_COLUMNS))
+    screener = screener.astype(float).fillna(0)
+    graham_vi = valuation.calculate_graham_vi(screener['vpa'], screener['lpa'],
+                                              options.graham_max_pl, options.graham_max_pvp)
+
+    tickers_df = tickers_df.assign(**{
+        column: screener[screener_column].to_numpy()
+        for screener_column, column in SCREENER_JOIN_COLUMNS.items()
+    })
+    tickers_df['roic_index_number'] = tickers_df['roic_index_number'].astype(np.int64)
+    tickers_df['graham_vi'] = graham_vi
+    tickers_df['graham_upside'] = valuation.calculate_graham_upside(
+        tickers_df['current_price'], graham_vi)
+
+    return tickers_df
+
+
+def evaluate_tickers_dataframe(tickers_df: DataFrame) -> tuple:
+    """Calculates tev, earning yield and magic index of all the tickers at once and
+    removes the ones with a negative earning yield, the industry, ebit and market cap
+    screening is already done by MagicFormula.get_ticker_info so only the earning yield
+    is validated here
+
+    :param tickers_df: Dataframe with the tickers fundamentals
+    :type tickers_df: DataFrame
+    :return: Tuple with the valid tickers dataframe and a dictionary with the
+        reason by dropped symbol
+    :rtype: tuple
+    """
+    tev = valuation.calculate_tev(tickers_df['market_cap'], tickers_df['total_debt'],
+                                  tickers_df['total_cash'])
+    earning_yield = valuation.calculate_earning_yield(tickers_df['ebit'], tev)
+    rejection_reasons = np.where(earning_yield > 0, '',
+                                 RejectionReason.NEGATIVE_EARNING_YIELD.value)
+    valid = rejection_reasons == ''
+    dropped_tickers = dict(zip(tickers_df['symbol'][~valid].astype(str) + '.SA',
+                               rejection_reasons[~valid]))
+
+    tickers_df = tickers_df.assign(earning_yield=earning_yield)
+    tickers_df['magic_index'] = tickers_df['earning_yield'] + tickers_df['roic_index_number']
+
+    return tickers_df[valid].reset_index(drop=True), dropped_tickers
+
+
+def get_dropped_tickers(results: List[TickerResult], logger: logging.Logger,
+                        other_dropped: dict = None) -> dict:
+    """Returns the dropped tickers with the reason and logs a summary
+
+    :param results: Results of the processed tickers
+    :type results: List[TickerResult]
+    :param logger: Logger object
+    :type logger: logging.Logger
+    :param other_dropped: Tickers dropped by the pre-filter and by the batch valuation,
+        defaults to None
+    :type other_dropped: dict, optional
+    :return: Dictionary with the reason by dropped symbol
+    :rtype: dict
+    """
+    dropped_tickers = {result.symbol: result.rejection_reason.value
+                       for result in results if result.row is None}
+    dropped_tickers.update(other_dropped or {})
 
-    pre_vi = (graham_vi - current_price) / current_price
+    reasons = {}
+    for symbol, reason in dropped_tickers.items():
+        reasons.setdefault(reason, []).append(symbol)
 
-    return round(pre_vi, 2)
+    logger.info(f'Processed {len(results)} tickers, dropped {len(dropped_tickers)}')
+    for reason, symbols in sorted(reasons.items()):
+        logger.info(f'Dropped {len(symbols)} tickers by {reason}')
+        logger.debug(f'Dropped by {reason}: {sorted(symbols)}')
 
+    return dropped_tickers
 
-def process_tickers(stock_tickers: set, roic_index: dict,
+
+def prefilter_tickers(stock_tickers: set, roic_index: DataFrame, logger: logging.Logger,
+                      options: Namespace) -> tuple:
+    """Drops the tickers that can not pass on the ebit and market cap validations of
+    MagicFormula.get_screening_rejection using the status invest screener data, before
+    any yahoo request is made, so only the fetches change and not the tickers kept. The
+    screener values are not the same as the yahoo ones, so a ticker is only dropped when
+    it is below the minimun by more than PREFILTER_TOLERANCE, tickers without screener
+    data are kept
+
+    :param stock_tickers: List of the stock tickers
+    :type stock_tickers: set
+    :param roic_index: Status invest screener table indexed by ticker
+    :type roic_index: DataFrame
+    :param logger: Logger object
+    :type logger: logging.Logger
+    :param options: Arguments from command line
+    :type options: Namespace
+    :return: Tuple with the kept tickers and a dictionary with the reason by
+        dropped symbol
+    :rtype: tuple
+    """
+    screener = roic_index.reindex(index=list(stock_tickers), columns=['valormercado', 'p_ebit'])
+
+    market_cap = screener['valormercado'].astype(float)
+    p_ebit = screener['p_ebit'].astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ebit = (market_cap / p_ebit.where(p_ebit != 0)).to_numpy()
+
+    margin = 1 - PREFILTER_TOLERANCE
+    invalid_market_cap = (market_cap < options.market_cap * margin).to_numpy()
+    invalid_ebit = ebit < min(options.ebit * margin, options.ebit)
+
+    reasons = np.select(
+        [invalid_market_cap, invalid_ebit],
+        [RejectionReason.SCREENER_MARKET_CAP.value, RejectionReason.SCREENER_EBIT.value],
+        default=''
+    )
+    dropped = reasons != ''
+    dropped_tickers = dict(zip(screener.index[dropped] + '.SA', reasons[dropped]))
+    kept_tickers = set(screener.index[~dropped])
+
+    logger.info(f'Pre-filter dropped {len(dropped_tickers)} of {len(screener)} tickers, '
+                f'avoiding {len(dropped_tickers)} yahoo fetches')
+
+    return kept_tickers, dropped_tickers
+
+
+def process_tickers(stock_tickers: set, roic_index: DataFrame,
                     logger: logging.Logger,
                     options: Namespace) -> DataFrame:
-    """Process tickers informations and return a pandas Dataframe
+    """Process tickers informations and return a pandas Dataframe, the dropped tickers
+    and their reasons are kept on the attribute attrs['dropped_tickers'] of the dataframe
+    and the tickers kept by the prefilter are the items of the stage running
 
     :param stock_tickers: List of the stock tickers
     :type stock_tickers: set
-    :param roic_index: List with the roic information
-    :type roic_index: dict
+    :param roic_index: Status invest screener table indexed by ticker
+    :type roic_index: DataFrame
     :return: Dataframe with the tickers and financial information
     :rtype: pandas.DataFrame
     """
-    logger.info('Creating pandas Df')
-    data_frame = pandas.DataFrame(
-        columns=DataframColums.PROCESS_TICKERS_COLUMNS.value
-    )
+    prefilter_dropped = {}
+    if options.prefilter:
+        stock_tickers, prefilter_dropped = prefilter_tickers(stock_tickers, roic_index,
+                                                             logger, options)
+
+    symbols = [ticker + '.SA' for ticker in stock_tickers]
+    add_counters(items=len(symbols))
+    cache = get_cache_backend(options.cache_backend)
 
     logger.info('Processing tickers')
+    try:
+        if options.executor == 'PROCESS':
+            results = process_tickers_on_processes(symbols, logger, options, cache)
+        else:
+            results = process_tickers_on_threads(symbols, logger, options, cache)
+    finally:
+        cache.close()
+
+    logger.info('Creating pandas Df')
+    data_frame = build_tickers_dataframe(results)
+    data_frame = join_screener_info(data_frame, roic_index, options)
+    data_frame, evaluation_dropped = evaluate_tickers_dataframe(data_frame)
+    data_frame.attrs['dropped_tickers'] = get_dropped_tickers(
+        results, logger, {**prefilter_dropped, **evaluation_dropped})
+    record_ticker_metrics(results, data_frame)
+
+    return data_frame
+
+
+def record_ticker_metrics(results: List[TickerResult], tickers_df: DataFrame) -> None:
+    """Records the latency of the phases measured on each ticker and the outcome of the
+    tickers on the metrics of the run, the tickers that could not be read or processed
+    are kept as failed
+
+    :param results: Results of the processed tickers
+    :type results: List[TickerResult]
+    :param tickers_df: Dataframe returned by process_tickers
+    :type tickers_df: DataFrame
+    """
+    metrics = get_ticker_metrics()
+    if metrics is None:
+        return
+
+    for result in results:
+        for phase, seconds in (result.timings or {}).items():
+            metrics.observe(phase, result.symbol, seconds)
+
+    for symbol, reason in tickers_df.attrs['dropped_tickers'].items():
+        metrics.count(reason)
+        if reason in FAILED_REASONS:
+            metrics.fail(symbol, reason)
+    metrics.count('kept', len(tickers_df))
+
 
+def process_tickers_on_threads(symbols: list, logger: logging.Logger, options: Namespace,
+                               cache: CacheBackend) -> List[TickerResult]:
+    """Fetches the tickers and builds their rows on a thread pool, on the stages
+    fetch_tickers and build_tickers
+
+    :param symbols: List of the yahoo symbols
+    :type symbols: list
+    :param logger: Logger object
+    :type logger: logging.Logger
+    :param options: Arguments from command line
+    :type options: Namespace
+    :param cache: Cache backend
+    :type cache: CacheBackend
+    :return: Results of the processed tickers
+    :rtype: List[TickerResult]
+    """
+    with run_stage('fetch_tickers') as stage:
+        fetched_tickers = fetch_tickers(symbols, logger, options, cache)
+        stage.items = len(fetched_tickers)
+
+    with run_stage('build_tickers') as stage:
+        stage.items = len(symbols)
+        return build_tickers_on_threads(symbols, logger, options, fetched_tickers, cache)
+
+
+def build_tickers_on_threads(symbols: list, logger: logging.Logger, options: Namespace,
+                             fetched_tickers: dict, cache: CacheBackend) -> List[TickerResult]:
+    """Builds the rows of the tickers on a thread pool, the tickers not fetched are
+    requested one by one
+
+    :param symbols: List of the yahoo symbols
+    :type symbols: list
+    :param logger: Logger object
+    :type logger: logging.Logger
+    :param options: Arguments from command line
+    :type options: Namespace
+    :param fetched_tickers: Dictionary with the TickerMock of each symbol fetched
+    :type fetched_tickers: dict
+    :param cache: Cache backend
+    :type cache: CacheBackend
+    :return: Results of the processed tickers
+    :rtype: List[TickerResult]
+    """
     with ThreadPoolExecutor(max_workers=MAX_NUMBER_THREADS) as executor:
-        results = executor.map(
+        return list(executor.map(
             process_earning_yield_calculation,
-            [(ticker + '.SA', data_frame, index, roic_index, logger, options)
-             for index, ticker in enumerate(stock_tickers)]
-        )
+            [(symbol, logger, options, fetched_tickers.pop(symbol, None), cache)
+             for symbol in symbols]
+        ))
+
+
+def process_tickers_on_processes(symbols: list, logger: logging.Logger, options: Namespace,
+                                 cache: CacheBackend) -> List[TickerResult]:
+    """Decodes the cached payloads and builds the rows on a process pool sized to the
+    available cores, the yahoo requests of the tickers not cached stay on threads and
+    the tickers that could not be fetched in batch are built on threads. The cache read
+    and the fetch run on the stage fetch_tickers and the builds on build_tickers
+
+    :param symbols: List of the yahoo symbols
+    :type symbols: list
+    :param logger: Logger object
+    :type logger: logging.Logger
+    :param options: Arguments from command line
+    :type options: Namespace
+    :param cache: Cache backend
+    :type cache: CacheBackend
+    :return: Results of the processed tickers
+    :rtype: List[TickerResult]
+    """
+    with run_stage('fetch_tickers') as stage:
+        start = time.perf_counter()
+        payloads = cache.get_many_payloads(symbols, get_yahoo_modules(options))
+        read_time = (time.perf_counter() - start) / max(len(payloads), 1)
+        missing_symbols = [symbol for symbol in symbols if symbol not in payloads]
+        logger.info(f'Found {len(payloads)} tickers on cache, '
+                    f'fetching {len(missing_symbols)} tickers')
+        add_counters(cache_hits=len(payloads), cache_misses=len(missing_symbols))
+        count_outcome('cached', len(payloads))
+        fetched_tickers = fetch_missing_tickers(missing_symbols, logger, options, cache) \
+            if missing_symbols else {}
+        stage.items = len(payloads) + len(fetched_tickers)
+
+    tasks = []
+    thread_symbols = []
+    for symbol in symbols:
+        if symbol in payloads or symbol in fetched_tickers:
+            tasks.append((symbol, payloads.pop(symbol, None),
+                          fetched_tickers.pop(symbol, None), options, read_time))
+        else:
+            thread_symbols.append(symbol)
+
+    with run_stage('build_tickers') as stage:
+        stage.items = len(symbols)
+        results = build_tickers_on_threads(thread_symbols, logger, options, {}, cache) \
+            if thread_symbols else []
+        if not tasks:
+            return results
+
+        max_workers = min(get_available_cores(), len(tasks))
+        logger.info(f'Building {len(tasks)} tickers on {max_workers} processes')
+        with process_log_queue(logger) as log_queue, \
+                ProcessPoolExecutor(max_workers=max_workers, initializer=set_process_logger,
+                                    initargs=(__name__, log_queue,
+                                              logger.getEffectiveLevel())) as executor:
+            results.extend(executor.map(process_cached_ticker, tasks,
+                                        chunksize=max(1, len(tasks) // (max_workers * 4))))
+
+    return results
+
+
+def process_cached_ticker(args) -> TickerResult:
+    """Process pool worker, decodes the cached payload of the ticker when informed and
+    returns its compact result
+
+    :param symbol: Ticker symbol
+    :type symbol: str
+    :param payload: Pickled payload by module from CacheBackend.get_many_payloads
+    :type payload: Union[dict, None]
+    :param ticker: Ticker already fetched by the batch stage
+    :type ticker: Union[TickerMock, None]
+    :param options: Arguments from command line
+    :type options: Namespace
+    :param read_time: Share of the ticker on the time of the payloads lookup, added to
+        the decoding on the cache_read latency
+    :type read_time: float
+    :return: Result with the row of the stock or the reason it was dropped
+    :rtype: TickerResult
+    """
+    symbol, payload, ticker, options, read_time = args
+    logger = logging.getLogger(__name__)
+    if payload is None:
+        return process_earning_yield_calculation((symbol, logger, options, ticker))
+
+    start = time.perf_counter()
+    try:
+        ticker = decode_ticker_payload(payload)
+    except Exception as error:  # pylint: disable=broad-except
+        logger.error('Error decoding ticker %s: %s', symbol, error, extra={'ticker': symbol})
+        return TickerResult(symbol, rejection_reason=RejectionReason.PROCESSING_ERROR)
+    read_time += time.perf_counter() - start
+
+    result = process_earning_yield_calculation((symbol, logger, options, ticker))
+    result.timings = {**(result.timings or {}), 'cache_read': read_time}
+    return result
+
+
+def get_available_cores() -> int:
+    """Returns the number of cores available to this process"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+
+    return os.cpu_count() or 1
+
 
-        for result in results:
-            _ = result
+def process_screener_tickers(stock_tickers: set, roic_index: DataFrame,
+                             logger: logging.Logger,
+                             options: Namespace) -> DataFrame:
+    """Process the tickers only with the status invest screener data, without any
+    yahoo request, the earning yield is the inverse of the screener ev_ebit. The
+    screener does not have the industry, debt, cash nor the recommendations, so those
+    columns are left empty and the dropped tickers are kept on the attribute
+    attrs['dropped_tickers'] of the dataframe
+
+    :param stock_tickers: List of the stock tickers
+    :type stock_tickers: set
+    :param roic_index: Status invest screener table indexed by ticker
+    :type roic_index: DataFrame
+    :param logger: Logger object
+    :type logger: logging.Logger
+    :param options: Arguments from command line
+    :type options: Namespace
+    :return: Dataframe with the tickers and financial information
+    :rtype: pandas.DataFrame
+    """
+    logger.info('Processing tickers with the status invest screener')
+    screener = roic_index.reindex(
+        index=sorted(stock_tickers),
+        columns=['roic_index', 'roic', 'vpa', 'lpa', 'p_l', 'p_vp', 'dy', 'p_ebit',
+                 'ev_ebit', 'valormercado', 'price', 'companyname']
+    )
+    missing = screener['roic_index'].isna().to_numpy()
+
+    evaluation = evaluate_screener(screener, ebit_min=options.ebit,
+                                   market_cap_min=options.market_cap,
+                                   max_p_l=options.graham_max_pl,
+                                   max_p_vp=options.graham_max_pvp)
+    rejection_reasons = np.select(
+        [
+            missing,
+            ~evaluation['valid_ebit'],
+            ~evaluation['valid_market_cap'],
+            ~evaluation['valid_earning_yield'],
+        ],
+        [
+            RejectionReason.INVALID_INFORMATION.value,
+            RejectionReason.SCREENER_EBIT.value,
+            RejectionReason.SCREENER_MARKET_CAP.value,
+            RejectionReason.NEGATIVE_EARNING_YIELD.value,
+        ],
+        default=''
+    )
+    valid = rejection_reasons == ''
+
+    data_frame = pandas.DataFrame({
+        'symbol': screener.index.astype(str),
+        'earning_yield': evaluation['earning_yield'].to_numpy(),
+        'roic_index_number': screener['roic_index'].fillna(0).to_numpy(),
+        'roic': screener['roic'].fillna(0).to_numpy(),
+        'buy_recomendation': 0,
+        'sell_recomendation': 0,
+        'current_price': evaluation['current_price'].to_numpy(),
+        'regular_market_time': None,
+        'market_cap': evaluation['market_cap'].to_numpy(),
+        'patrimonio_liquido': evaluation['patrimonio_liquido'].to_numpy(),
+        'ebit': evaluation['ebit'].to_numpy(),
+        'total_debt': np.nan,
+        'total_cash': np.nan,
+        'shares_outstanding': evaluation['shares_outstanding'].to_numpy(),
+        'long_name': screener['companyname'].to_numpy(),
+        'industry': None,
+        'dividend_yield': screener['dy'].fillna(0).to_numpy(),
+        'vpa': screener['vpa'].fillna(0).to_numpy(),
+        'lpa': screener['lpa'].fillna(0).to_numpy(),
+        'p_l': screener['p_l'].fillna(0).to_numpy(),
+        'p_vp': screener['p_vp'].fillna(0).to_numpy(),
+        'graham_vi': evaluation['graham_vi'].to_numpy(),
+        'graham_upside': evaluation['graham_upside'].to_numpy(),
+    })
+    data_frame['magic_index'] = data_frame['earning_yield'] + data_frame['roic_index_number']
+    data_frame = data_frame[DataframColums.PROCESS_TICKERS_COLUMNS.value]
+
+    dropped_tickers = dict(zip(screener.index[~valid] + '.SA', rejection_reasons[~valid]))
+    data_frame = data_frame[valid].reset_index(drop=True)
+    data_frame.attrs['dropped_tickers'] = dropped_tickers
+
+    logger.info(f'Processed {len(screener)} tickers, dropped {len(dropped_tickers)}')
+    for reason, count in pandas.Series(rejection_reasons[~valid]).value_counts().items():
+        logger.info(f'Dropped {count} tickers by {reason}')
 
     return data_frame
 
@@ -0,0 +1,284 @@
+"""Module with the per-ticker metrics of a run, latency histograms of each phase of the
+tickers (cache read, fetch, build and validation), counters of their outcomes and the
+decisions of the adaptive concurrency controller, which can be exported on the prometheus
+textfile collector format"""
+from __future__ import absolute_import
+
+import os
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+
+PHASES = ('cache_read', 'fetch', 'build', 'validation')
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+METRIC_PREFIX = 'magic_formula'
+
+_ACTIVE_METRICS = None
+
+
+class LatencyHistogram:
+    """Histogram of latencies in seconds with the cumulative buckets of prometheus, the
+    observations are kept for the exact percentiles
+
+    :param buckets: Upper bounds of the buckets, defaults to LATENCY_BUCKETS
+    :type buckets: Tuple[float, ...], optional
+    """
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.samples: List[float] = []
+
+    def observe(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    @property
+    def count(self) -> int:
+        return len(self.samples)
+
+    @property
+    def sum(self) -> float:
+        return float(sum(self.samples))
+
+    def percentile(self, quantile: float) -> float:
+        """Returns the latency of the quantile, zero without observations"""
+        if not self.samples:
+            return 0.0
+
+        return float(np.percentile(self.samples, quantile * 100))
+
+    def bucket_counts(self) -> List[Tuple[str, int]]:
+        """Returns the cumulative count of each bucket, ending on +Inf"""
+        samples = np.sort(np.asarray(self.samples, dtype=float))
+        counts = np.searchsorted(samples, self.buckets, side='right')
+        return [*((f'{bound:g}', int(count)) for bound, count in zip(self.buckets, counts)),
+                ('+Inf', len(samples))]
+
+
+class TickerMetrics:
+    """Per-ticker metrics of a run, the latency of each phase by ticker, the histograms
+    of the phases, the counters of the outcomes and the counters and decisions of the
+    adaptive concurrency controller, safe to be used from any thread"""
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.histograms: Dict[str, LatencyHistogram] = {phase: LatencyHistogram()
+                                                        for phase in PHASES}
+        self.ticker_latencies: Dict[str, Dict[str, float]] = {}
+        self.outcomes: Counter = Counter()
+        self.failed_tickers: Dict[str, str] = {}
+        self.concurrency: Dict[str, Union[int, float, None]] = {}
+        self.concurrency_decisions: List[Tuple[int, int, str]] = []
+
+    def observe(self, phase: str, symbol: str, seconds: float) -> None:
+        """Records the latency of one phase of the ticker
+
+        :param phase: Phase of PHASES
+        :type phase: str
+        :param symbol: Ticker symbol
+        :type symbol: str
+        :param seconds: Latency of the phase
+        :type seconds: float
+        :raises ValueError: When the phase is not on PHASES
+        """
+        if phase not in self.histograms:
+            raise ValueError(f'Phase {phase} not supported, supported phases: {PHASES}')
+
+        with self.lock:
+            self.histograms[phase].observe(seconds)
+            latencies = self.ticker_latencies.setdefault(symbol, {})
+            latencies[phase] = latencies.get(phase, 0.0) + seconds
+
+    def count(self, outcome: str, number: int = 1) -> None:
+        """Adds number to the counter of the outcome"""
+        with self.lock:
+            self.outcomes[outcome] += number
+
+    def fail(self, symbol: str, reason: str) -> None:
+        """Keeps the ticker that failed and the reason"""
+        with self.lock:
+            self.failed_tickers[symbol] = reason
+
+    def record_concurrency(self, counters: Dict[str, Union[int, float, None]],
+                           decisions: List[Tuple[int, int, str]]) -> None:
+        """Keeps the counters and the decisions of the adaptive concurrency controller
+
+        :param counters: Counters from AdaptiveConcurrencyController.metrics
+        :type counters: Dict[str, Union[int, float, None]]
+        :param decisions: Round, new limit and reason of each adjust of the controller
+        :type decisions: List[Tuple[int, int, str]]
+        """
+        with self.lock:
+            self.concurrency = dict(counters)
+            self.concurrency_decisions = list(decisions)
+
+    def slowest(self, number: int = 10) -> List[Tuple[str, float]]:
+        """Returns the tickers with the highest total latency over the phases
+
+        :param number: Number of tickers, defaults to 10
+        :type number: int, optional
+        :return: List of tuples with the symbol and the total latency
+        :rtype: List[Tuple[str, float]]
+        """
+        with self.lock:
+            totals = [(symbol, sum(latencies.values()))
+                      for symbol, latencies in self.ticker_latencies.items()]
+
+        return sorted(totals, key=lambda total: total[1], reverse=True)[:number]
+
+    def summary(self) -> dict:
+        """Returns the percentiles of each phase, the outcomes, the slowest and the
+        failed tickers and the concurrency controller, empty when it was not used, as a
+        dict serializable to json"""
+        with self.lock:
+            phases = {phase: {'count': histogram.count,
+                              **{f'p{int(quantile * 100)}': histogram.percentile(quantile)
+                                 for quantile in QUANTILES}}
+                      for phase, histogram in self.histograms.items()}
+            outcomes = dict(self.outcomes)
+            failed_tickers = dict(self.failed_tickers)
+            concurrency = dict(self.concurrency)
+            if concurrency:
+                concurrency['decisions'] = [
+                    {'round': round_number, 'limit': limit, 'reason': reason}
+                    for round_number, limit, reason in self.concurrency_decisions]
+
+        return {'phases': phases, 'outcomes': outcomes, 'slowest_tickers': self.slowest(),
+                'failed_tickers': failed_tickers, 'concurrency': concurrency}
+
+    def to_prometheus(self, timestamp: float = None) -> str:
+        """Returns the metrics on the prometheus text format, the outcomes, the
+        percentiles and the concurrency controller counters are gauges of the last run
+
+        :param timestamp: Unix time of the run, defaults to now
+        :type timestamp: float, optional
+        :return: Metrics on the prometheus text format
+        :rtype: str
+        """
+        histogram_name = f'{METRIC_PREFIX}_ticker_phase_seconds'
+        quantile_name = f'{METRIC_PREFIX}_ticker_phase_quantile_seconds'
+        outcome_name = f'{METRIC_PREFIX}_last_run_tickers'
+        lines = [f'# HELP {histogram_name} Latency of each phase of the tickers.',
+                 f'# TYPE {histogram_name} histogram']
+        with self.lock:
+            for phase, histogram in self.histograms.items():
+                for bound, count in histogram.bucket_counts():
+                    lines.append(f'{histogram_name}_bucket{{phase="{phase}",le="{bound}"}} '
+                                 f'{count}')
+                lines.append(f'{histogram_name}_sum{{phase="{phase}"}} {histogram.sum:.6f}')
+                lines.append(f'{histogram_name}_count{{phase="{phase}"}} {histogram.count}')
+
+            lines += [f'# HELP {quantile_name} Percentiles of the latency of each phase '
+                      'on the last run.',
+                      f'# TYPE {quantile_name} gauge']
+            for phase, histogram in self.histograms.items():
+                for quantile in QUANTILES:
+                    lines.append(f'{quantile_name}{{phase="{phase}",quantile="{quantile:g}"}} '
+                                 f'{histogram.percentile(quantile):.6f}')
+
+            lines += [f'# HELP {outcome_name} Tickers by outcome on the last run.',
+                      f'# TYPE {outcome_name} gauge']
+            for outcome, count in sorted(self.outcomes.items()):
+                lines.append(f'{outcome_name}{{outcome="{format_label(outcome)}"}} {count}')
+
+            lines += format_concurrency(self.concurrency)
+
+        timestamp_name = f'{METRIC_PREFIX}_last_run_timestamp_seconds'
+        lines += [f'# HELP {timestamp_name} Unix time of the last run.',
+                  f'# TYPE {timestamp_name} gauge',
+                  f'{timestamp_name} {time.time() if timestamp is None else timestamp:.0f}']
+
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, file_name: str) -> None:
+        """Writes the metrics for the node exporter textfile collector, through a
+        temporary file renamed at the end so the collector never reads a partial file
+
+        :param file_name: Name of the .prom file
+        :type file_name: str
+        """
+        temporary_file = f'{file_name}.{os.getpid()}.tmp'
+        with open(temporary_file, 'w', encoding='UTF-8') as file:
+            file.write(self.to_prometheus())
+        os.replace(temporary_file, file_name)
+
+
+def format_concurrency(counters: Dict[str, Union[int, float, None]]) -> List[str]:
+    """Returns the prometheus lines of the concurrency controller counters, the requests
+    by outcome on one metric with the outcome label and the best latency in seconds"""
+    lines = []
+    requests_name = f'{METRIC_PREFIX}_concurrency_requests'
+    requests = {name[len('requests_'):]: value for name, value in counters.items()
+                if name.startswith('requests_')}
+    if requests:
+        lines += [f'# HELP {requests_name} Yahoo requests by outcome seen by the adaptive '
+                  'concurrency controller on the last run.',
+                  f'# TYPE {requests_name} gauge']
+        lines += [f'{requests_name}{{outcome="{format_label(outcome)}"}} {count}'
+                  for outcome, count in sorted(requests.items())]
+
+    for name, value in counters.items():
+        if name.startswith('requests_') or value is None:
+            continue
+        metric_name = f'{METRIC_PREFIX}_concurrency_{name}'
+        if name == 'best_latency':
+            metric_name += '_seconds'
+            value = f'{value:.6f}'
+        description = name.replace('_', ' ')
+        lines += [f'# HELP {metric_name} Adaptive concurrency controller {description} '
+                  'on the last run.',
+                  f'# TYPE {metric_name} gauge',
+                  f'{metric_name} {value}']
+
+    return lines
+
+
+def format_label(value: str) -> str:
+    """Returns the value as a prometheus label value"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace(' ', '_')
+
+
+def get_ticker_metrics() -> Union[TickerMetrics, None]:
+    """Returns the ticker metrics of the run, None when they are not recorded"""
+    return _ACTIVE_METRICS
+
+
+def set_ticker_metrics(metrics: Union[TickerMetrics, None]) -> None:
+    """Replaces the ticker metrics of the run, None stops the recording
+
+    :param metrics: Metrics that receive the observations
+    :type metrics: Union[TickerMetrics, None]
+    """
+    global _ACTIVE_METRICS
+    _ACTIVE_METRICS = metrics
+
+
+def observe_latency(phase: str, symbols: Union[str, List[str]], seconds: float) -> None:
+    """Records the latency of the phase for each symbol on the metrics of the run, ignored
+    when the metrics are not recorded"""
+    metrics = _ACTIVE_METRICS
+    if metrics is None:
+        return
+
+    for symbol in [symbols] if isinstance(symbols, str) else symbols:
+        metrics.observe(phase, symbol, seconds)
+
+
+def record_concurrency(counters: Dict[str, Union[int, float, None]],
+                       decisions: List[Tuple[int, int, str]]) -> None:
+    """Keeps the adaptive concurrency controller on the metrics of the run, ignored when
+    the metrics are not recorded"""
+    metrics = _ACTIVE_METRICS
+    if metrics is not None:
+        metrics.record_concurrency(counters, decisions)
+
+
+def count_outcome(outcome: str, number: int = 1) -> None:
+    """Adds number to the outcome on the metrics of the run, ignored when the metrics
+    are not recorded"""
+    metrics = _ACTIVE_METRICS
+    if metrics is not None and number:
+        metrics.count(outcome, number)
@@ -0,0 +1,206 @@
+"""Module with the profiling of the pipeline stages, each stage gets its own cProfile
+statistics, the collapsed stacks sampled from all the threads for flamegraphs and,
+optionally, the top allocation sites and the peak memory traced by tracemalloc"""
+from __future__ import absolute_import
+
+import cProfile
+import os
+import pstats
+import re
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import ExitStack
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+
+SAMPLING_INTERVAL = 0.005
+TRACEMALLOC_STAGES = ('process_tickers', 'export_file')
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 25
+
+
+class StackSampler:
+    """Samples the stacks of every thread of the process on a background thread and
+    counts them on the collapsed format of flamegraph.pl and speedscope, the root of
+    each stack is the name of the thread without the number of the worker
+
+    :param interval: Seconds between two samples, defaults to 0.005
+    :type interval: float, optional
+    """
+    def __init__(self, interval: float = SAMPLING_INTERVAL) -> None:
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='StackSampler', daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        self.thread.join()
+
+    def run(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def sample(self) -> None:
+        """Counts the current stack of each thread, except the sampler one"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():  # pylint: disable=protected-access
+            if thread_id == self.thread.ident:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:'
+                             f'{code.co_firstlineno})')
+                frame = frame.f_back
+            thread_name = re.sub(r'_\d+$', '', names.get(thread_id, str(thread_id)))
+            stack.append(thread_name)
+            self.stacks[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+    def write_collapsed(self, file_name: str) -> None:
+        """Writes the stacks with their counts, one by line"""
+        with open(file_name, 'w', encoding='UTF-8') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f'{stack} {count}\n')
+
+
+class StageProfiler:
+    """Profiles the pipeline stages, writing for each one <stage>.pstats with the cProfile
+    statistics of the thread that runs the stage and <stage>.collapsed with the stacks
+    sampled from all the threads, plus <stage>.tracemalloc.txt for the stages traced.
+    The cProfile of a stage is paused while a stage started inside it runs, so the
+    statistics of the outer stage leave out the inner ones
+
+    :param folder: Folder of the profiling files, created when it does not exist
+    :type folder: str
+    :param cpu: Writes the cProfile statistics and the collapsed stacks, defaults to True
+    :type cpu: bool, optional
+    :param memory: Traces the allocations of the memory_stages, defaults to False
+    :type memory: bool, optional
+    :param memory_stages: Stages traced by tracemalloc, defaults to TRACEMALLOC_STAGES
+    :type memory_stages: Tuple[str, ...], optional
+    :param interval: Seconds between two stack samples, defaults to 0.005
+    :type interval: float, optional
+    """
+    def __init__(self, folder: str, cpu: bool = True, memory: bool = False,
+                 memory_stages: Tuple[str, ...] = TRACEMALLOC_STAGES,
+                 interval: float = SAMPLING_INTERVAL) -> None:
+        self.folder = folder
+        self.cpu = cpu
+        self.memory = memory
+        self.memory_stages = memory_stages
+        self.interval = interval
+        self.results: Dict[str, dict] = {}
+        self.active_profiles: List[cProfile.Profile] = []
+
+    @contextmanager
+    def profile(self, stage: str) -> Iterator[None]:
+        """Profiles the block as the stage, the files are written even when it raises
+
+        :param stage: Name of the stage
+        :type stage: str
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        result = self.results.setdefault(stage, {'files': []})
+        with ExitStack() as stack:
+            # tracemalloc exits first, so the dump of the cProfile statistics is not traced
+            if self.cpu:
+                stack.enter_context(self.profile_cpu(stage, result))
+            if self.memory and stage in self.memory_stages:
+                stack.enter_context(self.trace_memory(stage, result))
+            yield
+
+    @contextmanager
+    def profile_cpu(self, stage: str, result: dict) -> Iterator[None]:
+        """Runs cProfile on the current thread and the sampler on all of them"""
+        profile = cProfile.Profile()
+        sampler = StackSampler(self.interval)
+        sampler.start()
+        # only one cProfile can be enabled at a time, the outer stage is resumed at the end
+        if self.active_profiles:
+            self.active_profiles[-1].disable()
+        self.active_profiles.append(profile)
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.active_profiles.pop()
+            sampler.stop()
+            pstats_file = os.path.join(self.folder, f'{stage}.pstats')
+            collapsed_file = os.path.join(self.folder, f'{stage}.collapsed')
+            profile.dump_stats(pstats_file)
+            sampler.write_collapsed(collapsed_file)
+            result['files'] += [pstats_file, collapsed_file]
+            result['samples'] = sampler.samples
+            if self.active_profiles:
+                self.active_profiles[-1].enable()
+
+    @contextmanager
+    def trace_memory(self, stage: str, result: dict) -> Iterator[None]:
+        """Traces the allocations of the block and writes the top allocation sites"""
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if not was_tracing:
+                tracemalloc.stop()
+
+            top_allocations = get_top_allocations(snapshot)
+            memory_file = os.path.join(self.folder, f'{stage}.tracemalloc.txt')
+            write_allocations(memory_file, stage, peak, top_allocations)
+            result['files'].append(memory_file)
+            result['peak_memory'] = peak
+            result['top_allocations'] = [{'site': site, 'size': size, 'count': count}
+                                         for site, size, count in top_allocations[:5]]
+
+    def summary(self) -> Dict[str, dict]:
+        """Returns the files, the samples and the memory results of each stage"""
+        return self.results
+
+
+def get_top_allocations(snapshot: tracemalloc.Snapshot,
+                        limit: int = TOP_ALLOCATIONS) -> List[Tuple[str, int, int]]:
+    """Returns the sites with the most memory allocated still alive on the snapshot, the
+    allocations of tracemalloc, of the profiler and of the cProfile statistics dumped by the
+    nested stages are left out
+
+    :param snapshot: Snapshot of tracemalloc
+    :type snapshot: tracemalloc.Snapshot
+    :param limit: Number of sites, defaults to 25
+    :type limit: int, optional
+    :return: List of tuples with the site, the size in bytes and the number of blocks
+    :rtype: List[Tuple[str, int, int]]
+    """
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, cProfile.__file__),
+        tracemalloc.Filter(False, pstats.__file__),
+    ))
+    return [(f'{statistic.traceback[0].filename}:{statistic.traceback[0].lineno}',
+             statistic.size, statistic.count)
+            for statistic in snapshot.statistics('lineno')[:limit]]
+
+
+def write_allocations(file_name: str, stage: str, peak: int,
+                      top_allocations: List[Tuple[str, int, int]]) -> None:
+    """Writes the peak and the top allocation sites of the stage"""
+    with open(file_name, 'w', encoding='UTF-8') as file:
+        file.write(f'{stage}: peak {peak / 2 ** 20:.1f} MiB\n')
+        for site, size, count in top_allocations:
+            file.write(f'{size / 1024:>12.1f} KiB {count:>9} blocks  {site}\n')
@@ -0,0 +1,89 @@
+"""Module to rank a whole universe of tickers by the magic formula at once, the roic and
+earning yield ranks are computed without reordering the tickers and only the top ones
+are sorted"""
+from __future__ import absolute_import
+
+from typing import Union
+
+import numpy as np
+import pandas
+
+
+TIE_METHODS = ('first', 'min', 'dense')
+
+ArrayLike = Union[np.ndarray, pandas.Series, list]
+
+
+def calculate_rank(values: ArrayLike, method: str = 'first',
+                   tiebreak: ArrayLike = None) -> np.ndarray:
+    """Calculates the zero based rank of each value from the highest to the lowest,
+    missing values get the last ranks
+
+    :param values: Values ranked, roic or earning yield
+    :type values: ArrayLike
+    :param method: How ties are ranked, first orders them by tiebreak and then by
+        position, min gives the lowest rank of the tie to all of them and dense does the
+        same without gaps after the tie, defaults to first
+    :type method: str, optional
+    :param tiebreak: Ranks that order the ties of the first method, lowest first,
+        defaults to None
+    :type tiebreak: ArrayLike, optional
+    :raises ValueError: When the method is not on TIE_METHODS
+    :return: Rank of each value
+    :rtype: np.ndarray
+    """
+    if method not in TIE_METHODS:
+        raise ValueError(f'Tie method {method} not supported, supported methods: {TIE_METHODS}')
+
+    values = np.asarray(values, dtype=float)
+    if method != 'first':
+        ranks = pandas.Series(values).rank(method=method, ascending=False, na_option='bottom')
+        return ranks.to_numpy(dtype=np.int64) - 1
+
+    keys = np.where(np.isnan(values), np.inf, -values)
+    order = np.lexsort((keys,) if tiebreak is None else (np.asarray(tiebreak), keys))
+    ranks = np.empty(len(values), dtype=np.int64)
+    ranks[order] = np.arange(len(values))
+    return ranks
+
+
+def calculate_magic_index(roic_rank: ArrayLike, earning_yield_rank: ArrayLike) -> np.ndarray:
+    """Calculates the magic index, the sum of the roic and the earning yield ranks
+
+    :param roic_rank: Roic rank of the companies
+    :type roic_rank: ArrayLike
+    :param earning_yield_rank: Earning yield rank of the companies
+    :type earning_yield_rank: ArrayLike
+    :return: Magic index of the companies
+    :rtype: np.ndarray
+    """
+    return np.asarray(roic_rank, dtype=np.int64) + np.asarray(earning_yield_rank, dtype=np.int64)
+
+
+def select_top(magic_index: ArrayLike, earning_yield_rank: ArrayLike,
+               top: int = 0) -> np.ndarray:
+    """Returns the positions of the companies with the lowest magic index in order, the
+    ties are ordered by the earning yield rank and then by position. A linear time
+    partition discards the companies above the magic index of the last one selected
+    and only the remaining ones are sorted
+
+    :param magic_index: Magic index of the companies
+    :type magic_index: ArrayLike
+    :param earning_yield_rank: Earning yield rank of the companies
+    :type earning_yield_rank: ArrayLike
+    :param top: Number of companies selected, zero selects all of them, defaults to 0
+    :type top: int, optional
+    :return: Positions of the companies selected
+    :rtype: np.ndarray
+    """
+    magic_index = np.asarray(magic_index)
+    earning_yield_rank = np.asarray(earning_yield_rank)
+    if top and top < len(magic_index):
+        kth_index = np.partition(magic_index, top - 1)[top - 1]
+        candidates = np.flatnonzero(magic_index <= kth_index)
+    else:
+        candidates = np.arange(len(magic_index))
+
+    order = np.lexsort((candidates, earning_yield_rank[candidates], magic_index[candidates]))
+    return candidates[order][:top or None]
+
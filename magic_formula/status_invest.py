@@ -2,104 +2,440 @@
 from __future__ import absolute_import
 from datetime import datetime
 
-import io
+import codecs
 import logging
 
+import math
 import os
 import json
-import bs4
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 import numpy as np
 import pandas
-import requests
-
-
-HEADERS = {
-    'authority': 'statusinvest.com.br',
-    'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9',
-    'accept-language': 'pt-BR,pt;q=0.9,en-US;q=0.8,en;q=0.7',
-    'cache-control': 'max-age=0',
-    'sec-ch-ua': '"Google Chrome";v="107", "Chromium";v="107", "Not=A?Brand";v="24"',
-    'sec-ch-ua-mobile': '?0',
-    'sec-ch-ua-platform': '"macOS"',
-    'sec-fetch-dest': 'document',
-    'sec-fetch-mode': 'navigate',
-    'sec-fetch-site': 'none',
-    'sec-fetch-user': '?1',
-    'upgrade-insecure-requests': '1',
-    'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/107.0.0.0 Safari/537.36'
+
+from magic_formula.http_client import HttpClient
+from magic_formula.http_client import get_http_client
+from magic_formula.instrumentation import add_counters
+from magic_formula.instrumentation import count_bytes
+
+
+INDEX_CACHE_FILE = 'cache/index_members.json'
+INDEX_CACHE_TTL_DAYS = 7
+STREAM_CHUNK_SIZE = 64 * 1024
+SCREENER_CACHE_FILE = 'cache/screener'
+SCREENER_COLUMNS = {
+    'ticker': object,
+    'roic_index': np.int64,
+    'roic': float,
+    'vpa': float,
+    'lpa': float,
+    'p_l': float,
+    'p_vp': float,
+    'dy': float,
+    'p_ebit': float,
+    'ev_ebit': float,
+    'valormercado': float,
+    'price': float,
+    'companyname': object,
 }
+SCREENER_FILL_ZERO = ('roic', 'vpa', 'p_l', 'p_vp', 'dy')
+SCREENER_PAGE_SIZE = 200
+
+
+class TickerExtractor(HTMLParser):
+    """Streaming html parser that only collects the text of the span.ticker elements,
+    without building the document tree, the html can be fed in chunks"""
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.tickers: List[str] = []
+        self.span_depth = 0
+        self.text_parts: List[str] = []
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        if tag != 'span':
+            return
+
+        if self.span_depth:
+            self.span_depth += 1
+            return
+
+        classes = next((value for name, value in attrs if name == 'class'), None) or ''
+        if 'ticker' in classes.split():
+            self.span_depth = 1
+            self.text_parts = []
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag != 'span' or not self.span_depth:
+            return
+
+        self.span_depth -= 1
+        if not self.span_depth:
+            self.tickers.append(''.join(self.text_parts))
 
+    def handle_data(self, data: str) -> None:
+        if self.span_depth:
+            self.text_parts.append(data)
 
-def get_ibrx_info(url: str, logger: logging.Logger) -> set:
+    def pop_tickers(self) -> List[str]:
+        """Returns the tickers found since the last call"""
+        tickers, self.tickers = self.tickers, []
+        return tickers
+
+
+def extract_tickers(chunks: Iterable[bytes], encoding: str = 'utf-8') -> Iterator[str]:
+    """Yields the tickers of the span.ticker elements as the chunks of the html arrive
+
+    :param chunks: Chunks of the html body
+    :type chunks: Iterable[bytes]
+    :param encoding: Encoding of the html, defaults to 'utf-8'
+    :type encoding: str, optional
+    :return: Iterator with the tickers in the order of the page
+    :rtype: Iterator[str]
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    parser = TickerExtractor()
+    for chunk in chunks:
+        parser.feed(decoder.decode(chunk))
+        yield from parser.pop_tickers()
+
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    yield from parser.pop_tickers()
+
+
+def get_ibrx_info(url: str, logger: logging.Logger, client: HttpClient = None) -> set:
     """Returns set with index tickers
 
     :param url: status invest url
     :type url: str
     :param logger: Logger object
     :type logger: logging.Logger
+    :param client: Http client, defaults to the shared one
+    :type client: HttpClient, optional
     :return: set with index tickers
     :rtype: set
     """
     logger.info(f'Processing url: {url}')
-    request_content = requests.get(url, verify=True, headers=HEADERS).content
-    beatiful_soup = bs4.BeautifulSoup(request_content, "html.parser")
-    tickers_ibrx100 = \
-        set([x.text for x in list(beatiful_soup.find_all("span", {"class": "ticker"}))])
+    client = client or get_http_client()
+    response = client.get(url, verify=True, stream=True)
+    try:
+        tickers_ibrx100 = set(extract_tickers(
+            count_bytes(response.iter_content(STREAM_CHUNK_SIZE))))
+    finally:
+        response.close()
 
     logger.info(f'Returned {len(tickers_ibrx100)} tickers')
 
     return tickers_ibrx100
 
 
-def check_cache_file(file_name: str = 'cache/request.json') -> dict:
-    if not os.path.exists('cache'):
-        os.makedirs('cache')
+def get_indexes_info(index_urls: Dict[str, str], logger: logging.Logger,
+                     client: HttpClient = None, ttl_days: int = INDEX_CACHE_TTL_DAYS,
+                     file_name: str = INDEX_CACHE_FILE) -> Dict[str, set]:
+    """Returns the tickers of several indexes at once, the members found on the
+    membership cache are reused and the other index pages are fetched concurrently.
+    Index membership only changes on the rebalances, so the cache has its own ttl
+
+    :param index_urls: Dictionary with the status invest url by index name
+    :type index_urls: Dict[str, str]
+    :param logger: Logger object
+    :type logger: logging.Logger
+    :param client: Http client, defaults to the shared one
+    :type client: HttpClient, optional
+    :param ttl_days: Days that a membership is considered fresh, defaults to 7
+    :type ttl_days: int, optional
+    :param file_name: Membership cache file, defaults to 'cache/index_members.json'
+    :type file_name: str, optional
+    :return: Dictionary with the set of tickers by index name
+    :rtype: Dict[str, set]
+    """
+    cached_members = check_index_cache_file(index_urls, ttl_days, file_name)
+    missing_indexes = [index for index in index_urls if index not in cached_members]
+    logger.info(f'Found {len(cached_members)} indexes on cache, '
+                f'fetching {len(missing_indexes)} indexes')
+    add_counters(cache_hits=len(cached_members), cache_misses=len(missing_indexes))
+
+    indexes_info = {index: set(cached_members[index]) for index in cached_members}
+    if not missing_indexes:
+        return indexes_info
+
+    client = client or get_http_client()
+    with ThreadPoolExecutor(max_workers=min(len(missing_indexes),
+                                            client.max_connections)) as executor:
+        fetched = executor.map(lambda index: get_ibrx_info(index_urls[index], logger, client),
+                               missing_indexes)
+        indexes_info.update(zip(missing_indexes, fetched))
+
+    for index in missing_indexes:
+        if not indexes_info[index]:
+            logger.warning(f'No tickers found for the index {index}, it is not cached and '
+                           'will be fetched again on the next run')
+
+    write_index_cache_file({index: indexes_info[index] for index in missing_indexes},
+                           index_urls, file_name)
+
+    return indexes_info
+
+
+def check_index_cache_file(index_urls: Dict[str, str], ttl_days: int = INDEX_CACHE_TTL_DAYS,
+                           file_name: str = INDEX_CACHE_FILE) -> Dict[str, list]:
+    """Returns the fresh memberships of the indexes found on the cache file, an entry
+    is only valid when it was fetched from the same url
+
+    :param index_urls: Dictionary with the status invest url by index name
+    :type index_urls: Dict[str, str]
+    :param ttl_days: Days that a membership is considered fresh, defaults to 7
+    :type ttl_days: int, optional
+    :param file_name: Membership cache file, defaults to 'cache/index_members.json'
+    :type file_name: str, optional
+    :return: Dictionary with the list of tickers by index name
+    :rtype: Dict[str, list]
+    """
+    cache_content = _read_index_cache_file(file_name)
+    now = datetime.now().timestamp()
+    return {
+        index: cache_content[index]['tickers']
+        for index, url in index_urls.items()
+        if index in cache_content
+        and cache_content[index].get('url') == url
+        and now - cache_content[index].get('fetched_at', 0) <= ttl_days * 86400
+    }
+
+
+def write_index_cache_file(indexes_info: Dict[str, Iterable[str]], index_urls: Dict[str, str],
+                           file_name: str = INDEX_CACHE_FILE) -> None:
+    """Saves the memberships of the indexes on the cache file, keeping the other
+    indexes already saved, empty memberships are not saved
+
+    :param indexes_info: Dictionary with the tickers by index name
+    :type indexes_info: Dict[str, Iterable[str]]
+    :param index_urls: Dictionary with the status invest url by index name
+    :type index_urls: Dict[str, str]
+    :param file_name: Membership cache file, defaults to 'cache/index_members.json'
+    :type file_name: str, optional
+    """
+    cache_content = _read_index_cache_file(file_name)
+    fetched_at = datetime.now().timestamp()
+    for index, tickers in indexes_info.items():
+        if not tickers:
+            continue
+
+        cache_content[index] = {'url': index_urls[index], 'fetched_at': fetched_at,
+                                'tickers': sorted(tickers)}
+
+    folder = os.path.dirname(file_name)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    temporary_file = f'{file_name}.tmp'
+    with open(temporary_file, 'w') as file:
+        json.dump(cache_content, file)
+    os.replace(temporary_file, file_name)
 
+
+def _read_index_cache_file(file_name: str) -> dict:
+    """Reads the membership cache file, an unreadable file is considered empty"""
     if not os.path.exists(file_name):
         return {}
 
-    file_time = os.path.getctime(file_name)
-    if (datetime.now() - datetime.fromtimestamp(file_time)).days > 1:
+    try:
+        with open(file_name) as file:
+            return json.load(file)
+    except (OSError, ValueError):
         return {}
 
-    with open(file_name) as file:
-        json_text = json.load(file)
-    return json_text
 
+def build_screener_frame(tickers_info: List[dict]) -> pandas.DataFrame:
+    """Builds the typed screener table straight from the records of the status invest
+    response, indexed by ticker and with the columns of SCREENER_COLUMNS. A ticker listed
+    more than once keeps its last record and roic_index numbers the tickers left
 
-def write_cache_file(content: dict, file_name: str = 'cache/request.json'):
-    if not os.path.exists('cache'):
-        os.makedirs('cache')
+    :param tickers_info: Records of the status invest screener
+    :type tickers_info: List[dict]
+    :return: Screener table indexed by ticker
+    :rtype: pandas.DataFrame
+    """
+    columns = [column for column in SCREENER_COLUMNS if column != 'roic_index']
+    screener = pandas.DataFrame.from_records(tickers_info, columns=columns)
+    screener = screener.astype({column: SCREENER_COLUMNS[column] for column in columns})
+    screener[list(SCREENER_FILL_ZERO)] = screener[list(SCREENER_FILL_ZERO)].fillna(0)
+    screener = screener.drop_duplicates('ticker', keep='last')
+    screener.insert(1, 'roic_index', np.arange(len(screener), dtype=np.int64))
 
-    with open(file_name, 'w') as file:
-        json.dump(content, file)
+    return screener.set_index('ticker')
 
 
-def get_ticker_roic_info(url: str) -> dict:
-    """Returns index informations
+def get_screener_cache_files(file_name: str = SCREENER_CACHE_FILE) -> tuple:
+    """Returns the parquet and the pickle files of the screener cache"""
+    return f'{file_name}.parquet', f'{file_name}.pkl'
 
-    :param url: status invest url
+
+def check_screener_cache_file(
+        file_name: str = SCREENER_CACHE_FILE) -> Union[pandas.DataFrame, None]:
+    """Returns the cached screener table when it is at most one day old, an empty table
+    is considered a miss
+
+    :param file_name: Cache file name without extension, defaults to 'cache/screener'
+    :type file_name: str, optional
+    :return: Screener table or None when there is no fresh cache
+    :rtype: Union[pandas.DataFrame, None]
+    """
+    for cache_file in get_screener_cache_files(file_name):
+        if not os.path.exists(cache_file):
+            continue
+
+        file_time = os.path.getmtime(cache_file)
+        if (datetime.now() - datetime.fromtimestamp(file_time)).days > 1:
+            continue
+
+        try:
+            if cache_file.endswith('.parquet'):
+                screener = pandas.read_parquet(cache_file)
+            else:
+                screener = pandas.read_pickle(cache_file)
+        except (ImportError, OSError, ValueError):
+            continue
+
+        if not screener.empty:
+            return screener
+
+    return None
+
+
+def write_screener_cache_file(screener: pandas.DataFrame,
+                              file_name: str = SCREENER_CACHE_FILE) -> None:
+    """Saves the screener table on parquet, or on pickle when no parquet engine is
+    installed
+
+    :param screener: Screener table
+    :type screener: pandas.DataFrame
+    :param file_name: Cache file name without extension, defaults to 'cache/screener'
+    :type file_name: str, optional
+    """
+    folder = os.path.dirname(file_name)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    parquet_file, pickle_file = get_screener_cache_files(file_name)
+    try:
+        screener.to_parquet(f'{parquet_file}.tmp')
+        cache_file = parquet_file
+    except ImportError:
+        screener.to_pickle(f'{pickle_file}.tmp', compression=None)
+        cache_file = pickle_file
+
+    os.replace(f'{cache_file}.tmp', cache_file)
+    for stale_file in {parquet_file, pickle_file} - {cache_file}:
+        if os.path.exists(stale_file):
+            os.remove(stale_file)
+
+
+def get_page_url(url: str, page: int, page_size: int) -> str:
+    """Returns the screener url with the page and take parameters replaced
+
+    :param url: status invest screener url
     :type url: str
-    :return: Dictionary with index informations
-    :rtype: dict
+    :param page: Number of the page, starting at zero
+    :type page: int
+    :param page_size: Number of rows by page
+    :type page_size: int
+    :return: Url of the page
+    :rtype: str
     """
-    tickers_info = check_cache_file()
-    if not tickers_info:
-        tickers_info = requests.get(url, headers=HEADERS).json().get('list', {})
-        write_cache_file(tickers_info)
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query, keep_blank_values=True))
+    query.update({'page': str(page), 'take': str(page_size)})
 
-    roic_info_df: pandas.DataFrame = pandas.read_json(json.dumps(tickers_info))
+    return urlunsplit(parts._replace(query=urlencode(query)))
 
-    roic_info_df['roic'] = roic_info_df['roic'].replace(np.NaN, 0)
-    roic_info_df['vpa'] = roic_info_df['vpa'].replace(np.NaN, 0)
-    roic_info_df['p_l'] = roic_info_df['p_l'].replace(np.NaN, 0)
-    roic_info_df['p_vp'] = roic_info_df['p_vp'].replace(np.NaN, 0)
-    roic_info_df['dy'] = roic_info_df['dy'].replace(np.NaN, 0)
-    roic_info_df['roic_index'] = [x for x, _ in enumerate(iter(roic_info_df['roic']))]
 
-    roic_info_df = roic_info_df[['ticker', 'roic_index', 'roic',
-                                 'vpa', 'lpa', 'p_l', 'p_vp', 'dy']]
-    roic_info_df.set_index(['ticker'], inplace=True)
+def get_screener_page(url: str, page: int, page_size: int,
+                      client: HttpClient) -> Tuple[List[dict], Union[int, None]]:
+    """Fetches and parses one page of the screener
 
-    return roic_info_df.to_dict('index')
+    :param url: status invest screener url
+    :type url: str
+    :param page: Number of the page, starting at zero
+    :type page: int
+    :param page_size: Number of rows by page
+    :type page_size: int
+    :param client: Http client
+    :type client: HttpClient
+    :return: Tuple with the records of the page and the total of rows informed by the
+        response, None when the response does not inform it
+    :rtype: Tuple[List[dict], Union[int, None]]
+    """
+    content = client.get(get_page_url(url, page, page_size)).json()
+    if isinstance(content, list):
+        return content, None
+
+    total = content.get('totalResults')
+    return content.get('list') or [], None if total is None else int(total)
+
+
+def get_screener_records(url: str, client: HttpClient,
+                         page_size: int = SCREENER_PAGE_SIZE) -> List[dict]:
+    """Downloads every page of the screener, the first page informs the total of rows
+    and the remaining pages are fetched concurrently. When the total is not informed
+    the pages are fetched in sequence until a page is not full
+
+    :param url: status invest screener url
+    :type url: str
+    :param client: Http client
+    :type client: HttpClient
+    :param page_size: Number of rows by page, defaults to 200
+    :type page_size: int, optional
+    :return: Records of all the pages in the order of the screener
+    :rtype: List[dict]
+    """
+    records, total = get_screener_page(url, 0, page_size, client)
+    if total is None:
+        page = 0
+        page_records = records
+        while len(page_records) == page_size:
+            page += 1
+            page_records, _ = get_screener_page(url, page, page_size, client)
+            records.extend(page_records)
+
+        return records
+
+    pages = range(1, math.ceil(total / page_size))
+    if not pages:
+        return records
+
+    with ThreadPoolExecutor(max_workers=min(len(pages), client.max_connections)) as executor:
+        for page_records, _ in executor.map(
+                lambda page: get_screener_page(url, page, page_size, client), pages):
+            records.extend(page_records)
+
+    return records
+
+
+def get_ticker_roic_info(url: str, client: HttpClient = None,
+                         cache_file: str = SCREENER_CACHE_FILE,
+                         page_size: int = SCREENER_PAGE_SIZE) -> pandas.DataFrame:
+    """Returns the status invest screener table indexed by ticker, an empty table is not
+    cached so it is fetched again on the next call
+
+    :param url: status invest url
+    :type url: str
+    :param client: Http client, defaults to the shared one
+    :type client: HttpClient, optional
+    :param cache_file: Cache file name without extension, defaults to 'cache/screener'
+    :type cache_file: str, optional
+    :param page_size: Number of rows by screener page, defaults to 200
+    :type page_size: int, optional
+    :return: Screener table indexed by ticker with the columns of SCREENER_COLUMNS
+    :rtype: pandas.DataFrame
+    """
+    screener = check_screener_cache_file(cache_file)
+    add_counters(cache_hits=int(screener is not None), cache_misses=int(screener is None))
+    if screener is None:
+        client = client or get_http_client()
+        screener = build_screener_frame(get_screener_records(url, client, page_size))
+        if not screener.empty:
+            write_screener_cache_file(screener, cache_file)
 
+    return screener
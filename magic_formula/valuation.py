@@ -0,0 +1,242 @@
+"""Module to calculate the magic formula valuation of a whole universe of tickers at once"""
+from __future__ import absolute_import
+
+from typing import Union
+
+import numpy as np
+import pandas
+
+
+INVALID_INDUSTRIES = ('Insurance—Diversified', 'Banks—Regional')
+
+ArrayLike = Union[np.ndarray, pandas.Series, list, float]
+
+
+def calculate_liquid_debt(total_debt: ArrayLike, total_cash: ArrayLike) -> np.ndarray:
+    """Calculates the liquid debt, negative values are considered as zero
+
+    :param total_debt: Total debt of the companies
+    :type total_debt: ArrayLike
+    :param total_cash: Total cash of the companies
+    :type total_cash: ArrayLike
+    :return: Liquid debt of the companies
+    :rtype: np.ndarray
+    """
+    return np.maximum(_as_float(total_debt) - _as_float(total_cash), 0)
+
+
+def calculate_tev(market_cap: ArrayLike, total_debt: ArrayLike,
+                  total_cash: ArrayLike) -> np.ndarray:
+    """Calculates the tev (total enterprise value)
+
+    :param market_cap: Market cap of the companies
+    :type market_cap: ArrayLike
+    :param total_debt: Total debt of the companies
+    :type total_debt: ArrayLike
+    :param total_cash: Total cash of the companies
+    :type total_cash: ArrayLike
+    :return: Total enterprise value of the companies
+    :rtype: np.ndarray
+    """
+    return _as_float(market_cap) + calculate_liquid_debt(total_debt, total_cash)
+
+
+def calculate_earning_yield(ebit: ArrayLike, tev: ArrayLike) -> np.ndarray:
+    """Calculates the earning yield rounded to 2 decimals, companies with tev zero
+    receive NaN
+
+    :param ebit: Ebit of the companies
+    :type ebit: ArrayLike
+    :param tev: Total enterprise value of the companies
+    :type tev: ArrayLike
+    :return: Earning yield of the companies
+    :rtype: np.ndarray
+    """
+    tev = _as_float(tev)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        earning_yield = np.where(tev != 0, _as_float(ebit) / np.where(tev != 0, tev, 1), np.nan)
+
+    return np.round(earning_yield, 2)
+
+
+def valid_ebit(ebit: ArrayLike, ebit_min: float) -> np.ndarray:
+    """Validates if the ebit is greater or equal to the minimun
+
+    :param ebit: Ebit of the companies
+    :type ebit: ArrayLike
+    :param ebit_min: Minimun ebit
+    :type ebit_min: float
+    :return: Mask with the result of the validation
+    :rtype: np.ndarray
+    """
+    return _as_float(ebit) >= ebit_min
+
+
+def valid_market_cap(market_cap: ArrayLike, market_cap_min: float) -> np.ndarray:
+    """Validates if the market cap is greater or equal to the minimun
+
+    :param market_cap: Market cap of the companies
+    :type market_cap: ArrayLike
+    :param market_cap_min: Minimun market cap
+    :type market_cap_min: float
+    :return: Mask with the result of the validation
+    :rtype: np.ndarray
+    """
+    return _as_float(market_cap) >= market_cap_min
+
+
+def valid_industry(industry: ArrayLike) -> np.ndarray:
+    """Validates if the industry is valid for this method of calculation
+
+    :param industry: Industry of the companies
+    :type industry: ArrayLike
+    :return: Mask with the result of the validation
+    :rtype: np.ndarray
+    """
+    if not isinstance(industry, pandas.Series):
+        industry = pandas.Series(_as_list(industry), dtype=object)
+
+    return ~industry.astype(str).isin(INVALID_INDUSTRIES).to_numpy()
+
+
+def calculate_graham_vi(vpa: ArrayLike, lpa: ArrayLike, max_p_l: float,
+                        max_p_vp: float) -> np.ndarray:
+    """Calculates the Graham VI, companies with vpa or lpa not positive receive zero
+
+    :param vpa: Value per share of the companies
+    :type vpa: ArrayLike
+    :param lpa: Profit per share of the companies
+    :type lpa: ArrayLike
+    :param max_p_l: Maximum P/L
+    :type max_p_l: float
+    :param max_p_vp: Maximum P/VP
+    :type max_p_vp: float
+    :return: Graham VI of the companies
+    :rtype: np.ndarray
+    """
+    vpa = _as_float(vpa)
+    lpa = _as_float(lpa)
+    valid = (vpa > 0) & (lpa > 0)
+    pre_vi = np.maximum(np.where(valid, (max_p_l * max_p_vp) * vpa * lpa, 0), 0)
+
+    return np.round(np.sqrt(pre_vi), 2)
+
+
+def calculate_graham_upside(current_price: ArrayLike, graham_vi: ArrayLike) -> np.ndarray:
+    """Calculates the Graham upside based on the calculated VI, companies with price
+    or VI not positive receive zero
+
+    :param current_price: Current price of the companies
+    :type current_price: ArrayLike
+    :param graham_vi: Graham VI of the companies
+    :type graham_vi: ArrayLike
+    :return: Graham upside of the companies
+    :rtype: np.ndarray
+    """
+    current_price = _as_float(current_price)
+    graham_vi = _as_float(graham_vi)
+    valid = (current_price > 0) & (graham_vi > 0)
+    upside = (graham_vi - current_price) / np.where(valid, current_price, 1)
+
+    return np.round(np.where(valid, upside, 0), 2)
+
+
+def evaluate_fundamentals(fundamentals: pandas.DataFrame, ebit_min: float = 1,
+                          market_cap_min: float = 0) -> pandas.DataFrame:
+    """Calculates liquid debt, tev, earning yield and the validation masks of every
+    company in one pass
+
+    :param fundamentals: Dataframe with the columns market_cap, total_debt, total_cash,
+        ebit and industry
+    :type fundamentals: pandas.DataFrame
+    :param ebit_min: Minimun ebit, defaults to 1
+    :type ebit_min: float, optional
+    :param market_cap_min: Minimun market cap, defaults to 0
+    :type market_cap_min: float, optional
+    :return: Dataframe with the same index and the columns liquid_debt, tev,
+        earning_yield, valid_industry, valid_ebit, valid_market_cap and
+        valid_earning_yield
+    :rtype: pandas.DataFrame
+    """
+    liquid_debt = calculate_liquid_debt(fundamentals['total_debt'], fundamentals['total_cash'])
+    tev = _as_float(fundamentals['market_cap']) + liquid_debt
+    earning_yield = calculate_earning_yield(fundamentals['ebit'], tev)
+
+    return pandas.DataFrame({
+        'liquid_debt': liquid_debt,
+        'tev': tev,
+        'earning_yield': earning_yield,
+        'valid_industry': valid_industry(fundamentals['industry']),
+        'valid_ebit': valid_ebit(fundamentals['ebit'], ebit_min),
+        'valid_market_cap': valid_market_cap(fundamentals['market_cap'], market_cap_min),
+        'valid_earning_yield': earning_yield > 0,
+    }, index=fundamentals.index)
+
+
+def evaluate_screener(screener: pandas.DataFrame, ebit_min: float = 1,
+                      market_cap_min: float = 0, max_p_l: float = 15,
+                      max_p_vp: float = 1.5) -> pandas.DataFrame:
+    """Calculates the magic formula fields of every company only from the status invest
+    screener columns (price, valormercado, p_ebit, ev_ebit, vpa, lpa, p_vp), the
+    earning yield is the inverse of ev_ebit
+
+    :param screener: Dataframe with the status invest screener columns
+    :type screener: pandas.DataFrame
+    :param ebit_min: Minimun ebit, defaults to 1
+    :type ebit_min: float, optional
+    :param market_cap_min: Minimun market cap, defaults to 0
+    :type market_cap_min: float, optional
+    :param max_p_l: Maximum P/L for the Graham VI, defaults to 15
+    :type max_p_l: float, optional
+    :param max_p_vp: Maximum P/VP for the Graham VI, defaults to 1.5
+    :type max_p_vp: float, optional
+    :return: Dataframe with the same index and the columns market_cap, ebit,
+        current_price, shares_outstanding, patrimonio_liquido, earning_yield,
+        graham_vi, graham_upside, valid_ebit, valid_market_cap and valid_earning_yield
+    :rtype: pandas.DataFrame
+    """
+    market_cap = _as_float(screener['valormercado'])
+    current_price = _as_float(screener['price'])
+    p_ebit = _as_float(screener['p_ebit'])
+    p_vp = _as_float(screener['p_vp'])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ebit = np.where(p_ebit != 0, market_cap / np.where(p_ebit != 0, p_ebit, 1), 0)
+        shares_outstanding = np.where(current_price > 0, market_cap / current_price, 0)
+        patrimonio_liquido = np.where(p_vp != 0, market_cap / np.where(p_vp != 0, p_vp, 1), 0)
+
+    earning_yield = calculate_earning_yield(1, screener['ev_ebit'])
+    earning_yield = np.where(_as_float(screener['ev_ebit']) > 0, earning_yield, np.nan)
+    graham_vi = calculate_graham_vi(screener['vpa'], screener['lpa'], max_p_l, max_p_vp)
+
+    return pandas.DataFrame({
+        'market_cap': market_cap,
+        'ebit': ebit,
+        'current_price': current_price,
+        'shares_outstanding': shares_outstanding,
+        'patrimonio_liquido': patrimonio_liquido,
+        'earning_yield': earning_yield,
+        'graham_vi': graham_vi,
+        'graham_upside': calculate_graham_upside(current_price, graham_vi),
+        'valid_ebit': valid_ebit(ebit, ebit_min),
+        'valid_market_cap': valid_market_cap(market_cap, market_cap_min),
+        'valid_earning_yield': earning_yield > 0,
+    }, index=screener.index)
+
+
+def _as_float(values: ArrayLike) -> np.ndarray:
+    """Converts the values into a float array, missing or non numeric values
+    are considered as zero"""
+    if isinstance(values, (pandas.Series, np.ndarray)) and values.dtype.kind in 'biuf':
+        return np.nan_to_num(np.asarray(values, dtype=float), nan=0.0)
+
+    values = pandas.to_numeric(pandas.Series(_as_list(values), dtype=object), errors='coerce')
+    return np.nan_to_num(values.to_numpy(dtype=float), nan=0.0)
+
+
+def _as_list(values: ArrayLike) -> list:
+    """Converts a scalar or an array into a list"""
+    if isinstance(values, (pandas.Series, np.ndarray, list, tuple)):
+        return list(values)
+
+    return [values]
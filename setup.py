@@ -17,9 +17,13 @@ setup(
         'pandas>=1.1.4',
         'openpyxl>=2.0.7',
         'yahooquery',
+        'requests-futures',
         'bs4',
         'requests>=2.25.1',
         'numpy>=1.1.2',
         'sqlalchemy',
-    ]
+    ],
+    extras_require={
+        'parquet': ['pyarrow'],
+    }
 )
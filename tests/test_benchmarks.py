@@ -0,0 +1,54 @@
+"""Module to test the offline benchmark suite"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from benchmarks import bench_suite
+from benchmarks.universe import build_universe
+from magic_formula.core import TickerInfoBuilder
+
+
+class TestUniverse(unittest.TestCase):
+    def test_build_universe(self):
+        """Test if the universe is deterministic and accepted by the builder"""
+        universe = build_universe(50, seed=7)
+        same_universe = build_universe(50, seed=7)
+
+        self.assertEqual(50, len(universe.tickers))
+        self.assertEqual(50, len(universe.screener))
+        self.assertEqual({symbol[:-3] for symbol in universe.tickers}, universe.stock_tickers)
+        self.assertTrue(universe.screener.equals(same_universe.screener))
+
+        symbol, ticker = next((symbol, ticker) for symbol, ticker in universe.tickers.items()
+                              if isinstance(ticker.all_modules[symbol], dict))
+        ticker_info = TickerInfoBuilder(ticker, symbol, mock.Mock()).build()
+        self.assertTrue(ticker_info.all_modules_found)
+        self.assertEqual(universe.screener.loc[symbol[:-3], 'valormercado'],
+                         ticker_info.market_cap)
+
+
+class TestBenchSuite(unittest.TestCase):
+    def test_run_offline(self):
+        """Test if every stage is measured without any yahoo request"""
+        with mock.patch('yahooquery.Ticker', side_effect=AssertionError('network')):
+            results = bench_suite.run([20], repeat=1)
+
+        self.assertEqual(['TickerInfoBuilder.build', 'process_tickers[THREAD]',
+                          'sort_dataframe', 'export_dataframe_formating',
+                          'export_file[JSON]', 'export_file[EXCEL]'],
+                         [result.name for result in results])
+        for result in results:
+            self.assertLessEqual(result.p50, result.p99)
+            self.assertGreater(result.throughput, 0)
+
+    def test_compare(self):
+        """Test if only the p50 above the threshold is a regression"""
+        result = bench_suite.BenchmarkResult('sort_dataframe', 100, 100, 1000.0,
+                                             0.2, 0.3, 0.4, 1024)
+        self.assertEqual([], bench_suite.compare([result], {}))
+        self.assertEqual([], bench_suite.compare([result], {result.key: {'p50': 0.18}}))
+        self.assertEqual(['sort_dataframe[100]'],
+                         bench_suite.compare([result], {result.key: {'p50': 0.1}}))
@@ -0,0 +1,153 @@
+"""Module to test methods from module cache"""
+import datetime
+import os
+import pickle
+import sys
+import tempfile
+import unittest
+
+import pandas
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../magic_formula')))
+
+from magic_formula import cache
+from magic_formula.core import TickerMock
+
+
+MINIMAL_MODULES = ['assetProfile', 'incomeStatementHistory', 'price']
+
+
+def scenario_ticker(symbol: str) -> TickerMock:
+    ticker = TickerMock()
+    ticker.all_modules = {symbol: {'price': {'marketCap': 10}}}
+    ticker.asset_profile = {symbol: {'industry': 'Utilities'}}
+    ticker.financial_data = {symbol: {'totalCash': 1}}
+    ticker.summary_detail = {symbol: {'dividendYield': 0.01}}
+    ticker.recommendation_trend = pandas.DataFrame({'buy': [1], 'sell': [0]})
+    return ticker
+
+
+class TestSQLiteCacheBackend(unittest.TestCase):
+    """Tests the sqlite cache backend"""
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.backend = cache.SQLiteCacheBackend(
+            os.path.join(self.folder.name, 'fundamentals.db'))
+
+    def tearDown(self):
+        self.backend.close()
+        self.folder.cleanup()
+
+    def test_set_many_get_many(self):
+        """Test if the tickers saved in bulk are returned in one lookup"""
+        self.backend.set_many({'WEGE3.SA': scenario_ticker('WEGE3.SA'),
+                               'PETR4.SA': scenario_ticker('PETR4.SA')})
+
+        tickers = self.backend.get_many(['WEGE3.SA', 'PETR4.SA', 'VALE3.SA'])
+
+        self.assertEqual({'WEGE3.SA', 'PETR4.SA'}, set(tickers.keys()))
+        self.assertEqual({'WEGE3.SA': {'totalCash': 1}}, tickers['WEGE3.SA'].financial_data)
+        self.assertIsInstance(tickers['PETR4.SA'].recommendation_trend, pandas.DataFrame)
+
+    def test_get_many_payloads(self):
+        """Test if the payloads are returned still pickled and decoded later"""
+        self.backend.set('WEGE3.SA', scenario_ticker('WEGE3.SA'))
+
+        payloads = self.backend.get_many_payloads(['WEGE3.SA', 'PETR4.SA'])
+
+        self.assertEqual(['WEGE3.SA'], list(payloads))
+        self.assertIsInstance(payloads['WEGE3.SA']['financial_data'], bytes)
+        ticker = cache.decode_ticker_payload(payloads['WEGE3.SA'])
+        self.assertEqual({'WEGE3.SA': {'industry': 'Utilities'}}, ticker.asset_profile)
+
+    def test_incomplete_entries(self):
+        """Test if only symbols with all modules fresh are returned"""
+        self.backend.set('WEGE3.SA', scenario_ticker('WEGE3.SA'))
+        self.backend.set('PETR4.SA', scenario_ticker('PETR4.SA'))
+        self.backend.connection.execute(
+            "DELETE FROM fundamentals WHERE symbol = 'PETR4.SA' AND module = 'financial_data'")
+
+        self.assertEqual(['WEGE3.SA'], list(self.backend.get_many(['WEGE3.SA', 'PETR4.SA'])))
+        self.assertIsNone(self.backend.get('PETR4.SA'))
+
+    def test_expired_entries(self):
+        """Test if expired entries are not returned"""
+        self.backend.set('WEGE3.SA', scenario_ticker('WEGE3.SA'))
+        self.backend.ttl = datetime.timedelta(seconds=-1)
+
+        self.assertEqual({}, self.backend.get_many(['WEGE3.SA']))
+        self.assertIsNone(self.backend.get('WEGE3.SA'))
+
+    def test_requested_modules(self):
+        """Test if the tickers fetched with fewer modules are misses for a larger request"""
+        self.backend.set('WEGE3.SA', scenario_ticker('WEGE3.SA'), MINIMAL_MODULES)
+        self.backend.set('PETR4.SA', scenario_ticker('PETR4.SA'))
+
+        self.assertEqual(['PETR4.SA'], list(self.backend.get_many(['WEGE3.SA', 'PETR4.SA'])))
+        self.assertEqual(['PETR4.SA'], list(self.backend.get_many_payloads(
+            ['WEGE3.SA', 'PETR4.SA'], MINIMAL_MODULES + ['balanceSheetHistory'])))
+        self.assertEqual({'WEGE3.SA', 'PETR4.SA'}, set(self.backend.get_many(
+            ['WEGE3.SA', 'PETR4.SA'], MINIMAL_MODULES)))
+        self.assertNotIn(cache.REQUESTED_MODULES,
+                         self.backend.get_many_payloads(['WEGE3.SA'], MINIMAL_MODULES)['WEGE3.SA'])
+
+    def test_entries_without_requested_modules(self):
+        """Test if the rows written before the modules were recorded are misses"""
+        self.backend.set('WEGE3.SA', scenario_ticker('WEGE3.SA'))
+        self.backend.connection.execute(
+            f"DELETE FROM fundamentals WHERE module = '{cache.REQUESTED_MODULES}'")
+
+        self.assertEqual({}, self.backend.get_many(['WEGE3.SA']))
+
+
+class TestPickleCacheBackend(unittest.TestCase):
+    """Tests the legacy pickle cache backend"""
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.backend = cache.PickleCacheBackend(self.folder.name)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_reads_legacy_files(self):
+        """Test if the files written by the previous MagicFormula versions are read"""
+        with open(os.path.join(self.folder.name, 'WEGE3.SA.cache'), 'wb') as file:
+            pickle.dump(scenario_ticker('WEGE3.SA'), file)
+
+        self.assertEqual(['WEGE3.SA'], list(self.backend.get_many(['WEGE3.SA', 'PETR4.SA'])))
+        self.assertEqual({'WEGE3.SA': {'totalCash': 1}},
+                         self.backend.get('WEGE3.SA').financial_data)
+
+    def test_get_many_payloads(self):
+        """Test if the payloads are the file contents, only unpickled when decoded"""
+        self.backend.set('WEGE3.SA', scenario_ticker('WEGE3.SA'))
+
+        payloads = self.backend.get_many_payloads(['WEGE3.SA', 'PETR4.SA'])
+
+        self.assertEqual([cache.TICKER_PAYLOAD], list(payloads['WEGE3.SA']))
+        ticker = cache.decode_ticker_payload(payloads['WEGE3.SA'])
+        self.assertEqual({'WEGE3.SA': {'industry': 'Utilities'}}, ticker.asset_profile)
+
+    def test_set_many(self):
+        """Test if set_many writes one file per symbol"""
+        self.backend.set_many({'WEGE3.SA': scenario_ticker('WEGE3.SA')})
+
+        self.assertTrue(os.path.exists(os.path.join(self.folder.name, 'WEGE3.SA.cache')))
+
+    def test_requested_modules(self):
+        """Test if the tickers fetched with fewer modules are misses for a larger request"""
+        self.backend.set('WEGE3.SA', scenario_ticker('WEGE3.SA'), MINIMAL_MODULES)
+
+        self.assertEqual({}, self.backend.get_many(['WEGE3.SA']))
+        self.assertEqual({'WEGE3.SA': {'totalCash': 1}},
+                         self.backend.get('WEGE3.SA', MINIMAL_MODULES).financial_data)
+
+
+class TestGetCacheBackend(unittest.TestCase):
+    def test_invalid_backend(self):
+        with self.assertRaises(ValueError):
+            cache.get_cache_backend('REDIS')
+
+    def test_abstract_backend(self):
+        with self.assertRaises(TypeError):
+            cache.CacheBackend()  # pylint: disable=abstract-class-instantiated
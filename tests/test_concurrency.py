@@ -0,0 +1,189 @@
+"""Module to test the adaptive concurrency controller"""
+import logging
+import os
+import sys
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import requests
+
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../magic_formula')))
+
+
+from magic_formula import concurrency
+from magic_formula.concurrency import AdaptiveConcurrencyController
+from magic_formula.core import TickerBatchFetcher
+from magic_formula.core import get_ticker_outcome
+
+
+class ThrottlingHandler(BaseHTTPRequestHandler):
+    """Handler that answers after the server latency and throttles with 429 when
+    there are more requests in flight than the server capacity"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        server = self.server
+        with server.lock:
+            server.active += 1
+            throttled = server.active > server.capacity
+
+        try:
+            time.sleep(server.latency)
+            body = b'slow down' if throttled else b'ok'
+            self.send_response(429 if throttled else 200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class TestAdaptiveConcurrencyController(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+
+    def record_round(self, controller, outcome, latency, requests=4):
+        for _ in range(requests):
+            controller.record(outcome, latency)
+        return controller.adjust()
+
+    def test_additive_increase(self):
+        controller = AdaptiveConcurrencyController(self.logger, initial_limit=2, max_limit=4)
+
+        self.assertEqual([3, 4, 4], [self.record_round(controller, 'success', 0.1)
+                                     for _ in range(3)])
+        self.assertEqual(2, controller.metrics()['increases'])
+
+    def test_multiplicative_decrease(self):
+        controller = AdaptiveConcurrencyController(self.logger, initial_limit=8)
+
+        self.assertEqual(4, self.record_round(controller, 'throttled', 0.1, requests=1))
+        controller.record('success', 0.1)
+        controller.record('error', 0.1)
+        self.assertEqual(2, controller.adjust())
+        self.assertEqual(1, self.record_round(controller, 'throttled', 0.1))
+        self.assertEqual(1, self.record_round(controller, 'throttled', 0.1))
+
+        metrics = controller.metrics()
+        self.assertEqual(3, metrics['decreases'])
+        self.assertEqual(9, metrics['requests_throttled'])
+
+    def test_latency_decrease(self):
+        controller = AdaptiveConcurrencyController(self.logger, initial_limit=4)
+
+        self.assertEqual(5, self.record_round(controller, 'success', 0.1))
+        self.assertEqual(6, self.record_round(controller, 'success', 0.15))
+        self.assertEqual(3, self.record_round(controller, 'success', 0.5))
+        self.assertIn('latency', controller.history[-1][2])
+
+    def test_empty_round(self):
+        controller = AdaptiveConcurrencyController(self.logger, initial_limit=4)
+
+        self.assertEqual(4, controller.adjust())
+        self.assertEqual(0, controller.metrics()['rounds'])
+        with self.assertRaises(ValueError):
+            controller.record('unknown', 0.1)
+
+    def test_classify_error(self):
+        self.assertEqual('throttled', concurrency.classify_error('429 Too Many Requests'))
+        self.assertEqual('error', concurrency.classify_error(ConnectionError('reset')))
+
+    def test_fetcher_adapts_workers(self):
+        # the fallback records the wall time of a real thread pool against the microseconds
+        # of the mocked chunks, so the latency is left out of the decisions
+        controller = AdaptiveConcurrencyController(self.logger, initial_limit=4,
+                                                   latency_tolerance=float('inf'))
+        fetcher = TickerBatchFetcher(self.logger, chunk_size=2, controller=controller)
+        workers = []
+
+        def fetch_chunk(symbols, max_workers):
+            workers.append(max_workers)
+            if len(workers) == 2:
+                raise RuntimeError('Too Many Requests')
+            return {symbol: mock.Mock() for symbol in symbols}
+
+        with mock.patch.object(fetcher, 'fetch_chunk', side_effect=fetch_chunk):
+            tickers = fetcher.fetch(['A', 'B', 'C', 'D', 'E', 'F'])
+
+        # the symbols of the throttled chunk are fetched one by one, in a round of the limit
+        self.assertEqual([4, 5, 2, 1, 1], workers)
+        self.assertEqual(['A', 'B', 'C', 'D', 'E', 'F'], sorted(tickers))
+        self.assertEqual(4, controller.limit)
+        self.assertEqual((6, 0, 2), tuple(controller.metrics()[f'requests_{outcome}']
+                                          for outcome in concurrency.OUTCOMES))
+        self.assertEqual([(1, 5, 'no congestion'), (2, 2, '2 throttled'),
+                          (3, 3, 'no congestion'), (4, 4, 'no congestion')],
+                         controller.history)
+
+    def test_fetcher_fallback_follows_limit(self):
+        controller = AdaptiveConcurrencyController(self.logger, initial_limit=2)
+        fetcher = TickerBatchFetcher(self.logger, chunk_size=6, controller=controller)
+        rounds = []
+
+        def fetch_chunk(symbols, max_workers):
+            if len(symbols) > 1:
+                raise RuntimeError('Too Many Requests')
+            rounds.append(controller.limit)
+            raise RuntimeError('429 Too Many Requests')
+
+        with mock.patch.object(fetcher, 'fetch_chunk', side_effect=fetch_chunk):
+            tickers = fetcher.fetch(['A', 'B', 'C', 'D', 'E', 'F'])
+
+        self.assertEqual([1, 1, 1, 1, 1, 1], rounds)
+        self.assertEqual('throttled', get_ticker_outcome(tickers['A'], 'A'))
+        self.assertEqual(7, controller.metrics()['rounds'])
+
+
+class TestAdaptiveConcurrencyEndpoint(unittest.TestCase):
+    """Drives the controller against a local endpoint with latency and 429s"""
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ThrottlingHandler)
+        self.server.lock = threading.Lock()
+        self.server.active = 0
+        self.server.capacity = 6
+        self.server.latency = 0.05
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/quote'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def request(self, controller, barrier):
+        barrier.wait()
+        start = time.perf_counter()
+        try:
+            response = requests.get(self.url, timeout=5)
+            outcome = 'throttled' if response.status_code == 429 else 'success'
+        except requests.RequestException as error:
+            outcome = concurrency.classify_error(error)
+        controller.record(outcome, time.perf_counter() - start)
+
+    def test_converges_to_capacity(self):
+        controller = AdaptiveConcurrencyController(logging.getLogger(__name__),
+                                                   initial_limit=2, max_limit=16,
+                                                   latency_tolerance=50)
+        limits = []
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            for _ in range(20):
+                limit = controller.limit
+                barrier = threading.Barrier(limit)
+                list(executor.map(lambda _: self.request(controller, barrier), range(limit)))
+                limits.append(controller.adjust())
+
+        metrics = controller.metrics()
+        self.assertGreater(metrics['requests_throttled'], 0)
+        self.assertGreater(metrics['decreases'], 0)
+        self.assertGreater(max(limits), self.server.capacity)
+        self.assertLessEqual(max(limits[-10:]), self.server.capacity + 2)
+        self.assertGreaterEqual(min(limits[-10:]), self.server.capacity // 2)
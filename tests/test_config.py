@@ -1,7 +1,12 @@
+import io
+import multiprocessing
 import os
 import sys
+import tempfile
 import unittest
+from unittest import mock
 import logging
+from concurrent.futures import ProcessPoolExecutor
 
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../magic_formula')))
@@ -10,6 +15,11 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../magi
 from magic_formula.config import get_config
 from magic_formula.config import set_logger
 from magic_formula.config import get_arguments
+from magic_formula.config import LocalQueueHandler
+from magic_formula.config import process_log_queue
+from magic_formula.config import set_process_logger
+from magic_formula.config import TickerLogFilter
+from magic_formula.config import stop_logger
 
 
 def scenario_logger():
@@ -17,12 +27,19 @@ def scenario_logger():
     return logger
 
 
+def log_on_process(symbol: str) -> str:
+    logging.getLogger('test_process_log_queue').info('Processing ticker - %s', symbol,
+                                                     extra={'ticker': symbol})
+    return symbol
+
+
 class TestSetup(unittest.TestCase):
     def test_get_config(self):
         config = get_config('tests/teste.json')
         self.assertIsNotNone(config)
         self.assertIsInstance(config, dict)
         self.assertEqual(config['BRX10_URL'], 'https://statusinvest.com.br/indices/indice-brasil-100')
+        self.assertEqual(config['YAHOO_URL'], 'https://query2.finance.yahoo.com')
 
     def test_set_logger(self):
         logger = scenario_logger()
@@ -36,6 +53,109 @@ class TestSetup(unittest.TestCase):
         for handler in logger_formated.handlers:
             self.assertEqual(handler.formatter._fmt, format)
 
+    def test_set_logger_queue(self):
+        logger = logging.Logger('test_set_logger_queue')
+        ticker_filter = TickerLogFilter(rate_limit=2)
+        with tempfile.TemporaryDirectory() as folder:
+            log_file_name = os.path.join(folder, 'logs', 'test_queue.log')
+            set_logger(logger, log_file_name=log_file_name, queue_logging=True,
+                       ticker_filter=ticker_filter)
+            self.assertEqual(1, len(logger.handlers))
+            self.assertIsInstance(logger.handlers[0], LocalQueueHandler)
+
+            for number in range(10):
+                logger.info('Processing ticker - %s', f'T{number}',
+                            extra={'ticker': f'T{number}'})
+            logger.error('Error processing ticker %s', 'T0', extra={'ticker': 'T0'})
+            stop_logger(logger)
+
+            with open(log_file_name) as file:
+                lines = file.read().splitlines()
+
+        self.assertEqual([], logger.handlers)
+        self.assertEqual(8, ticker_filter.dropped)
+        self.assertEqual(['Processing ticker - T0', 'Processing ticker - T1',
+                          'Error processing ticker T0',
+                          'Dropped 8 per-ticker log records by sampling and rate limit'],
+                         [line.split(' - ', 4)[4] for line in lines[-4:]])
+
+    def test_set_logger_filter_once(self):
+        """Test if the file and stdout receive the same records and each record takes
+        one token of the rate limit"""
+        logger = logging.Logger('test_set_logger_filter_once')
+        ticker_filter = TickerLogFilter(rate_limit=2)
+        with tempfile.TemporaryDirectory() as folder, \
+                mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            log_file_name = os.path.join(folder, 'test_filter.log')
+            set_logger(logger, log_file_name=log_file_name, ticker_filter=ticker_filter)
+            for number in range(10):
+                logger.info('Processing ticker - %s', f'T{number}',
+                            extra={'ticker': f'T{number}'})
+            stop_logger(logger)
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+                handler.close()
+
+            with open(log_file_name) as file:
+                lines = file.read().splitlines()
+
+        self.assertEqual(8, ticker_filter.dropped)
+        self.assertEqual(lines, stdout.getvalue().splitlines())
+        self.assertEqual(['Processing ticker - T0', 'Processing ticker - T1',
+                          'Dropped 8 per-ticker log records by sampling and rate limit'],
+                         [line.split(' - ', 4)[4] for line in lines])
+
+    def test_ticker_log_filter_rate_below_one(self):
+        """Test if a rate limit below one record by second still keeps records"""
+        ticker_filter = TickerLogFilter(rate_limit=0.5)
+        record = logging.LogRecord('test', logging.INFO, '', 0, 'Processing ticker', (), None)
+        record.ticker = 'T0'
+
+        self.assertTrue(ticker_filter.filter(record))
+        self.assertFalse(ticker_filter.filter(record))
+        with mock.patch('time.monotonic', return_value=ticker_filter.refilled_at + 2):
+            self.assertTrue(ticker_filter.filter(record))
+
+    def test_process_log_queue(self):
+        """Test if the records of the workers are written by the parent on every start method"""
+        logger = logging.getLogger('test_process_log_queue')
+        for method in multiprocessing.get_all_start_methods():
+            with tempfile.TemporaryDirectory() as folder:
+                log_file_name = os.path.join(folder, f'test_{method}.log')
+                set_logger(logger, log_file_name=log_file_name)
+                try:
+                    context = multiprocessing.get_context(method)
+                    with process_log_queue(logger, context) as log_queue, ProcessPoolExecutor(
+                            max_workers=2, mp_context=context,
+                            initializer=set_process_logger,
+                            initargs=(logger.name, log_queue, logger.level)) as executor:
+                        list(executor.map(log_on_process, ['T0', 'T1', 'T2']))
+                finally:
+                    for handler in list(logger.handlers):
+                        logger.removeHandler(handler)
+                        handler.close()
+
+                with open(log_file_name) as file:
+                    messages = sorted(line.split(' - ', 4)[4]
+                                      for line in file.read().splitlines())
+
+            self.assertEqual(['Processing ticker - T0', 'Processing ticker - T1',
+                              'Processing ticker - T2'], messages, method)
+
+    def test_ticker_log_filter_sample(self):
+        ticker_filter = TickerLogFilter(sample_rate=0.25)
+        records = {symbol: logging.LogRecord('test', logging.INFO, '', 0, symbol, (), None)
+                   for symbol in (f'T{number}' for number in range(1000))}
+        for symbol, record in records.items():
+            record.ticker = symbol
+        kept = {symbol for symbol, record in records.items() if ticker_filter.filter(record)}
+
+        self.assertTrue(150 < len(kept) < 350)
+        self.assertEqual(kept, {symbol for symbol, record in records.items()
+                                if ticker_filter.filter(record)})
+        self.assertTrue(ticker_filter.filter(
+            logging.LogRecord('test', logging.INFO, '', 0, 'Processing tickers', (), None)))
+
     def test_get_arguments_defaults(self):
         options = get_arguments([])
         self.assertFalse(options.version)
@@ -58,3 +178,20 @@ class TestSetup(unittest.TestCase):
             self.assertEqual(options.ebit, args[1][2])
             self.assertEqual(options.market_cap, args[1][3])
             self.assertEqual(options.qty, args[1][4])
+
+    def test_get_arguments_cache_backend(self):
+        self.assertEqual('SQLITE', get_arguments([]).cache_backend)
+        self.assertEqual('PICKLE', get_arguments(['-cb', 'pickle']).cache_backend)
+        with self.assertRaises(SystemExit):
+            get_arguments(['-cb', 'redis'])
+
+    def test_get_arguments_choices(self):
+        """Test if the options with a fixed set of values are validated by the parser"""
+        options = get_arguments(['-s', 'statusinvest', '-x', 'process', '-ym', 'all',
+                                 '-rt', 'DENSE'])
+        self.assertEqual(['STATUSINVEST', 'PROCESS', 'ALL', 'dense'],
+                         [options.source, options.executor, options.yahoo_modules,
+                          options.rank_ties])
+        for args in (['-s', 'google'], ['-x', 'fiber'], ['-ym', 'some'], ['-rt', 'max']):
+            with self.assertRaises(SystemExit), mock.patch('sys.stderr'):
+                get_arguments(args)
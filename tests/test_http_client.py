@@ -0,0 +1,200 @@
+"""Module to test the http client against a local http server"""
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from requests_futures.sessions import FuturesSession
+
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../magic_formula')))
+
+
+from magic_formula.core import get_yahoo_ticker
+from magic_formula.http_client import HttpClient
+from magic_formula.http_client import RedirectSession
+from magic_formula.instrumentation import RunReport
+from magic_formula.instrumentation import set_run_report
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Handler that answers according to the path:
+    /ok returns 200, /flaky fails with 503 on the first two requests,
+    /throttled returns 429 with Retry-After, /slow sleeps before answering"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.headers.get('user-agent')))
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            count = sum(1 for path, _ in server.requests if path == self.path)
+
+        try:
+            if self.path == '/flaky' and count <= 2:
+                self.answer(503, b'unavailable')
+            elif self.path == '/throttled' and count <= 1:
+                self.answer(429, b'slow down', {'Retry-After': '0'})
+            elif self.path == '/missing':
+                self.answer(404, b'not found')
+            elif self.path == '/slow':
+                time.sleep(0.2)
+                self.answer(200, b'slow')
+            else:
+                self.answer(200, b'ok')
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def answer(self, status: int, body: bytes, headers: dict = None):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class StandInTicker:
+    """Stands in for yahooquery.Ticker, building its session the same way"""
+    def __init__(self, symbols, asynchronous=False, max_workers=8):
+        self.symbols = symbols
+        self.session = requests.Session()
+        if asynchronous:
+            self.session = FuturesSession(max_workers=max_workers, session=self.session)
+
+
+class TestHttpClient(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.active = 0
+        self.server.max_active = 0
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_get_with_headers(self):
+        client = HttpClient(headers={'user-agent': 'magic-formula-test'})
+        response = client.get(f'{self.url}/ok')
+
+        self.assertEqual(b'ok', response.content)
+        self.assertEqual([('/ok', 'magic-formula-test')], self.server.requests)
+
+    def test_retry_on_error_status(self):
+        client = HttpClient(retries=3, backoff=0.01)
+        response = client.get(f'{self.url}/flaky')
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(3, len(self.server.requests))
+
+    def test_retry_after_on_throttle(self):
+        client = HttpClient(retries=1, backoff=10)
+        start = time.perf_counter()
+        response = client.get(f'{self.url}/throttled')
+
+        self.assertEqual(200, response.status_code)
+        self.assertLess(time.perf_counter() - start, 5)
+
+    def test_retries_exhausted(self):
+        client = HttpClient(retries=1, backoff=0.01)
+        with self.assertRaises(requests.HTTPError):
+            client.get(f'{self.url}/flaky')
+
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_no_retry_on_client_error(self):
+        client = HttpClient(retries=3, backoff=0.01)
+        with self.assertRaises(requests.HTTPError):
+            client.get(f'{self.url}/missing')
+
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_timeout(self):
+        client = HttpClient(timeout=0.05, retries=0)
+        with self.assertRaises(requests.Timeout):
+            client.get(f'{self.url}/slow')
+
+    def test_concurrency_cap(self):
+        client = HttpClient(max_connections=2)
+        threads = [threading.Thread(target=client.get, args=(f'{self.url}/slow',))
+                   for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(6, len(self.server.requests))
+        self.assertLessEqual(self.server.max_active, 2)
+
+    def test_close_before_retry(self):
+        """Test if the responses discarded by the retries are closed"""
+        client = HttpClient(retries=3, backoff=0.01)
+        with mock.patch.object(requests.Response, 'close', autospec=True) as close:
+            response = client.get(f'{self.url}/flaky', stream=True)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, close.call_count)
+
+    def test_stream_holds_connection_slot(self):
+        """Test if a streamed response keeps its slot of the cap until it is closed"""
+        client = HttpClient(max_connections=1)
+        response = client.get(f'{self.url}/ok', stream=True)
+        self.assertFalse(client.semaphore.acquire(blocking=False))
+
+        self.assertEqual(b'ok', b''.join(response.iter_content(1)))
+        response.close()
+        response.close()
+        self.assertTrue(client.semaphore.acquire(blocking=False))
+        client.semaphore.release()
+
+    def test_yahoo_ticker_counts_bytes(self):
+        """Test if the sessions built by yahooquery for the real yahoo url count the bytes"""
+        with mock.patch('yahooquery.Ticker', StandInTicker):
+            ticker = get_yahoo_ticker('WEGE3.SA')
+            tickers = get_yahoo_ticker(['WEGE3.SA', 'PETR4.SA'])
+        self.assertIsInstance(tickers.session, FuturesSession)
+
+        report = RunReport()
+        set_run_report(report)
+        try:
+            with report.stage('fetch_tickers'):
+                ticker.session.get(f'{self.url}/ok')
+                tickers.session.get(f'{self.url}/slow').result()
+        finally:
+            set_run_report(None)
+
+        self.assertEqual(len(b'ok') + len(b'slow'), report.stages[0].bytes_fetched)
+
+    def test_backoff(self):
+        client = HttpClient(backoff=1, max_backoff=3)
+
+        self.assertEqual(2.0, client.get_backoff(0, '2'))
+        self.assertEqual(3.0, client.get_backoff(0, '60'))
+        for attempt in range(5):
+            self.assertLessEqual(client.get_backoff(attempt), 3)
+
+
+class TestRedirectSession(unittest.TestCase):
+    def test_redirect(self):
+        session = RedirectSession('http://127.0.0.1:8765/yahoo')
+
+        self.assertEqual('http://127.0.0.1:8765/yahoo/v10/finance/quoteSummary/WEGE3.SA'
+                         '?modules=price',
+                         session.redirect('https://query2.finance.yahoo.com/v10/finance/'
+                                          'quoteSummary/WEGE3.SA?modules=price'))
+        self.assertEqual('https://statusinvest.com.br/indices/ibovespa',
+                         session.redirect('https://statusinvest.com.br/indices/ibovespa'))
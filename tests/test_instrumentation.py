@@ -0,0 +1,91 @@
+"""Module to test the instrumentation of the pipeline stages"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from magic_formula import instrumentation
+from magic_formula.instrumentation import RunReport
+
+
+class TestRunReport(unittest.TestCase):
+    def tearDown(self):
+        instrumentation.set_run_report(None)
+
+    def test_stage(self):
+        """Test if the counters of any thread go to the stage running"""
+        report = RunReport({'version': 'test'})
+        instrumentation.set_run_report(report)
+        instrumentation.add_counters(cache_hits=5)
+
+        with report.stage('fetch') as stage:
+            threads = [threading.Thread(target=instrumentation.add_counters,
+                                        kwargs={'cache_misses': 1, 'bytes_fetched': 10})
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            stage.items = 4
+        with self.assertRaises(KeyError):
+            with report.stage('failed'):
+                raise KeyError('price')
+
+        self.assertEqual(['fetch', 'failed'], [stage.name for stage in report.stages])
+        fetch = report.stages[0]
+        self.assertEqual((4, 0, 4, 40), (fetch.items, fetch.cache_hits, fetch.cache_misses,
+                                         fetch.bytes_fetched))
+        self.assertGreaterEqual(fetch.wall_time, 0)
+        with self.assertRaises(ValueError):
+            with report.stage('invalid'):
+                instrumentation.add_counters(rows=1)
+
+    def test_nested_stage(self):
+        """Test if the inner stages are kept as children out of the totals of the run"""
+        report = RunReport()
+        instrumentation.set_run_report(report)
+        with report.stage('process_tickers'):
+            with instrumentation.run_stage('fetch_tickers'):
+                instrumentation.add_counters(cache_misses=2)
+            with instrumentation.run_stage('build_tickers') as stage:
+                stage.items = 2
+
+        self.assertEqual([('process_tickers', None), ('fetch_tickers', 'process_tickers'),
+                          ('build_tickers', 'process_tickers')],
+                         [(stage.name, stage.parent) for stage in report.stages])
+        self.assertEqual([0, 2, 0], [stage.cache_misses for stage in report.stages])
+        self.assertEqual(report.stages[0].wall_time, report.to_dict()['wall_time'])
+        self.assertIn('  fetch_tickers', report.format_table())
+
+    def test_run_stage_without_report(self):
+        """Test if the stages are not kept when the run is not instrumented"""
+        with instrumentation.run_stage('fetch_tickers') as stage:
+            stage.items = 1
+        self.assertEqual('fetch_tickers', stage.name)
+
+    def test_add_counters_without_report(self):
+        """Test if the counters are ignored when the run is not instrumented"""
+        instrumentation.add_counters(cache_hits=1)
+        self.assertEqual([b'ab', b'c'], list(instrumentation.count_bytes([b'ab', b'c'])))
+
+    def test_write(self):
+        """Test if the report is written as json and summarized on the table"""
+        report = RunReport({'arguments': {'index': ['BRX100']}})
+        with report.stage('sort_dataframe') as stage:
+            stage.items = 3
+
+        with tempfile.TemporaryDirectory() as folder:
+            file_name = os.path.join(folder, 'run.report.json')
+            report.write(file_name)
+            with open(file_name) as file:
+                content = json.load(file)
+
+        self.assertEqual(['BRX100'], content['metadata']['arguments']['index'])
+        self.assertEqual('sort_dataframe', content['stages'][0]['name'])
+        self.assertEqual(3, content['stages'][0]['items'])
+        self.assertIn('sort_dataframe', report.format_table())
+        self.assertEqual(3, len(report.format_table().splitlines()))
@@ -12,7 +12,10 @@ sys.path.append(
 sys.path.append(
     os.path.abspath(os.path.join(os.path.dirname(__file__), '../tests')))
 
+from magic_formula import cache
 from magic_formula import core
+from magic_formula import valuation
+from ticker_fixtures import load_fixture_ticker
 
 
 class TestMagicFormula(unittest.TestCase):
@@ -89,7 +92,7 @@ class TestMagicFormula(unittest.TestCase):
 
         wege = self.wege
         with mock.patch.object(wege, 'fill_ticker_info'):
-            wege.ticker_info.asset_profile = 'teste'
+            wege.ticker_info.all_modules_found = False
             return_ = wege.get_ticker_info()
 
             self.assertIsNone(return_)
@@ -169,28 +172,9 @@ class TestTickerInfoBuilder(unittest.TestCase):
     def setUp(self, logger, ticker):  # pylint: disable=arguments-differ
         self.symbol = 'WEGE3.SA'
         self.logger = logger
-        self.ticker = self.get_ticker_pickles(ticker)
+        self.ticker = load_fixture_ticker(ticker)
         self.builder = core.TickerInfoBuilder(self.ticker, self.symbol)
 
-    def get_ticker_pickles(self, ticker):
-        """Get pickled ticker"""
-        ticker_all_modules = pickle.load(open('tests/ticker.all_modules.pkl', 'rb'))
-        ticker.all_modules = ticker_all_modules
-
-        ticker_asset_profile = pickle.load(open('tests/ticker.asset_profile.pkl', 'rb'))
-        ticker.asset_profile = ticker_asset_profile
-
-        ticker_financial_data = pickle.load(open('tests/ticker.financial_data.pkl', 'rb'))
-        ticker.financial_data = ticker_financial_data
-
-        ticker_summary_detail = pickle.load(open('tests/ticker.summary_detail.pkl', 'rb'))
-        ticker.summary_detail = ticker_summary_detail
-
-        ticker_recommendation_trend = pickle.load(
-            open('tests/ticker.recommendation_trend.pkl', 'rb'))
-        ticker.recommendation_trend = ticker_recommendation_trend
-        return ticker
-
     def save_ticker_picles(self) -> None:
         """Method to save the pickles if the methods change over time"""
         ticker: yahooquery.Ticker = yahooquery.Ticker(self.symbol)
@@ -305,3 +289,332 @@ class TestTickerInfoBuilder(unittest.TestCase):
 
     def test_get_total_stockholder_equity(self) -> None:
         pass
+
+
+class TestTickerBatchFetcher(unittest.TestCase):
+    """Tests the batch fetch of several symbols"""
+    @mock.patch('logging.Logger')
+    def setUp(self, logger):  # pylint: disable=arguments-differ
+        self.logger = logger
+        self.batch = load_fixture_ticker()
+        self.batch.all_modules['PETR4.SA'] = 'No fundamentals data found'
+
+    def test_get_chunks(self):
+        """Test if the symbols are split by chunk_size"""
+        fetcher = core.TickerBatchFetcher(self.logger, chunk_size=2)
+        chunks = fetcher.get_chunks(['A', 'B', 'C', 'D', 'E'])
+        self.assertEqual([['A', 'B'], ['C', 'D'], ['E']], chunks)
+
+    def test_split_ticker_batch(self):
+        """Test if each symbol receives only its own information"""
+        tickers = core.split_ticker_batch(self.batch, ['WEGE3.SA', 'PETR4.SA'])
+
+        wege = tickers['WEGE3.SA']
+        self.assertEqual(['WEGE3.SA'], list(wege.all_modules.keys()))
+        self.assertEqual(['WEGE3.SA'], list(wege.recommendation_trend.index.get_level_values(0).unique()))
+
+        petr = tickers['PETR4.SA']
+        self.assertEqual('No fundamentals data found', petr.all_modules['PETR4.SA'])
+        self.assertEqual({}, petr.financial_data)
+        self.assertTrue(petr.recommendation_trend.empty)
+
+    def test_get_ticker_outcome(self):
+        """Test if the errors, the throttling and the missing symbols are not successes"""
+        self.batch.all_modules['VALE3.SA'] = '429 Too Many Requests'
+        tickers = core.split_ticker_batch(self.batch, ['WEGE3.SA', 'PETR4.SA', 'VALE3.SA',
+                                                       'ITUB4.SA'])
+        self.assertEqual({'WEGE3.SA': 'success', 'PETR4.SA': 'error', 'VALE3.SA': 'throttled',
+                          'ITUB4.SA': 'error'},
+                         {symbol: core.get_ticker_outcome(ticker, symbol)
+                          for symbol, ticker in tickers.items()})
+
+        batch = core.TickerMock()
+        batch.all_modules = {'error': 'HTTP 404 Not Found.  Please try again'}
+        ticker = core.split_ticker_batch(batch, ['WEGE3.SA'])['WEGE3.SA']
+        self.assertEqual('HTTP 404 Not Found.  Please try again',
+                         ticker.all_modules['WEGE3.SA'])
+        self.assertEqual('error', core.get_ticker_outcome(ticker, 'WEGE3.SA'))
+
+    def test_split_ticker_batch_builds_ticker_info(self):
+        """Test if the splitted ticker is accepted by the TickerInfoBuilder"""
+        ticker = core.split_ticker_batch(self.batch, ['WEGE3.SA'])['WEGE3.SA']
+        ticker_info = core.TickerInfoBuilder(ticker, 'WEGE3.SA', self.logger).build()
+
+        self.assertTrue(ticker_info.all_modules_found)
+        self.assertEqual(ticker_info.recommendation_trend, core.RecomenationTrend(3, 10))
+
+    def test_fetch_uses_one_ticker_per_chunk(self):
+        """Test if yahooquery.Ticker is created once per chunk"""
+        fetcher = core.TickerBatchFetcher(self.logger, chunk_size=2)
+        with mock.patch('yahooquery.Ticker') as ticker:
+            ticker.return_value = self.batch
+            tickers = fetcher.fetch(['WEGE3.SA', 'PETR4.SA', 'VALE3.SA'])
+
+        self.assertEqual(2, ticker.call_count)
+        self.assertEqual({'WEGE3.SA', 'PETR4.SA', 'VALE3.SA'}, set(tickers.keys()))
+
+    def test_fetch_fills_missing_recommendation_trend(self):
+        """Test if an empty multi-symbol trend is built from all_modules or fetched again
+        and if the ticker without a trend is not cacheable"""
+        trend_batch = core.TickerMock()
+        trend_batch.recommendation_trend = self.batch.recommendation_trend
+        self.batch.recommendation_trend = {'error': 'HTTP 404 Not Found.  Please try again'}
+        fetcher = core.TickerBatchFetcher(self.logger)
+        with mock.patch('yahooquery.Ticker') as ticker:
+            ticker.return_value = self.batch
+            tickers = fetcher.fetch(['WEGE3.SA', 'PETR4.SA'])
+
+        self.assertEqual(1, ticker.call_count)
+        info = core.TickerInfoBuilder(tickers['WEGE3.SA'], 'WEGE3.SA', self.logger).build()
+        self.assertEqual(core.RecomenationTrend(3, 10), info.recommendation_trend)
+        self.assertTrue(core.is_cacheable_ticker(tickers['WEGE3.SA'], 'WEGE3.SA'))
+
+        del self.batch.all_modules['WEGE3.SA']['recommendationTrend']
+        with mock.patch('yahooquery.Ticker') as ticker:
+            ticker.side_effect = [self.batch, trend_batch]
+            tickers = fetcher.fetch(['WEGE3.SA', 'PETR4.SA'])
+
+        self.assertEqual(2, ticker.call_count)
+        self.assertEqual('WEGE3.SA', ticker.call_args[0][0])
+        self.assertTrue(core.is_cacheable_ticker(tickers['WEGE3.SA'], 'WEGE3.SA'))
+
+        tickers['WEGE3.SA'].recommendation_trend = pandas.DataFrame()
+        self.assertFalse(core.is_cacheable_ticker(tickers['WEGE3.SA'], 'WEGE3.SA'))
+
+    def test_fetch_rebuilds_empty_recommendation_trend(self):
+        """Test if an empty multi-symbol trend is rebuilt when the recommendationTrend
+        module of all_modules has trends, and kept when the module has none"""
+        self.batch.recommendation_trend = pandas.DataFrame()
+        fetcher = core.TickerBatchFetcher(self.logger)
+        with mock.patch('yahooquery.Ticker') as ticker:
+            ticker.return_value = self.batch
+            tickers = fetcher.fetch(['WEGE3.SA', 'PETR4.SA'])
+
+        self.assertEqual(1, ticker.call_count)
+        self.assertFalse(tickers['WEGE3.SA'].recommendation_trend.empty)
+        info = core.TickerInfoBuilder(tickers['WEGE3.SA'], 'WEGE3.SA', self.logger).build()
+        self.assertEqual(core.RecomenationTrend(3, 10), info.recommendation_trend)
+
+        tickers['WEGE3.SA'].recommendation_trend = pandas.DataFrame()
+        self.assertFalse(core.valid_recommendation_trend(tickers['WEGE3.SA'], 'WEGE3.SA'))
+        tickers['WEGE3.SA'].all_modules['WEGE3.SA']['recommendationTrend'] = {'trend': []}
+        self.assertTrue(core.valid_recommendation_trend(tickers['WEGE3.SA'], 'WEGE3.SA'))
+
+    def get_modules_result(self, modules):
+        """Returns the get_modules result of the recorded modules"""
+        wege = self.batch.all_modules['WEGE3.SA']
+        return {'WEGE3.SA': {module: wege[module] for module in modules if module in wege},
+                'PETR4.SA': 'Quote not found for ticker symbol: PETR4.SA'}
+
+    def test_get_required_modules(self):
+        """Test if the modules are derived from the fields, screening always included"""
+        self.assertEqual(['assetProfile', 'incomeStatementHistory', 'price'],
+                         core.get_required_modules(['long_name']))
+        self.assertIn('recommendationTrend', core.get_required_modules(['recommendation_trend']))
+        self.assertNotIn('summaryDetail', core.get_required_modules(['total_cash']))
+        with self.assertRaises(ValueError):
+            core.get_required_modules(['roic'])
+
+    def test_fetch_minimal_modules(self):
+        """Test if the minimal profile makes a single get_modules request by chunk and
+        builds the same TickerInfo of all_modules"""
+        modules = core.get_required_modules()
+        fetcher = core.TickerBatchFetcher(self.logger, modules=modules)
+        with mock.patch('yahooquery.Ticker') as ticker:
+            ticker.return_value.get_modules.side_effect = self.get_modules_result
+            tickers = fetcher.fetch(['WEGE3.SA', 'PETR4.SA'])
+
+        ticker.return_value.get_modules.assert_called_once_with(modules)
+        self.assertEqual('Quote not found for ticker symbol: PETR4.SA',
+                         tickers['PETR4.SA'].asset_profile['PETR4.SA'])
+
+        ticker_info = core.TickerInfoBuilder(tickers['WEGE3.SA'], 'WEGE3.SA', self.logger).build()
+        wege = self.batch.all_modules['WEGE3.SA']
+        self.assertTrue(ticker_info.all_modules_found)
+        self.assertEqual('Specialty Industrial Machinery', ticker_info.industry)
+        self.assertEqual(2812454000, ticker_info.ebit)
+        self.assertEqual(wege['financialData']['currentPrice'], ticker_info.current_price)
+        self.assertEqual(wege['price']['marketCap'], ticker_info.market_cap)
+        self.assertEqual(core.RecomenationTrend(3, 10), ticker_info.recommendation_trend)
+
+    def test_build_modules_batch_error(self):
+        """Test if an error of the whole request is kept on every module"""
+        batch = core.build_modules_batch('Too Many Requests')
+        self.assertEqual('Too Many Requests', batch.all_modules)
+        self.assertEqual('Too Many Requests', batch.asset_profile)
+        self.assertTrue(batch.recommendation_trend.empty)
+
+
+class TestTickerInfoBuild(unittest.TestCase):
+    """Tests the TickerInfo built from the recorded WEGE3.SA modules"""
+    @mock.patch('logging.Logger')
+    def setUp(self, logger):  # pylint: disable=arguments-differ
+        self.symbol = 'WEGE3.SA'
+        self.logger = logger
+        self.ticker = load_fixture_ticker()
+
+    def test_build(self):
+        """Test if the fields are extracted from the yahoo modules"""
+        ticker_info = core.TickerInfoBuilder(self.ticker, self.symbol, self.logger).build()
+
+        self.assertTrue(ticker_info.all_modules_found)
+        self.assertEqual('Specialty Industrial Machinery', ticker_info.industry)
+        self.assertEqual(2812454000, ticker_info.ebit)
+        self.assertEqual(30.73, ticker_info.current_price)
+        self.assertEqual(2942361088, ticker_info.total_cash)
+        self.assertEqual(1972669056, ticker_info.total_debt)
+        self.assertEqual(core.RecomenationTrend(3, 10), ticker_info.recommendation_trend)
+
+    def test_build_resolves_modules_once(self):
+        """Test if complete uses the modules resolved by build_screening"""
+        builder = core.TickerInfoBuilder(self.ticker, self.symbol, self.logger)
+        with mock.patch.object(builder, 'get_all_modules',
+                               wraps=builder.get_all_modules) as get_all_modules, \
+                mock.patch.object(builder, 'get_asset_profile',
+                                  wraps=builder.get_asset_profile) as get_asset_profile:
+            ticker_info = builder.build()
+
+        self.assertEqual(1, get_all_modules.call_count)
+        self.assertEqual(1, get_asset_profile.call_count)
+        self.assertEqual(30.73, ticker_info.current_price)
+
+    def test_build_is_compact(self):
+        """Test if the TickerInfo does not keep the yahoo modules by default"""
+        ticker_info = core.TickerInfoBuilder(self.ticker, self.symbol, self.logger).build()
+
+        self.assertIsNone(ticker_info.raw_modules)
+        self.assertFalse(hasattr(ticker_info, '__dict__'))
+        with self.assertRaises(AttributeError):
+            ticker_info.financial_data = {}
+
+    def test_build_keep_raw_modules(self):
+        """Test if the yahoo modules are kept when requested"""
+        ticker_info = core.TickerInfoBuilder(self.ticker, self.symbol, self.logger,
+                                             keep_raw_modules=True).build()
+
+        self.assertEqual(self.ticker.financial_data[self.symbol],
+                         ticker_info.raw_modules.financial_data)
+
+    def test_build_asset_profile_error(self):
+        """Test if an error message on asset_profile invalidates the modules"""
+        self.ticker.asset_profile = {self.symbol: 'No fundamentals data found'}
+        ticker_info = core.TickerInfoBuilder(self.ticker, self.symbol, self.logger).build()
+
+        self.assertFalse(ticker_info.all_modules_found)
+
+
+class TestMagicFormulaLazyValidation(unittest.TestCase):
+    """Tests that the expensive fields are only extracted for valid tickers"""
+    @mock.patch('logging.Logger')
+    def setUp(self, logger):  # pylint: disable=arguments-differ
+        self.logger = logger
+        self.ticker = load_fixture_ticker()
+
+    def test_valid_ticker_is_completed(self):
+        stock = core.MagicFormula('WEGE3.SA', self.logger)
+        self.assertIs(self.ticker, stock.get_ticker_info(self.ticker))
+        self.assertIsNone(stock.rejection_reason)
+        self.assertEqual(core.RecomenationTrend(3, 10), stock.ticker_info.recommendation_trend)
+        self.assertEqual(30.73, stock.ticker_info.current_price)
+
+    def test_rejected_ticker_skips_recommendation_trend(self):
+        stock = core.MagicFormula('WEGE3.SA', self.logger, ebit_min=10 ** 12)
+        with mock.patch.object(core.TickerInfoBuilder,
+                               'get_recomendation_trend') as recomendation_trend:
+            self.assertIsNone(stock.get_ticker_info(self.ticker))
+            recomendation_trend.assert_not_called()
+
+        self.assertEqual(core.RejectionReason.INVALID_EBIT, stock.rejection_reason)
+        self.assertIsNone(stock.ticker_info.current_price)
+
+    def test_default_cache_backend(self):
+        """Test if the tickers are cached through the pickle backend by default"""
+        stock = core.MagicFormula('WEGE3.SA', self.logger)
+        self.assertIsInstance(stock.cache, cache.PickleCacheBackend)
+        self.assertEqual('cache', stock.cache.folder)
+
+    def test_default_cache_backend_lazy(self):
+        """Test if the default backend is not created for a ticker already fetched"""
+        stock = core.MagicFormula('WEGE3.SA', self.logger)
+        with mock.patch('magic_formula.cache.PickleCacheBackend') as backend:
+            stock.get_ticker_info(self.ticker)
+
+        backend.assert_not_called()
+
+    def test_rejected_without_modules(self):
+        self.ticker.all_modules = {'WEGE3.SA': 'Quote not found for ticker symbol: WEGE3.SA'}
+        stock = core.MagicFormula('WEGE3.SA', self.logger)
+
+        self.assertIsNone(stock.get_ticker_info(self.ticker))
+        self.assertEqual(core.RejectionReason.INVALID_INFORMATION, stock.rejection_reason)
+
+    def test_rejected_by_module_errors(self):
+        """Test if the yahoo error messages in place of the modules are rejected as
+        invalid modules and not raised by the builder"""
+        error = 'Quote not found for ticker symbol: PETR4.SA'
+        batch = core.TickerMock()
+        batch.all_modules = error
+        batch.asset_profile = error
+        batch.financial_data = error
+        batch.summary_detail = error
+        batch.recommendation_trend = pandas.DataFrame()
+        self.ticker.all_modules['WEGE3.SA'] = dict(self.ticker.all_modules['WEGE3.SA'],
+                                                   price=error)
+        tickers = {'PETR4.SA': core.split_ticker_batch(batch, ['PETR4.SA'])['PETR4.SA'],
+                   'WEGE3.SA': self.ticker}
+
+        for symbol, ticker in tickers.items():
+            self.assertFalse(core.valid_ticker_modules(ticker, symbol))
+            self.assertIsInstance(core.TickerInfoBuilder(ticker, symbol, self.logger).build(),
+                                  core.TickerInfo)
+            stock = core.MagicFormula(symbol, self.logger)
+            self.assertIsNone(stock.get_ticker_info(ticker))
+            self.assertEqual(core.RejectionReason.INVALID_MODULES, stock.rejection_reason)
+            self.assertFalse(stock.valid_ticker_data())
+            self.assertEqual(core.RejectionReason.INVALID_MODULES, stock.rejection_reason)
+
+    def test_rejected_by_industry(self):
+        self.ticker.asset_profile['WEGE3.SA'] = dict(self.ticker.asset_profile['WEGE3.SA'],
+                                                     industry='Banks—Regional')
+        stock = core.MagicFormula('WEGE3.SA', self.logger)
+
+        self.assertIsNone(stock.get_ticker_info(self.ticker))
+        self.assertIsNone(stock.ticker_info.recommendation_trend)
+        self.assertEqual(core.RejectionReason.INVALID_INDUSTRY, stock.rejection_reason)
+
+    def test_scalar_checks_match_valuation(self):
+        """Test if the per-ticker checks agree with the batch valuation engine"""
+        stock = core.MagicFormula('WEGE3.SA', self.logger, ebit_min=1, market_cap_min=0)
+        stock.ticker_info = core.TickerInfoBuilder(self.ticker, 'WEGE3.SA', self.logger).build()
+        stock.ticker_info.total_cash = 10
+        for value in (None, float('nan'), -1, 0, 1, 2.5, 10 ** 9):
+            stock.ticker_info.ebit = value
+            stock.ticker_info.market_cap = value
+            stock.ticker_info.total_debt = value
+            self.assertEqual(bool(valuation.valid_ebit([value], 1)[0]), stock.valid_ebit())
+            self.assertEqual(bool(valuation.valid_market_cap([value], 0)[0]),
+                             stock.valid_market_cap())
+            self.assertEqual(float(valuation.calculate_tev([value], [value], [10])[0]),
+                             stock.calculate_tev())
+            pandas.testing.assert_series_equal(
+                pandas.Series(valuation.calculate_earning_yield([value], [stock.tev])),
+                pandas.Series([stock.calculate_earning_yield()]))
+
+        for industry in ([], '', 'Specialty Industrial Machinery', 'Banks—Regional'):
+            stock.ticker_info.industry = industry
+            self.assertEqual(bool(valuation.valid_industry(pandas.Series([industry]))[0]),
+                             stock.valid_industry())
+
+    def test_rejected_by_market_cap(self):
+        """Test if the market cap is screened before the expensive fields"""
+        stock = core.MagicFormula('WEGE3.SA', self.logger, market_cap_min=10 ** 15)
+
+        self.assertIsNone(stock.get_ticker_info(self.ticker))
+        self.assertIsNone(stock.ticker_info.recommendation_trend)
+        self.assertEqual(core.RejectionReason.INVALID_MARKET_CAP, stock.rejection_reason)
+        self.assertFalse(stock.valid_ticker_data())
+
+        stock = core.MagicFormula('WEGE3.SA', self.logger, market_cap_min=0)
+        self.assertIs(self.ticker, stock.get_ticker_info(self.ticker))
+        self.assertTrue(stock.valid_ticker_data())
+        self.assertIsNone(stock.rejection_reason)
@@ -2,15 +2,27 @@ from __future__ import absolute_import
 
 import os
 import sys
+import tempfile
 import unittest
 import logging
 from unittest import mock
 
+import pandas
+
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../magic_formula')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../tests')))
 
 
-from magic_formula import magic_formula_main as green
+from magic_formula import main as green
+from magic_formula.cache import SQLiteCacheBackend
+from magic_formula.core import TickerMock
+from magic_formula.core import build_error_ticker
+from magic_formula.instrumentation import RunReport
+from magic_formula.instrumentation import set_run_report
+from magic_formula.metrics import TickerMetrics
+from magic_formula.metrics import set_ticker_metrics
+from ticker_fixtures import load_fixture_ticker
 
 
 def scenario_logger():
@@ -26,3 +38,418 @@ class TestMainModule(unittest.TestCase):
 
         mock_print.assert_called_with(f'MagicFormula v{green.__VERSION__}')
         mock_exit.assert_called_with(0)
+
+
+def scenario_screener(screener: dict = None) -> pandas.DataFrame:
+    return pandas.DataFrame.from_dict(screener or {}, orient='index')
+
+
+def scenario_row(symbol: str, earning_yield: float = 0.1) -> green.TickerRow:
+    return green.TickerRow(
+        symbol=symbol, magic_index=earning_yield, earning_yield=earning_yield,
+        roic_index_number=0, roic=10.0, buy_recomendation=1, sell_recomendation=0,
+        current_price=10.0, regular_market_time='', market_cap=1000.0,
+        patrimonio_liquido=500.0, ebit=100.0, total_debt=10.0, total_cash=5.0,
+        shares_outstanding=100.0, long_name=symbol, industry='Utilities',
+        dividend_yield=1.0, vpa=5.0, lpa=1.0, p_l=10.0, p_vp=2.0, graham_vi=10.61,
+        graham_upside=0.06
+    )
+
+
+def scenario_ticker(symbol: str, market_cap: float) -> TickerMock:
+    """Returns the recorded WEGE3.SA ticker as the symbol with the market cap"""
+    wege = load_fixture_ticker()
+    ticker = TickerMock()
+    ticker.all_modules = {symbol: dict(wege.all_modules['WEGE3.SA'])}
+    ticker.all_modules[symbol]['price'] = dict(ticker.all_modules[symbol]['price'],
+                                               marketCap=market_cap)
+    ticker.asset_profile = {symbol: wege.asset_profile['WEGE3.SA']}
+    ticker.financial_data = {symbol: wege.financial_data['WEGE3.SA']}
+    ticker.summary_detail = {symbol: wege.summary_detail['WEGE3.SA']}
+    ticker.recommendation_trend = wege.recommendation_trend.rename(index={'WEGE3.SA': symbol},
+                                                                   level=0)
+    return ticker
+
+
+class TestProcessTickers(unittest.TestCase):
+    def test_build_tickers_dataframe(self):
+        results = [
+            green.TickerResult('WEGE3.SA', row=scenario_row('WEGE3')),
+            green.TickerResult('ITUB4.SA', rejection_reason=green.RejectionReason.INVALID_INDUSTRY),
+            green.TickerResult('PETR4.SA', row=scenario_row('PETR4', 0.3)),
+        ]
+        data_frame = green.build_tickers_dataframe(results)
+
+        self.assertEqual(green.DataframColums.PROCESS_TICKERS_COLUMNS.value,
+                         list(data_frame.columns))
+        self.assertEqual(['WEGE3', 'PETR4'], list(data_frame['symbol']))
+        self.assertEqual([0.1, 0.3], list(data_frame['earning_yield']))
+
+    def test_build_tickers_dataframe_empty(self):
+        data_frame = green.build_tickers_dataframe([])
+
+        self.assertTrue(data_frame.empty)
+        self.assertEqual(green.DataframColums.PROCESS_TICKERS_COLUMNS.value,
+                         list(data_frame.columns))
+
+    def test_get_dropped_tickers(self):
+        results = [
+            green.TickerResult('WEGE3.SA', row=scenario_row('WEGE3')),
+            green.TickerResult('ITUB4.SA', rejection_reason=green.RejectionReason.INVALID_INDUSTRY),
+            green.TickerResult('OIBR3.SA', rejection_reason=green.RejectionReason.INVALID_EBIT),
+        ]
+        dropped = green.get_dropped_tickers(results, scenario_logger())
+
+        self.assertEqual({'ITUB4.SA': 'invalid industry', 'OIBR3.SA': 'invalid ebit'}, dropped)
+
+    @mock.patch('magic_formula.main.get_cache_backend')
+    @mock.patch('magic_formula.main.fetch_tickers')
+    def test_process_tickers_keeps_every_row(self, fetch_tickers, _):
+        fetch_tickers.return_value = {}
+        symbols = {f'TICK{number}' for number in range(200)}
+
+        def calculate_ticker_row(symbol, *_args):
+            if symbol == 'TICK0.SA':
+                raise KeyError('price')
+            return green.TickerResult(symbol, row=scenario_row(symbol[:-3]))
+
+        options = green.get_arguments(['-t', '32'])
+        with mock.patch('magic_formula.main.calculate_ticker_row',
+                        side_effect=calculate_ticker_row):
+            data_frame = green.process_tickers(symbols, scenario_screener(), scenario_logger(),
+                                               options)
+
+        self.assertEqual(199, len(data_frame))
+        self.assertEqual(symbols - {'TICK0'}, set(data_frame['symbol']))
+        self.assertEqual({'TICK0.SA': 'processing error'}, data_frame.attrs['dropped_tickers'])
+
+    def test_fetch_tickers_counts_cache(self):
+        cache = mock.Mock()
+        cache.get_many.return_value = {'WEGE3.SA': TickerMock()}
+        report = RunReport()
+        set_run_report(report)
+        try:
+            with mock.patch('magic_formula.main.TickerBatchFetcher') as fetcher, \
+                    report.stage('process_tickers'):
+                fetcher.return_value.fetch.return_value = {'ITUB4.SA': TickerMock()}
+                green.fetch_tickers(['WEGE3.SA', 'ITUB4.SA'], scenario_logger(),
+                                    green.get_arguments([]), cache)
+        finally:
+            set_run_report(None)
+
+        self.assertEqual(1, report.stages[0].cache_hits)
+        self.assertEqual(1, report.stages[0].cache_misses)
+        cache.get_many.assert_called_once_with(
+            ['WEGE3.SA', 'ITUB4.SA'], green.get_yahoo_modules(green.get_arguments([])))
+
+    def test_fetch_tickers_caches_only_successes(self):
+        cache = mock.Mock()
+        cache.get_many.return_value = {}
+        fetched = TickerMock()
+        fetched.all_modules = {'ITUB4.SA': {'recommendationTrend': {'trend': []}}}
+        tickers = {'ITUB4.SA': fetched, 'OIBR3.SA': build_error_ticker('Too Many Requests')}
+        metrics = TickerMetrics()
+        set_ticker_metrics(metrics)
+        try:
+            with mock.patch('magic_formula.main.TickerBatchFetcher') as fetcher:
+                fetcher.return_value.fetch.return_value = dict(tickers)
+                result = green.fetch_tickers(['ITUB4.SA', 'OIBR3.SA', 'WEGE3.SA'],
+                                             scenario_logger(), green.get_arguments([]), cache)
+        finally:
+            set_ticker_metrics(None)
+
+        self.assertEqual(tickers, result)
+        cache.set_many.assert_called_once_with(
+            {'ITUB4.SA': fetched}, green.get_yahoo_modules(green.get_arguments([])))
+        self.assertEqual({'fetched': 1, 'fetch error': 2},
+                         metrics.summary()['outcomes'])
+
+    def test_fetch_tickers_cache_read_latency(self):
+        """Test if the cache read latency is recorded only for the hits"""
+        cache = mock.Mock()
+        cache.get_many.return_value = {'WEGE3.SA': TickerMock()}
+        metrics = TickerMetrics()
+        set_ticker_metrics(metrics)
+        try:
+            with mock.patch('magic_formula.main.TickerBatchFetcher') as fetcher:
+                fetcher.return_value.fetch.return_value = {}
+                green.fetch_tickers(['WEGE3.SA', 'ITUB4.SA', 'OIBR3.SA'], scenario_logger(),
+                                    green.get_arguments([]), cache)
+        finally:
+            set_ticker_metrics(None)
+
+        self.assertEqual(1, metrics.summary()['phases']['cache_read']['count'])
+
+    def test_fetch_tickers_adaptive_concurrency(self):
+        """Test if the concurrency controller is kept on the metrics of the run"""
+        cache = mock.Mock()
+        cache.get_many.return_value = {}
+        metrics = TickerMetrics()
+        set_ticker_metrics(metrics)
+        try:
+            with mock.patch('magic_formula.main.TickerBatchFetcher') as fetcher:
+                fetcher.return_value.fetch.return_value = {}
+                green.fetch_tickers(['ITUB4.SA'], scenario_logger(),
+                                    green.get_arguments(['-ac']), cache)
+        finally:
+            set_ticker_metrics(None)
+
+        controller = fetcher.call_args[1]['controller']
+        self.assertEqual({**controller.metrics(), 'decisions': []},
+                         metrics.summary()['concurrency'])
+
+    def test_fetch_tickers_yahoo_url(self):
+        """Test if the yahoo url is sent to the fetcher through the options"""
+        cache = mock.Mock()
+        cache.get_many.return_value = {}
+        options = green.get_arguments(['-yu', 'http://127.0.0.1:8765/yahoo'])
+        with mock.patch('magic_formula.main.TickerBatchFetcher') as fetcher:
+            fetcher.return_value.fetch.return_value = {}
+            green.fetch_tickers(['ITUB4.SA'], scenario_logger(), options, cache)
+
+        self.assertEqual('http://127.0.0.1:8765/yahoo', fetcher.call_args[1]['base_url'])
+
+    @mock.patch('magic_formula.main.build_tickers_on_threads', return_value=[])
+    def test_process_executor_reads_cache_once(self, _):
+        """Test if the process executor fetches the missing payloads without a second
+        cache lookup"""
+        cache = mock.Mock()
+        cache.get_many_payloads.return_value = {}
+        report = RunReport()
+        set_run_report(report)
+        try:
+            with mock.patch('magic_formula.main.TickerBatchFetcher') as fetcher, \
+                    report.stage('process_tickers'):
+                fetcher.return_value.fetch.return_value = {}
+                green.process_tickers_on_processes(['ITUB4.SA'], scenario_logger(),
+                                                   green.get_arguments(['-x', 'process']),
+                                                   cache)
+        finally:
+            set_run_report(None)
+
+        cache.get_many.assert_not_called()
+        fetcher.return_value.fetch.assert_called_once_with(['ITUB4.SA'])
+        stages = {stage.name: stage for stage in report.stages}
+        self.assertEqual(0, stages['fetch_tickers'].cache_hits)
+        self.assertEqual(1, stages['fetch_tickers'].cache_misses)
+
+    def test_record_ticker_metrics(self):
+        results = [
+            green.TickerResult('WEGE3.SA', row=scenario_row('WEGE3'),
+                               timings={'build': 0.01, 'validation': 0.002}),
+            green.TickerResult('OIBR3.SA', rejection_reason=green.RejectionReason.PROCESSING_ERROR),
+        ]
+        data_frame = green.build_tickers_dataframe(results)
+        data_frame.attrs['dropped_tickers'] = {'OIBR3.SA': 'processing error',
+                                               'ITUB4.SA': 'invalid industry'}
+        metrics = TickerMetrics()
+        set_ticker_metrics(metrics)
+        try:
+            green.record_ticker_metrics(results, data_frame)
+        finally:
+            set_ticker_metrics(None)
+
+        summary = metrics.summary()
+        self.assertEqual(1, summary['phases']['build']['count'])
+        self.assertEqual({'processing error': 1, 'invalid industry': 1, 'kept': 1},
+                         summary['outcomes'])
+        self.assertEqual({'OIBR3.SA': 'processing error'}, summary['failed_tickers'])
+
+    def test_process_earning_yield_module_errors(self):
+        """Test if a ticker whose modules are yahoo errors is a module failure and not a
+        processing error"""
+        ticker = TickerMock()
+        ticker.all_modules = ticker.asset_profile = 'HTTP 404 Not Found.  Please try again'
+        ticker.financial_data = ticker.summary_detail = ticker.all_modules
+        result = green.process_earning_yield_calculation(
+            ('OIBR3.SA', scenario_logger(), green.get_arguments([]), ticker, mock.Mock()))
+
+        self.assertIsNone(result.row)
+        self.assertEqual(green.RejectionReason.INVALID_MODULES, result.rejection_reason)
+        self.assertIn(result.rejection_reason.value, green.FAILED_REASONS)
+
+    def test_evaluate_tickers_dataframe(self):
+        rows = [scenario_row('WEGE3'), scenario_row('OIBR3')]
+        rows[1].ebit = -100.0
+        data_frame = green.build_tickers_dataframe(
+            [green.TickerResult(row.symbol + '.SA', row=row) for row in rows])
+
+        data_frame, dropped = green.evaluate_tickers_dataframe(data_frame)
+
+        self.assertEqual(['WEGE3'], list(data_frame['symbol']))
+        self.assertEqual([0.1], list(data_frame['earning_yield']))
+        self.assertEqual([0.1], list(data_frame['magic_index']))
+        self.assertEqual({'OIBR3.SA': 'negative earning yield'}, dropped)
+
+    def test_join_screener_info(self):
+        data_frame = green.build_tickers_dataframe(
+            [green.TickerResult('WEGE3.SA', row=scenario_row('WEGE3')),
+             green.TickerResult('NEWS3.SA', row=scenario_row('NEWS3'))])
+        screener = scenario_screener({
+            'WEGE3': {'roic_index': 3, 'roic': 20.0, 'vpa': 5.0, 'lpa': 1.0, 'p_l': 10.0,
+                      'p_vp': 2.0, 'dy': 1.5, 'p_ebit': 10.0},
+            'OIBR3': {'roic_index': 0, 'roic': 30.0, 'vpa': 1.0, 'lpa': None, 'p_l': 0.0,
+                      'p_vp': 1.0, 'dy': 0.0, 'p_ebit': -2.0},
+        })
+        data_frame = green.join_screener_info(data_frame, screener, green.get_arguments([]))
+
+        self.assertEqual([3, 0], list(data_frame['roic_index_number']))
+        self.assertEqual([20.0, 0.0], list(data_frame['roic']))
+        self.assertEqual([1.5, 0.0], list(data_frame['dividend_yield']))
+        self.assertEqual([10.61, 0.0], list(data_frame['graham_vi']))
+        self.assertEqual([0.06, 0.0], list(data_frame['graham_upside']))
+        self.assertEqual(green.calculate_graham_vi(5.0, 1.0, 15, 1.5), data_frame['graham_vi'][0])
+
+    def test_evaluate_tickers_dataframe_empty(self):
+        data_frame, dropped = green.evaluate_tickers_dataframe(
+            green.build_tickers_dataframe([]))
+
+        self.assertTrue(data_frame.empty)
+        self.assertEqual({}, dropped)
+
+    def test_prefilter_tickers(self):
+        roic_index = {
+            'WEGE3': {'valormercado': 1000.0, 'p_ebit': 10.0},
+            'SMLL3': {'valormercado': 10.0, 'p_ebit': 1.0},
+            'OIBR3': {'valormercado': 5000.0, 'p_ebit': -2.0},
+            'NEAR3': {'valormercado': 450.0, 'p_ebit': 4.5},
+        }
+        options = green.get_arguments(['-e', '50', '-m', '500', '-pf'])
+        kept, dropped = green.prefilter_tickers({'WEGE3', 'SMLL3', 'OIBR3', 'NEAR3', 'NEWS3'},
+                                                scenario_screener(roic_index), scenario_logger(),
+                                                options)
+
+        self.assertEqual({'WEGE3', 'NEAR3', 'NEWS3'}, kept)
+        self.assertEqual({'SMLL3.SA': 'invalid market cap on screener',
+                          'OIBR3.SA': 'invalid ebit on screener'}, dropped)
+
+    @mock.patch('magic_formula.main.fetch_tickers')
+    def test_process_screener_tickers(self, fetch_tickers):
+        roic_index = {
+            'WEGE3': {'roic_index': 1, 'roic': 20.0, 'vpa': 5.0, 'lpa': 1.0, 'p_l': 10.0,
+                      'p_vp': 2.0, 'dy': 1.0, 'p_ebit': 10.0, 'ev_ebit': 8.0,
+                      'valormercado': 1000.0, 'price': 10.0, 'companyname': 'WEG'},
+            'OIBR3': {'roic_index': 0, 'roic': 30.0, 'vpa': 1.0, 'lpa': -1.0, 'p_l': 0.0,
+                      'p_vp': 1.0, 'dy': 0.0, 'p_ebit': -2.0, 'ev_ebit': -4.0,
+                      'valormercado': 5000.0, 'price': 1.0, 'companyname': 'OI'},
+        }
+        options = green.get_arguments(['-s', 'statusinvest'])
+        data_frame = green.process_screener_tickers({'WEGE3', 'OIBR3', 'NEWS3'},
+                                                    scenario_screener(roic_index),
+                                                    scenario_logger(), options)
+
+        fetch_tickers.assert_not_called()
+        self.assertEqual('STATUSINVEST', options.source)
+        self.assertEqual(green.DataframColums.PROCESS_TICKERS_COLUMNS.value,
+                         list(data_frame.columns))
+        self.assertEqual(['WEGE3'], list(data_frame['symbol']))
+        self.assertEqual([0.12], list(data_frame['earning_yield']))
+        self.assertEqual([1.12], list(data_frame['magic_index']))
+        self.assertEqual([10.61], list(data_frame['graham_vi']))
+        self.assertEqual(['WEG'], list(data_frame['long_name']))
+        self.assertEqual({'OIBR3.SA': 'invalid ebit on screener',
+                          'NEWS3.SA': 'invalid information'},
+                         data_frame.attrs['dropped_tickers'])
+
+    @mock.patch('magic_formula.main.get_cache_backend')
+    @mock.patch('magic_formula.main.fetch_tickers')
+    def test_process_tickers_screening_reasons(self, fetch_tickers, _):
+        """Test if the tickers that fail on the screening are dropped by the batch valuation"""
+        ticker = load_fixture_ticker()
+        fetch_tickers.return_value = {'WEGE3.SA': ticker}
+
+        options = green.get_arguments(['-e', str(10 ** 12)])
+        data_frame = green.process_tickers({'WEGE3'}, scenario_screener(), scenario_logger(),
+                                           options)
+
+        self.assertEqual(0, len(data_frame))
+        self.assertEqual({'WEGE3.SA': 'invalid ebit'}, data_frame.attrs['dropped_tickers'])
+
+    def test_process_tickers_executors(self):
+        """Test if the process executor returns the same rows as the thread executor"""
+        ticker = load_fixture_ticker()
+        screener = scenario_screener({'WEGE3': {'roic_index': 0, 'roic': 20.0, 'vpa': 5.0,
+                                                'lpa': 1.0, 'p_l': 10.0, 'p_vp': 2.0,
+                                                'dy': 1.0}})
+
+        data_frames = {}
+        with tempfile.TemporaryDirectory() as folder:
+            database = os.path.join(folder, 'fundamentals.db')
+            backend = SQLiteCacheBackend(database)
+            backend.set_many({'WEGE3.SA': ticker})
+            backend.close()
+            with mock.patch('magic_formula.main.get_cache_backend',
+                            side_effect=lambda *_: SQLiteCacheBackend(database)):
+                for executor in ('thread', 'process'):
+                    options = green.get_arguments(['-x', executor])
+                    data_frames[executor] = green.process_tickers(
+                        {'WEGE3'}, screener, scenario_logger(), options)
+
+        self.assertEqual(['WEGE3'], list(data_frames['process']['symbol']))
+        pandas.testing.assert_frame_equal(data_frames['thread'], data_frames['process'])
+
+    @mock.patch('magic_formula.main.get_cache_backend')
+    @mock.patch('magic_formula.main.fetch_tickers')
+    def test_process_tickers_closes_cache(self, fetch_tickers, get_cache_backend):
+        fetch_tickers.side_effect = ConnectionError('yahoo')
+        options = green.get_arguments(['-cb', 'pickle'])
+
+        with self.assertRaises(ConnectionError):
+            green.process_tickers({'WEGE3'}, scenario_screener(), scenario_logger(), options)
+
+        get_cache_backend.assert_called_once_with('PICKLE')
+        get_cache_backend.return_value.close.assert_called_once_with()
+
+    @mock.patch('magic_formula.main.get_cache_backend')
+    @mock.patch('magic_formula.main.fetch_tickers')
+    def test_process_tickers_prefilter(self, fetch_tickers, _):
+        fetch_tickers.return_value = {}
+        roic_index = {'WEGE3': {'valormercado': 1000.0, 'p_ebit': 10.0},
+                      'OIBR3': {'valormercado': 5000.0, 'p_ebit': -2.0}}
+        options = green.get_arguments(['-pf'])
+        with mock.patch('magic_formula.main.calculate_ticker_row',
+                        side_effect=lambda symbol, *_: green.TickerResult(
+                            symbol, row=scenario_row(symbol[:-3]))):
+            report = RunReport()
+            set_run_report(report)
+            try:
+                with report.stage('process_tickers'):
+                    data_frame = green.process_tickers({'WEGE3', 'OIBR3'},
+                                                       scenario_screener(roic_index),
+                                                       scenario_logger(), options)
+            finally:
+                set_run_report(None)
+
+        self.assertEqual(1, report.stages[0].items)
+        self.assertEqual(['WEGE3.SA'], fetch_tickers.call_args[0][0])
+        self.assertEqual(['WEGE3'], list(data_frame['symbol']))
+        self.assertEqual({'OIBR3.SA': 'invalid ebit on screener'},
+                         data_frame.attrs['dropped_tickers'])
+
+    @mock.patch('magic_formula.main.get_cache_backend')
+    @mock.patch('magic_formula.main.fetch_tickers')
+    def test_process_tickers_prefilter_same_frame(self, fetch_tickers, _):
+        """Test if the prefilter only avoids fetches, the tickers it drops are also
+        dropped by the screening of the fetched tickers"""
+        tickers = {'WEGE3.SA': scenario_ticker('WEGE3.SA', 128901423104),
+                   'SMLL3.SA': scenario_ticker('SMLL3.SA', 10 ** 8)}
+        fetch_tickers.side_effect = lambda symbols, *_: {symbol: tickers[symbol]
+                                                         for symbol in symbols}
+        roic_index = {'WEGE3': {'roic_index': 0, 'roic': 20.0, 'valormercado': 128901423104,
+                                'p_ebit': 45.8},
+                      'SMLL3': {'roic_index': 1, 'roic': 30.0, 'valormercado': 10 ** 8,
+                                'p_ebit': 0.04}}
+
+        data_frames = {}
+        for arguments in ([], ['-pf']):
+            options = green.get_arguments(['-m', str(10 ** 9)] + arguments)
+            data_frames[bool(arguments)] = green.process_tickers(
+                {'WEGE3', 'SMLL3'}, scenario_screener(roic_index), scenario_logger(), options)
+
+        self.assertEqual(['WEGE3.SA'], fetch_tickers.call_args[0][0])
+        self.assertEqual(['WEGE3'], list(data_frames[True]['symbol']))
+        pandas.testing.assert_frame_equal(data_frames[False], data_frames[True])
+        self.assertEqual({'SMLL3.SA': 'invalid market cap'},
+                         data_frames[False].attrs['dropped_tickers'])
+        self.assertEqual({'SMLL3.SA': 'invalid market cap on screener'},
+                         data_frames[True].attrs['dropped_tickers'])
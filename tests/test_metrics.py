@@ -0,0 +1,97 @@
+"""Module to test the per-ticker metrics and their prometheus export"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from magic_formula import metrics
+from magic_formula.metrics import LatencyHistogram
+from magic_formula.metrics import TickerMetrics
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_histogram(self):
+        histogram = LatencyHistogram(buckets=(0.1, 1.0))
+        for seconds in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(seconds)
+
+        self.assertEqual([('0.1', 2), ('1', 3), ('+Inf', 4)], histogram.bucket_counts())
+        self.assertEqual(4, histogram.count)
+        self.assertAlmostEqual(2.65, histogram.sum)
+        self.assertAlmostEqual(0.3, histogram.percentile(0.5))
+        self.assertEqual(0.0, LatencyHistogram().percentile(0.99))
+
+
+class TestTickerMetrics(unittest.TestCase):
+    def tearDown(self):
+        metrics.set_ticker_metrics(None)
+
+    def test_summary(self):
+        """Test if the latencies are kept by ticker and the slowest ones are returned"""
+        ticker_metrics = TickerMetrics()
+        metrics.set_ticker_metrics(ticker_metrics)
+        metrics.observe_latency('fetch', ['WEGE3.SA', 'ITUB4.SA'], 0.2)
+        metrics.observe_latency('build', 'WEGE3.SA', 0.01)
+        metrics.count_outcome('fetched', 2)
+        metrics.count_outcome('cached', 0)
+        ticker_metrics.fail('OIBR3.SA', 'processing error')
+
+        summary = ticker_metrics.summary()
+        self.assertEqual(2, summary['phases']['fetch']['count'])
+        self.assertAlmostEqual(0.2, summary['phases']['fetch']['p99'])
+        self.assertEqual({'fetched': 2}, summary['outcomes'])
+        self.assertEqual('WEGE3.SA', summary['slowest_tickers'][0][0])
+        self.assertAlmostEqual(0.21, summary['slowest_tickers'][0][1])
+        self.assertEqual({'OIBR3.SA': 'processing error'}, summary['failed_tickers'])
+        with self.assertRaises(ValueError):
+            ticker_metrics.observe('decode', 'WEGE3.SA', 0.1)
+
+    def test_observe_without_metrics(self):
+        """Test if the observations are ignored when the metrics are not recorded"""
+        metrics.observe_latency('fetch', 'WEGE3.SA', 0.2)
+        metrics.count_outcome('fetched')
+        self.assertIsNone(metrics.get_ticker_metrics())
+
+    def test_write_textfile(self):
+        """Test if the textfile has the histograms, percentiles and outcomes"""
+        ticker_metrics = TickerMetrics()
+        ticker_metrics.observe('fetch', 'WEGE3.SA', 0.2)
+        ticker_metrics.count('invalid industry', 3)
+
+        with tempfile.TemporaryDirectory() as folder:
+            file_name = os.path.join(folder, 'magic_formula.prom')
+            ticker_metrics.write_textfile(file_name)
+            self.assertEqual(['magic_formula.prom'], os.listdir(folder))
+            with open(file_name) as file:
+                lines = file.read().splitlines()
+
+        self.assertIn('# TYPE magic_formula_ticker_phase_seconds histogram', lines)
+        self.assertIn('magic_formula_ticker_phase_seconds_bucket{phase="fetch",le="0.1"} 0',
+                      lines)
+        self.assertIn('magic_formula_ticker_phase_seconds_bucket{phase="fetch",le="0.25"} 1',
+                      lines)
+        self.assertIn('magic_formula_ticker_phase_seconds_count{phase="fetch"} 1', lines)
+        self.assertIn('magic_formula_ticker_phase_quantile_seconds'
+                      '{phase="fetch",quantile="0.95"} 0.200000', lines)
+        self.assertIn('magic_formula_last_run_tickers{outcome="invalid_industry"} 3', lines)
+
+    def test_concurrency(self):
+        """Test if the concurrency controller goes to the summary and to the textfile"""
+        ticker_metrics = TickerMetrics()
+        metrics.set_ticker_metrics(ticker_metrics)
+        metrics.record_concurrency({'limit': 2, 'rounds': 2, 'decreases': 1,
+                                    'best_latency': 0.1, 'requests_throttled': 3},
+                                   [(1, 5, 'no congestion'), (2, 2, '3 throttled')])
+
+        summary = ticker_metrics.summary()
+        self.assertEqual(2, summary['concurrency']['limit'])
+        self.assertEqual({'round': 2, 'limit': 2, 'reason': '3 throttled'},
+                         summary['concurrency']['decisions'][-1])
+        lines = ticker_metrics.to_prometheus().splitlines()
+        self.assertIn('magic_formula_concurrency_limit 2', lines)
+        self.assertIn('magic_formula_concurrency_decreases 1', lines)
+        self.assertIn('magic_formula_concurrency_best_latency_seconds 0.100000', lines)
+        self.assertIn('magic_formula_concurrency_requests{outcome="throttled"} 3', lines)
+        self.assertEqual({}, TickerMetrics().summary()['concurrency'])
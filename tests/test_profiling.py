@@ -0,0 +1,113 @@
+"""Module to test the profiling of the pipeline stages"""
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from magic_formula.instrumentation import RunReport
+from magic_formula.profiling import StageProfiler
+
+
+def busy_worker(stop_event: threading.Event) -> None:
+    while not stop_event.is_set():
+        sum(range(1000))
+
+
+class TestStageProfiler(unittest.TestCase):
+    def test_profile_cpu(self):
+        """Test if each stage gets the cProfile statistics and the stacks of all threads"""
+        with tempfile.TemporaryDirectory() as folder:
+            profiler = StageProfiler(folder, interval=0.001)
+            report = RunReport(profiler=profiler)
+            stop_event = threading.Event()
+            with report.stage('process_tickers'):
+                worker = threading.Thread(target=busy_worker, args=(stop_event,),
+                                          name='ThreadPoolExecutor-0_1')
+                worker.start()
+                time.sleep(0.05)
+                stop_event.set()
+                worker.join()
+
+            self.assertEqual(['process_tickers.collapsed', 'process_tickers.pstats'],
+                             sorted(os.listdir(folder)))
+            stats = pstats.Stats(os.path.join(folder, 'process_tickers.pstats'))
+            self.assertIn('<built-in method time.sleep>',
+                          {function for _, _, function in stats.stats})
+
+            with open(os.path.join(folder, 'process_tickers.collapsed')) as file:
+                lines = file.read().splitlines()
+            stacks = {line.rsplit(' ', 1)[0]: int(line.rsplit(' ', 1)[1]) for line in lines}
+            self.assertTrue(any(stack.startswith('ThreadPoolExecutor-0;')
+                                and 'busy_worker' in stack for stack in stacks))
+            self.assertGreater(profiler.summary()['process_tickers']['samples'], 0)
+            self.assertEqual(['process_tickers'], [stage.name for stage in report.stages])
+
+    def test_profile_nested_stages(self):
+        """Test if the inner stages get their own statistics, left out of the outer one"""
+        with tempfile.TemporaryDirectory() as folder:
+            report = RunReport(profiler=StageProfiler(folder, interval=0.001))
+            with report.stage('process_tickers'):
+                with report.stage('fetch_tickers'):
+                    time.sleep(0.01)
+                with report.stage('build_tickers'):
+                    sum(range(1000))
+                time.sleep(0.01)
+
+            self.assertEqual(['build_tickers.collapsed', 'build_tickers.pstats',
+                              'fetch_tickers.collapsed', 'fetch_tickers.pstats',
+                              'process_tickers.collapsed', 'process_tickers.pstats'],
+                             sorted(os.listdir(folder)))
+            functions = {stage: {function for _, _, function in pstats.Stats(
+                os.path.join(folder, f'{stage}.pstats')).stats}
+                         for stage in ('process_tickers', 'fetch_tickers', 'build_tickers')}
+            self.assertIn('<built-in method time.sleep>', functions['fetch_tickers'])
+            self.assertIn('<built-in method builtins.sum>', functions['build_tickers'])
+            self.assertNotIn('<built-in method builtins.sum>', functions['process_tickers'])
+            self.assertIn('<built-in method time.sleep>', functions['process_tickers'])
+
+    def test_trace_memory(self):
+        """Test if only the memory stages are traced and the peak covers the block"""
+        with tempfile.TemporaryDirectory() as folder:
+            profiler = StageProfiler(folder, cpu=False, memory=True)
+            with profiler.profile('export_file'):
+                data = [bytearray(1024) for _ in range(2048)]
+            with profiler.profile('sort_dataframe'):
+                pass
+
+            self.assertEqual(['export_file.tracemalloc.txt'], os.listdir(folder))
+            result = profiler.summary()['export_file']
+            self.assertGreater(result['peak_memory'], 2 * 2 ** 20)
+            self.assertIn('test_profiling.py', result['top_allocations'][0]['site'])
+            self.assertEqual([], profiler.summary()['sort_dataframe']['files'])
+            with open(os.path.join(folder, 'export_file.tracemalloc.txt')) as file:
+                self.assertTrue(file.readline().startswith('export_file: peak'))
+            del data
+
+    def test_trace_memory_nested_stages(self):
+        """Test if the cProfile statistics dumped by the inner stages are not on the top
+        allocations of the outer stage"""
+        with tempfile.TemporaryDirectory() as folder:
+            report = RunReport(profiler=StageProfiler(folder, memory=True, interval=0.001))
+            with report.stage('process_tickers'):
+                with report.stage('fetch_tickers'):
+                    fetched = [bytearray(1024) for _ in range(512)]
+                with report.stage('build_tickers'):
+                    built = [str(number) * 10 for number in range(5000)]
+
+            with open(os.path.join(folder, 'process_tickers.tracemalloc.txt')) as file:
+                sites = [line.rsplit(' ', 1)[1] for line in file.read().splitlines()[1:]]
+            self.assertTrue(sites)
+            self.assertFalse([site for site in sites
+                              if os.path.basename(site).startswith(('cProfile.py', 'pstats.py',
+                                                                    'profiling.py'))])
+            self.assertIn('test_profiling.py', sites[0])
+            del fetched, built
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+"""Module to test methods from module ranking"""
+import logging
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../magic_formula')))
+
+from magic_formula import main as green
+from magic_formula import ranking
+
+
+def scenario_tickers(size: int = 500, seed: int = 42) -> pandas.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pandas.DataFrame({
+        'symbol': [f'T{number:04}' for number in range(size)],
+        'roic': rng.permutation(size) * 0.1,
+        'earning_yield': rng.permutation(size) * 0.001,
+    })
+
+
+def scenario_tied_tickers(size: int = 500, seed: int = 42) -> pandas.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pandas.DataFrame({
+        'symbol': [f'T{number:04}' for number in range(size)],
+        'roic': np.round(rng.uniform(0, 30, size)),
+        'earning_yield': np.round(rng.uniform(0, 0.2, size), 2),
+    })
+
+
+def reference_sort(tickers_df: pandas.DataFrame, roic_ignore: bool = False) -> pandas.DataFrame:
+    """Ordering of the full sorts previously done by sort_dataframe"""
+    tickers_df = tickers_df.sort_values('roic', ascending=False, kind='stable')
+    tickers_df['roic_index_number'] = 0 if roic_ignore else np.arange(len(tickers_df))
+    tickers_df = tickers_df.sort_values('earning_yield', ascending=False, kind='stable')
+    tickers_df['earning_yield_index'] = np.arange(len(tickers_df))
+    tickers_df['magic_index'] = \
+        tickers_df['earning_yield_index'] + tickers_df['roic_index_number']
+
+    return tickers_df.sort_values('magic_index', ascending=True, kind='stable')
+
+
+class TestRanking(unittest.TestCase):
+    def test_calculate_rank(self):
+        values = [3.0, 5.0, 3.0, np.nan, 1.0]
+        np.testing.assert_array_equal([1, 0, 2, 4, 3], ranking.calculate_rank(values))
+        np.testing.assert_array_equal([1, 0, 1, 4, 3], ranking.calculate_rank(values, 'min'))
+        np.testing.assert_array_equal([1, 0, 1, 3, 2],
+                                      ranking.calculate_rank(values, 'dense'))
+        with self.assertRaises(ValueError):
+            ranking.calculate_rank(values, 'average')
+
+    def test_calculate_rank_tiebreak(self):
+        values = [0.1, 0.1, 0.2, 0.1]
+        np.testing.assert_array_equal([1, 2, 0, 3], ranking.calculate_rank(values))
+        np.testing.assert_array_equal(
+            [3, 1, 0, 2], ranking.calculate_rank(values, tiebreak=[3, 0, 2, 1]))
+
+    def test_select_top(self):
+        magic_index = [4, 1, 3, 1, 0, 3]
+        earning_yield_rank = [0, 2, 1, 1, 3, 0]
+        np.testing.assert_array_equal([4, 3, 1, 5, 2, 0],
+                                      ranking.select_top(magic_index, earning_yield_rank))
+        np.testing.assert_array_equal([4, 3, 1, 5],
+                                      ranking.select_top(magic_index, earning_yield_rank, 4))
+        np.testing.assert_array_equal([], ranking.select_top([], [], 3))
+
+
+class TestSortDataframe(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+
+    def test_sort_dataframe_reference(self):
+        """Test if the ranks and the order are the ones of the full sorts"""
+        for roic_ignore in (False, True):
+            tickers_df = scenario_tickers()
+            expected = reference_sort(tickers_df.copy(), roic_ignore)
+            ranked = green.sort_dataframe(tickers_df.copy(), self.logger, roic_ignore)
+
+            pandas.testing.assert_frame_equal(expected, ranked)
+
+    def test_sort_dataframe_reference_ties(self):
+        """Test if the earning yield ties are ordered by roic as on the full sorts"""
+        tickers_df = pandas.DataFrame({'symbol': ['A', 'B', 'C', 'D'],
+                                       'roic': [1.0, 5.0, 3.0, 4.0],
+                                       'earning_yield': [0.1, 0.1, 0.2, 0.1]})
+        ranked = green.sort_dataframe(tickers_df, self.logger, False)
+        self.assertEqual(['B', 'C', 'D', 'A'], list(ranked['symbol']))
+
+        for roic_ignore in (False, True):
+            for top in (0, 15):
+                tickers_df = scenario_tied_tickers()
+                expected = reference_sort(tickers_df.copy(), roic_ignore)
+                ranked = green.sort_dataframe(tickers_df.copy(), self.logger, roic_ignore, top)
+
+                pandas.testing.assert_frame_equal(expected.head(top or None), ranked)
+
+    def test_sort_dataframe_keeps_input(self):
+        """Test if the rank columns are not written on the dataframe informed"""
+        tickers_df = scenario_tickers()
+        original = tickers_df.copy()
+        green.sort_dataframe(tickers_df, self.logger, False, 15)
+
+        pandas.testing.assert_frame_equal(original, tickers_df)
+
+    def test_sort_dataframe_top(self):
+        """Test if the top stocks are the head of the full ordering"""
+        tickers_df = scenario_tickers()
+        expected = reference_sort(tickers_df.copy())
+        for top in (1, 15, 150, 500, 1000):
+            ranked = green.sort_dataframe(tickers_df.copy(), self.logger, False, top)
+            pandas.testing.assert_frame_equal(expected.head(top), ranked)
+
+    def test_sort_dataframe_ties(self):
+        """Test if the tied stocks share the rank and are ordered by earning yield"""
+        tickers_df = pandas.DataFrame({'symbol': ['A', 'B', 'C', 'D'],
+                                       'roic': [10.0, 20.0, 20.0, 5.0],
+                                       'earning_yield': [0.3, 0.1, 0.2, 0.3]})
+        ranked = green.sort_dataframe(tickers_df, self.logger, False, 3, 'min')
+
+        self.assertEqual(['A', 'C', 'D'], list(ranked['symbol']))
+        self.assertEqual([2, 0, 3], list(ranked['roic_index_number']))
+        self.assertEqual([0, 2, 0], list(ranked['earning_yield_index']))
+        self.assertEqual([2, 2, 3], list(ranked['magic_index']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""Module to test the replay server standing in for status invest and yahoo"""
+import logging
+import os
+import sys
+import tempfile
+import unittest
+
+import requests
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from benchmarks.replay_server import ReplayData
+from benchmarks.replay_server import ReplayOptions
+from benchmarks.replay_server import ReplayServer
+from benchmarks.universe import build_universe
+from magic_formula.config import get_config
+from magic_formula.core import TickerBatchFetcher
+from magic_formula.core import get_required_modules
+from magic_formula.http_client import HttpClient
+from magic_formula.status_invest import get_ibrx_info
+from magic_formula.status_invest import get_ticker_roic_info
+
+
+class TestReplayServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.universe = build_universe(30)
+        cls.server = ReplayServer(ReplayData(cls.universe, index_size=10)).start()
+        cls.folder = tempfile.TemporaryDirectory()
+        config_file = os.path.join(cls.folder.name, 'replay.json')
+        cls.server.write_config(config_file)
+        cls.config = get_config(config_file)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        cls.folder.cleanup()
+
+    def test_index_page(self):
+        """Test if the index page lists the members drawn for the index"""
+        tickers = get_ibrx_info(self.config['IGNM_URL'], logging.getLogger(__name__),
+                                HttpClient())
+
+        self.assertEqual(10, len(tickers))
+        self.assertIn(tickers.pop(), self.universe.stock_tickers)
+
+    def test_screener(self):
+        """Test if the paginated screener returns the screener of the universe"""
+        screener = get_ticker_roic_info(self.config['STATUS_INVEST_URL'], HttpClient(),
+                                        cache_file=os.path.join(self.folder.name, 'screener'),
+                                        page_size=7)
+
+        self.assertTrue(screener.equals(self.universe.screener))
+
+    def test_quote_summary(self):
+        """Test if the yahoo requests of the fetcher are answered by the server"""
+        symbols = sorted(self.universe.tickers)[:4]
+        fetcher = TickerBatchFetcher(logging.getLogger(__name__), max_workers=2,
+                                     modules=get_required_modules(),
+                                     base_url=self.config['YAHOO_URL'])
+        tickers = fetcher.fetch(symbols)
+
+        for symbol in symbols:
+            self.assertEqual(self.universe.tickers[symbol].all_modules[symbol],
+                             tickers[symbol].all_modules[symbol])
+
+    def test_throttling_and_errors(self):
+        """Test if the requests above the rate limit receive 429 and the errors 500"""
+        server = ReplayServer(ReplayData(self.universe), ReplayOptions(rate_limit=1)).start()
+        try:
+            statuses = [requests.get(f'{server.url}/v1/test/getcrumb').status_code
+                        for _ in range(3)]
+        finally:
+            server.stop()
+        self.assertEqual([200, 429, 429], statuses)
+        self.assertEqual(2, server.counters['throttled'])
+
+        server = ReplayServer(ReplayData(self.universe), ReplayOptions(error_rate=1)).start()
+        try:
+            response = requests.get(f'{server.url}/v10/finance/quoteSummary/SY000003.SA')
+        finally:
+            server.stop()
+        self.assertEqual(500, response.status_code)
+        self.assertEqual('Internal Server Error',
+                         response.json()['quoteSummary']['error']['description'])
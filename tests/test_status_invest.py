@@ -1,8 +1,13 @@
 """Module to test methods from module status_invest"""
+import logging
 import os
 import sys
+import tempfile
 import unittest
 from unittest import mock
+from urllib.parse import parse_qsl, urlsplit
+
+import pandas
 
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../magic_formula')))
@@ -10,16 +15,39 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../test
 
 
 from magic_formula.config import get_config, set_logger
-from magic_formula.status_invest import get_ibrx_info, get_ticker_roic_info
+from magic_formula.http_client import HttpClient
+from magic_formula.status_invest import build_screener_frame, extract_tickers, get_ibrx_info, \
+    get_indexes_info, get_screener_records, get_ticker_roic_info, check_screener_cache_file, \
+    write_screener_cache_file
 from config_tests import STATUS_INVEST_URL_RETURN
 
 
+SCREENER_RECORDS = [
+    {'ticker': 'CPLE6', 'companyname': 'COPEL', 'price': 5.95, 'p_l': 3.9, 'dy': 16.27,
+     'p_vp': 0.85, 'p_ebit': 3.67, 'roic': 10.77, 'vpa': 7.03, 'lpa': 1.53,
+     'valormercado': 15926742825},
+    {'ticker': 'CAMB3', 'companyname': 'CAMBUCI', 'price': 5.51, 'p_l': 15.24,
+     'p_vp': 2.36, 'p_ebit': 20.78, 'roic': 1.58, 'vpa': 2.34, 'lpa': 0.36,
+     'valormercado': 232880590.8},
+]
+
+
 def mocked_requests_get(*args, **kwargs):
     class MockResponse:
         def __init__(self, status_code, file_content):
             self.status_code = status_code
             self.content = file_content
 
+        def raise_for_status(self):
+            pass
+
+        def iter_content(self, chunk_size=1):
+            for position in range(0, len(self.content), chunk_size):
+                yield self.content[position:position + chunk_size]
+
+        def close(self):
+            pass
+
     if 'advancedsearchresult' in args[0]:
         return MockResponse(200, STATUS_INVEST_URL_RETURN)
 
@@ -35,14 +63,185 @@ class TestStocksGreenblatMagicFormula(unittest.TestCase):
     def test_get_ibrx_info(self):
         config = get_config('tests/teste.json')
         test_logger = set_logger()
-        with mock.patch('requests.get', side_effect=mocked_requests_get):
+        with mock.patch('requests.Session.get', side_effect=mocked_requests_get):
             ticker_info = get_ibrx_info(config['BRX10_URL'], logger=test_logger)
             self.assertEqual({'B3SA3', 'PETR3'}, ticker_info)
 
+    def test_extract_tickers(self):
+        with open('tests/example_brx100.txt', 'rb') as file:
+            content = file.read()
+
+        for chunk_size in (1, 7, len(content)):
+            chunks = [content[position:position + chunk_size]
+                      for position in range(0, len(content), chunk_size)]
+            self.assertEqual(['PETR3', 'B3SA3'], list(extract_tickers(chunks)))
+
+        html = ('<span class="ticker big">WEGE3</span><span class="tickers">NO</span>'
+                '<span class="ticker">IT<span>UB</span>4</span><span>NO</span>').encode()
+        self.assertEqual(['WEGE3', 'ITUB4'], list(extract_tickers([html])))
+
+    def test_get_indexes_info(self):
+        test_logger = set_logger()
+        index_urls = {'BRX100': 'https://statusinvest.com.br/indices/indice-brasil-100',
+                      'SMALL': 'https://statusinvest.com.br/indices/indice-small-cap'}
+        with tempfile.TemporaryDirectory() as folder:
+            file_name = os.path.join(folder, 'index_members.json')
+            with mock.patch('requests.Session.get',
+                            side_effect=mocked_requests_get) as session_get:
+                indexes_info = get_indexes_info(index_urls, test_logger, file_name=file_name)
+                self.assertEqual(2, session_get.call_count)
+
+                cached_info = get_indexes_info(index_urls, test_logger, file_name=file_name)
+                self.assertEqual(2, session_get.call_count)
+
+                index_urls['SMALL'] = 'https://statusinvest.com.br/indices/ibovespa'
+                get_indexes_info(index_urls, test_logger, file_name=file_name)
+                self.assertEqual(3, session_get.call_count)
+
+                get_indexes_info(index_urls, test_logger, ttl_days=-1, file_name=file_name)
+                self.assertEqual(5, session_get.call_count)
+
+        self.assertEqual({'BRX100': {'B3SA3', 'PETR3'}, 'SMALL': {'B3SA3', 'PETR3'}},
+                         indexes_info)
+        self.assertEqual(indexes_info, cached_info)
+
+    def test_get_indexes_info_empty_not_cached(self):
+        class EmptyPage:
+            status_code = 200
+
+            def raise_for_status(self):
+                pass
+
+            def iter_content(self, chunk_size=1):
+                yield b'<html><body>captcha</body></html>'
+
+            def close(self):
+                pass
+
+        test_logger = logging.getLogger(__name__)
+        index_urls = {'IBOV': 'https://statusinvest.com.br/indices/ibovespa'}
+        with tempfile.TemporaryDirectory() as folder:
+            file_name = os.path.join(folder, 'index_members.json')
+            with mock.patch('requests.Session.get', return_value=EmptyPage()) as session_get, \
+                    mock.patch.object(test_logger, 'warning') as warning:
+                for _ in range(2):
+                    self.assertEqual({'IBOV': set()},
+                                     get_indexes_info(index_urls, test_logger,
+                                                      file_name=file_name))
+
+            self.assertEqual(2, session_get.call_count)
+            self.assertEqual(2, warning.call_count)
+
+    def test_build_screener_frame(self):
+        screener = build_screener_frame(SCREENER_RECORDS)
+
+        self.assertEqual(['CPLE6', 'CAMB3'], list(screener.index))
+        self.assertEqual([0, 1], list(screener['roic_index']))
+        self.assertEqual([16.27, 0.0], list(screener['dy']))
+        self.assertTrue(screener['ev_ebit'].isna().all())
+        self.assertEqual('float64', str(screener['valormercado'].dtype))
+        self.assertEqual({'roic_index': 1, 'roic': 1.58, 'vpa': 2.34, 'lpa': 0.36},
+                         {key: screener.loc['CAMB3', key]
+                          for key in ('roic_index', 'roic', 'vpa', 'lpa')})
+
+    def test_build_screener_frame_duplicates(self):
+        """Test if the duplicated tickers keep the last record and leave no gap on roic_index"""
+        records = [SCREENER_RECORDS[0], SCREENER_RECORDS[1],
+                   dict(SCREENER_RECORDS[0], roic=9.0), dict(SCREENER_RECORDS[1], ticker='TAEE11')]
+        screener = build_screener_frame(records)
+
+        self.assertEqual(['CAMB3', 'CPLE6', 'TAEE11'], list(screener.index))
+        self.assertEqual([0, 1, 2], list(screener['roic_index']))
+        self.assertEqual(9.0, screener.loc['CPLE6', 'roic'])
+
+    def test_get_ticker_roic_info_cache(self):
+        class JsonResponse:
+            status_code = 200
+
+            def raise_for_status(self):
+                pass
+
+            def json(self):
+                return {'list': SCREENER_RECORDS}
+
+        with tempfile.TemporaryDirectory() as folder:
+            cache_file = os.path.join(folder, 'screener')
+            with mock.patch('requests.Session.get', return_value=JsonResponse()) as session_get:
+                screener = get_ticker_roic_info('https://statusinvest.com.br/category',
+                                                cache_file=cache_file)
+                cached_screener = get_ticker_roic_info('https://statusinvest.com.br/category',
+                                                       cache_file=cache_file)
+
+            self.assertEqual(1, session_get.call_count)
+            self.assertEqual(1, len(os.listdir(folder)))
+
+        pandas.testing.assert_frame_equal(screener, cached_screener, check_index_type=False)
+
+    def test_get_ticker_roic_info_empty_not_cached(self):
+        class JsonResponse:
+            status_code = 200
+
+            def raise_for_status(self):
+                pass
+
+            def json(self):
+                return {'list': None}
+
+        with tempfile.TemporaryDirectory() as folder:
+            cache_file = os.path.join(folder, 'screener')
+            with mock.patch('requests.Session.get', return_value=JsonResponse()) as session_get:
+                for _ in range(2):
+                    self.assertEqual(0, len(get_ticker_roic_info(
+                        'https://statusinvest.com.br/category', cache_file=cache_file)))
+
+            self.assertEqual(2, session_get.call_count)
+            self.assertEqual([], os.listdir(folder))
+
+            write_screener_cache_file(build_screener_frame([]), cache_file)
+            self.assertIsNone(check_screener_cache_file(cache_file))
+
+    def test_screener_cache_without_parquet_engine(self):
+        screener = build_screener_frame(SCREENER_RECORDS)
+        with tempfile.TemporaryDirectory() as folder:
+            cache_file = os.path.join(folder, 'screener')
+            with mock.patch('pandas.DataFrame.to_parquet', side_effect=ImportError('pyarrow')):
+                write_screener_cache_file(screener, cache_file)
+
+            self.assertEqual(['screener.pkl'], os.listdir(folder))
+            pandas.testing.assert_frame_equal(screener, check_screener_cache_file(cache_file))
+
+    def test_get_screener_records(self):
+        records = [{'ticker': f'TICK{number}', 'roic': float(number)} for number in range(5)]
+
+        class PageResponse:
+            status_code = 200
+
+            def __init__(self, url, total):
+                query = dict(parse_qsl(urlsplit(url).query))
+                page, take = int(query['page']), int(query['take'])
+                self.content = {'list': records[page * take:(page + 1) * take]}
+                if total:
+                    self.content['totalResults'] = len(records)
+
+            def raise_for_status(self):
+                pass
+
+            def json(self):
+                return self.content
+
+        url = ('https://statusinvest.com.br/category/advancedsearchresultpaginated'
+               '?search=%7B%7D&page=0&take=621')
+        for total, expected_calls in ((True, 3), (False, 3)):
+            with mock.patch('requests.Session.get',
+                            side_effect=lambda page_url, **_: PageResponse(page_url, total)) \
+                    as session_get:
+                self.assertEqual(records, get_screener_records(url, HttpClient(), page_size=2))
+                self.assertEqual(expected_calls, session_get.call_count)
+
     def test_get_ticker_roic_info(self):
         config = get_config('tests/teste.json')
 
-        with mock.patch('requests.get', side_effect=mocked_requests_get):
+        with mock.patch('requests.Session.get', side_effect=mocked_requests_get):
             # teste = requests.get(config['STATUS_INVEST_URL']).content
             # assert 'a' == teste
             roic_info = get_ticker_roic_info(config['STATUS_INVEST_URL'])
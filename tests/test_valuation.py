@@ -0,0 +1,96 @@
+"""Module to test methods from module valuation"""
+import os
+import sys
+import unittest
+
+import numpy as np
+import pandas
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../magic_formula')))
+
+from magic_formula import valuation
+
+
+def scenario_fundamentals() -> pandas.DataFrame:
+    return pandas.DataFrame({
+        'symbol': ['WEGE3', 'ITUB4', 'OIBR3', 'MGLU3', 'PETR4'],
+        'market_cap': [100.0, 200.0, 50.0, 0.0, 300.0],
+        'total_debt': [10.0, 0.0, 80.0, 0.0, 100.0],
+        'total_cash': [30.0, 10.0, 20.0, 0.0, 40.0],
+        'ebit': [12.0, 30.0, -5.0, 10.0, {}],
+        'industry': ['Specialty Industrial Machinery', 'Banks—Regional',
+                     'Telecom Services', [], 'Oil & Gas Integrated'],
+    })
+
+
+class TestValuation(unittest.TestCase):
+    def test_calculate_liquid_debt(self):
+        liquid_debt = valuation.calculate_liquid_debt([10, 0, 80], [30, 10, 20])
+        np.testing.assert_array_equal([0, 0, 60], liquid_debt)
+
+    def test_calculate_tev(self):
+        tev = valuation.calculate_tev([100, 50], [10, 80], [30, 20])
+        np.testing.assert_array_equal([100, 110], tev)
+
+    def test_calculate_earning_yield(self):
+        earning_yield = valuation.calculate_earning_yield([12, 10], [100, 0])
+        self.assertEqual(0.12, earning_yield[0])
+        self.assertTrue(np.isnan(earning_yield[1]))
+
+    def test_valid_masks(self):
+        np.testing.assert_array_equal([True, False], valuation.valid_ebit([1, 0], 1))
+        np.testing.assert_array_equal([False, True],
+                                      valuation.valid_market_cap([10, 20], 15))
+        np.testing.assert_array_equal(
+            [False, False, True, True],
+            valuation.valid_industry(['Banks—Regional', 'Insurance—Diversified', 'Utilities', []]))
+
+    def test_evaluate_fundamentals(self):
+        evaluation = valuation.evaluate_fundamentals(scenario_fundamentals(), ebit_min=1,
+                                                     market_cap_min=60)
+
+        self.assertEqual([0.12, 0.15, -0.05], list(evaluation['earning_yield'][:3]))
+        self.assertTrue(np.isnan(evaluation['earning_yield'][3]))
+        self.assertEqual([True, False, True, True, True], list(evaluation['valid_industry']))
+        self.assertEqual([True, True, False, True, False], list(evaluation['valid_ebit']))
+        self.assertEqual([True, True, False, False, True], list(evaluation['valid_market_cap']))
+        self.assertEqual([True, True, False, False, False],
+                         list(evaluation['valid_earning_yield']))
+
+    def test_evaluate_fundamentals_matches_scalar(self):
+        """Test if the batch result is the same as the scalar calculation"""
+        fundamentals = scenario_fundamentals().iloc[:3]
+        evaluation = valuation.evaluate_fundamentals(fundamentals)
+        for _, row in fundamentals.iterrows():
+            tev = row['market_cap'] + max(row['total_debt'] - row['total_cash'], 0)
+            self.assertEqual(round(row['ebit'] / tev, 2),
+                             evaluation['earning_yield'][row.name])
+
+    def test_calculate_graham(self):
+        graham_vi = valuation.calculate_graham_vi([5, 0, 2, np.nan], [1, 1, -1, 1], 15, 1.5)
+
+        self.assertEqual([10.61, 0, 0, 0], list(graham_vi))
+        self.assertEqual([0.06, 0, 0],
+                         list(valuation.calculate_graham_upside([10, 0, 5], [10.61, 3, 0])))
+
+    def test_evaluate_screener(self):
+        screener = pandas.DataFrame({
+            'valormercado': [1000.0, 10.0, 5000.0],
+            'price': [10.0, 1.0, 0.0],
+            'p_ebit': [10.0, 1.0, -2.0],
+            'ev_ebit': [8.0, 0.0, -4.0],
+            'vpa': [5.0, 1.0, 1.0],
+            'lpa': [1.0, -1.0, 1.0],
+            'p_vp': [2.0, 1.0, 0.0],
+        }, index=['WEGE3', 'SMLL3', 'OIBR3'])
+        evaluation = valuation.evaluate_screener(screener, ebit_min=1, market_cap_min=100)
+
+        self.assertEqual([100.0, 10.0, -2500.0], list(evaluation['ebit']))
+        self.assertEqual(0.12, evaluation['earning_yield']['WEGE3'])
+        self.assertTrue(evaluation['earning_yield'][1:].isna().all())
+        self.assertEqual([100.0, 10.0, 0.0], list(evaluation['shares_outstanding']))
+        self.assertEqual([500.0, 10.0, 0.0], list(evaluation['patrimonio_liquido']))
+        self.assertEqual([10.61, 0, 4.74], list(evaluation['graham_vi']))
+        self.assertEqual([True, True, False], list(evaluation['valid_ebit']))
+        self.assertEqual([True, False, True], list(evaluation['valid_market_cap']))
+        self.assertEqual([True, False, False], list(evaluation['valid_earning_yield']))
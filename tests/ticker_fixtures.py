@@ -0,0 +1,36 @@
+"""Module with the loading of the recorded yahoo modules of WEGE3.SA, shared by the tests
+and the benchmarks"""
+import os
+import pickle
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from magic_formula.core import TickerMock
+
+
+FIXTURES_FOLDER = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_SYMBOL = 'WEGE3.SA'
+FIXTURE_MODULES = ('all_modules', 'asset_profile', 'financial_data', 'summary_detail',
+                   'recommendation_trend')
+
+
+def load_fixture_module(module: str):
+    """Returns one recorded module, as returned by the property of yahooquery.Ticker"""
+    with open(os.path.join(FIXTURES_FOLDER, f'ticker.{module}.pkl'), 'rb') as file:
+        return pickle.load(file)
+
+
+def load_fixture_ticker(ticker: TickerMock = None) -> TickerMock:
+    """Loads every recorded module into the ticker, a new TickerMock when not informed
+
+    :param ticker: Ticker that receives the modules, defaults to None
+    :type ticker: TickerMock, optional
+    :return: Ticker with the recorded modules
+    :rtype: TickerMock
+    """
+    ticker = TickerMock() if ticker is None else ticker
+    for module in FIXTURE_MODULES:
+        setattr(ticker, module, load_fixture_module(module))
+
+    return ticker